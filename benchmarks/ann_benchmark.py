@@ -0,0 +1,97 @@
+"""Benchmark IVF-flat approximate search against exact cosine search.
+
+Reports training time, then query latency and recall@k (the share of the
+exact top k the approximate search also returns) for several probe counts.
+
+Usage:
+    python benchmarks/ann_benchmark.py                      # synthetic clustered vectors
+    python benchmarks/ann_benchmark.py --cache PATH         # vectors of an embeddings cache
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from q_history_mcp.ann import IvfIndex, probe_count  # noqa: E402
+
+
+def synthetic_vectors(rng: np.random.Generator, rows: int, dimensions: int, topics: int,
+                      spread: float) -> np.ndarray:
+    """Unit vectors scattered around ``topics`` random directions, like passages on shared subjects.
+
+    ``spread`` is the noise relative to the topic direction; around 1.5
+    neighbours share about the cosine similarity of related passages.
+    """
+    centers = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    noise = rng.standard_normal((rows, dimensions)).astype(np.float32) * spread
+    vectors = centers[rng.integers(0, topics, rows)] + noise
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def cached_vectors(path: str) -> np.ndarray:
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        return np.stack([np.frombuffer(row[0], np.float32) for row in conn.execute("SELECT vector FROM embeddings")])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache", help="Read vectors from this index-*.embeddings-*.sqlite3 instead of generating them")
+    parser.add_argument("--rows", type=int, default=200_000, help="Number of synthetic vectors")
+    parser.add_argument("--dimensions", type=int, default=384, help="Dimensions of synthetic vectors")
+    parser.add_argument("--topics", type=int, default=2_000, help="Clusters in the synthetic vectors")
+    parser.add_argument("--spread", type=float, default=1.5, help="Noise around each synthetic topic")
+    parser.add_argument("--queries", type=int, default=200, help="Queries, drawn from the vectors plus noise")
+    parser.add_argument("-k", type=int, default=10, help="Neighbours per query for recall")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.cache:
+        vectors = cached_vectors(args.cache)
+    else:
+        vectors = synthetic_vectors(rng, args.rows, args.dimensions, args.topics, args.spread)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.02
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions")
+
+    start = time.perf_counter()
+    ivf = IvfIndex.train(vectors)
+    trained = time.perf_counter()
+    order, offsets = ivf.inverted_lists(ivf.assign(vectors))
+    assigned = time.perf_counter()
+    grouped = np.ascontiguousarray(vectors[order])
+    print(f"{ivf.nlist} lists: trained in {trained - start:.2f}s, assigned in {assigned - trained:.2f}s")
+
+    start = time.perf_counter()
+    exact = [set(np.argpartition(-(vectors @ query), args.k)[:args.k].tolist()) for query in queries]
+    exact_ms = (time.perf_counter() - start) * 1e3 / len(queries)
+    print(f"{'search':<14} {'ms/query':>10} {f'recall@{args.k}':>10} {'rows read':>10}")
+    print(f"{'exact':<14} {exact_ms:>10.2f} {1.0:>10.3f} {1.0:>10.3f}")
+
+    default = probe_count(ivf.nlist)
+    for nprobe in sorted({1, 4, default // 2, default, default * 2, default * 4}):
+        if not 0 < nprobe <= ivf.nlist:
+            continue
+        found, read = 0, 0
+        start = time.perf_counter()
+        for query, truth in zip(queries, exact):
+            rows, scores = ivf.scan(grouped, offsets, query, nprobe)
+            top = order[rows[np.argpartition(-scores, min(args.k, len(rows) - 1))[:args.k]]]
+            found += len(truth.intersection(top.tolist()))
+            read += len(rows)
+        elapsed_ms = (time.perf_counter() - start) * 1e3 / len(queries)
+        label = f"ivf nprobe={nprobe}" + ("*" if nprobe == default else "")
+        print(f"{label:<14} {elapsed_ms:>10.2f} {found / (args.k * len(queries)):>10.3f} "
+              f"{read / len(queries) / len(vectors):>10.3f}")
+    print("* default probe count")
+
+
+if __name__ == "__main__":
+    main()
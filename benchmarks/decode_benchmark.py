@@ -0,0 +1,114 @@
+"""Benchmark ConversationState decode throughput for each JSON backend.
+
+Usage:
+    python benchmarks/decode_benchmark.py                 # synthetic payloads
+    python benchmarks/decode_benchmark.py --db PATH       # rows from a real data.sqlite3
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import string
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from q_history_mcp.json_backend import available_backends, get_loads  # noqa: E402
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10)))
+                    for _ in range(count))
+
+
+def synthetic_conversation(rng: random.Random, turns: int) -> Dict[str, Any]:
+    """A ConversationState shaped like what Q CLI writes, including tool traffic."""
+    history = []
+    for turn in range(turns):
+        user = {
+            "additional_context": "",
+            "env_context": {"env_state": {"operating_system": "linux",
+                                          "current_working_directory": "/home/user/project"}},
+            "content": {"Prompt": {"prompt": _words(rng, rng.randint(5, 60))}},
+            "timestamp": "2025-06-01T12:00:00.000000Z",
+            "images": None,
+        }
+        tool_use_id = f"tooluse_{uuid.UUID(int=rng.getrandbits(128)).hex[:22]}"
+        history.append([user, {"ToolUse": {
+            "message_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "content": _words(rng, rng.randint(10, 40)),
+            "tool_uses": [{"id": tool_use_id, "name": "execute_bash", "orig_name": "execute_bash",
+                           "args": {"command": "grep -rn pattern src/"}, "orig_args": {}}],
+        }}])
+        output = "\n".join(_words(rng, 12) for _ in range(rng.randint(20, 400)))
+        history.append([{
+            "additional_context": "",
+            "env_context": {},
+            "content": {"ToolUseResults": {"tool_use_results": [
+                {"tool_use_id": tool_use_id, "content": [{"Text": output}], "status": "Success"}]}},
+            "timestamp": None,
+            "images": None,
+        }, {"Response": {
+            "message_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "content": "\n\n".join(_words(rng, 40) for _ in range(rng.randint(1, 12))),
+        }}])
+    tools = [{"ToolSpecification": {"name": f"tool_{i}", "description": _words(rng, 80),
+                                    "input_schema": {"json": {"type": "object", "properties": {}}}}}
+             for i in range(15)]
+    return {
+        "conversation_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "next_message": None,
+        "history": history,
+        "valid_history_range": [0, len(history)],
+        "transcript": [],
+        "tools": {"native___": tools},
+        "context_manager": None,
+        "latest_summary": None,
+        "model": "claude-sonnet-4",
+    }
+
+
+def load_payloads(args: argparse.Namespace) -> List[str]:
+    if args.db:
+        with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT value FROM conversations ORDER BY rowid DESC LIMIT ?", (args.conversations,))]
+    rng = random.Random(args.seed)
+    return [json.dumps(synthetic_conversation(rng, rng.randint(2, args.max_turns)))
+            for _ in range(args.conversations)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Read payloads from this Q CLI data.sqlite3 instead of generating them")
+    parser.add_argument("--conversations", type=int, default=50, help="Number of conversations to decode")
+    parser.add_argument("--max-turns", type=int, default=40, help="Maximum turns per synthetic conversation")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes per backend (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    payloads = load_payloads(args)
+    total_bytes = sum(len(p.encode("utf-8")) for p in payloads)
+    print(f"{len(payloads)} conversations, {total_bytes / 1e6:.1f} MB of JSON "
+          f"(mean {total_bytes / max(len(payloads), 1) / 1e3:.0f} KB)")
+    print(f"{'backend':<10} {'conv/s':>10} {'ms/conv':>10} {'MB/s':>10}")
+
+    for backend in available_backends():
+        loads = get_loads(backend)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for payload in payloads:
+                loads(payload)
+            best = min(best, time.perf_counter() - start)
+        print(f"{backend:<10} {len(payloads) / best:>10.1f} {best * 1e3 / len(payloads):>10.2f} "
+              f"{total_bytes / 1e6 / best:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
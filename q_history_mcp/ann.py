@@ -0,0 +1,108 @@
+"""Inverted-file (IVF-flat) approximate nearest-neighbour search over unit vectors.
+
+Vectors are clustered around ``nlist`` centroids by spherical k-means, and
+each vector is filed under its nearest centroid. A query scores the
+centroids, then scores exactly only the vectors filed under the ``nprobe``
+best ones, reading about ``nprobe / nlist`` of the rows. New vectors are
+filed under the existing centroids as they arrive; callers retrain once the
+collection outgrows what the centroids were trained on.
+"""
+
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+# k-means iterations when training centroids
+TRAIN_ITERATIONS = 10
+
+# Training sample size per list; more barely moves the centroids
+TRAIN_POINTS_PER_LIST = 64
+
+# Vectors assigned per matrix product, bounding the score matrix's memory
+ASSIGN_BATCH = 8192
+
+
+def list_count(rows: int) -> int:
+    """Lists to train for ``rows`` vectors: about 2 * sqrt(rows)."""
+    return int(min(max(2 * math.sqrt(rows), 16), 4096))
+
+
+def probe_count(nlist: int) -> int:
+    """Lists to probe per query: an eighth, about 0.95 recall@10 in benchmarks/ann_benchmark.py."""
+    return max(8, nlist // 8)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """``vectors`` scaled to unit length; zero rows stay zero."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid of every vector."""
+    labels = np.empty(len(vectors), np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        labels[start:start + ASSIGN_BATCH] = np.argmax(vectors[start:start + ASSIGN_BATCH] @ centroids.T, axis=1)
+    return labels
+
+
+class IvfIndex:
+    """Centroids of an IVF-flat index and the row count they were trained on."""
+
+    def __init__(self, centroids: np.ndarray, trained_rows: int):
+        self.centroids = np.ascontiguousarray(centroids, np.float32)
+        self.trained_rows = trained_rows
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: Optional[int] = None, seed: int = 0) -> "IvfIndex":
+        """Cluster unit ``vectors`` into ``nlist`` lists (by default :func:`list_count`)."""
+        nlist = min(nlist or list_count(len(vectors)), len(vectors))
+        rng = np.random.default_rng(seed)
+        size = min(len(vectors), nlist * TRAIN_POINTS_PER_LIST)
+        sample = np.ascontiguousarray(vectors[np.sort(rng.choice(len(vectors), size, replace=False))], np.float32)
+        centroids = sample[rng.choice(size, nlist, replace=False)]
+        for _ in range(TRAIN_ITERATIONS):
+            labels = _nearest(sample, centroids)
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            sums = np.empty_like(centroids)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums[filled] = np.add.reduceat(sample[order], starts[filled])
+            # Restart empty lists from random points
+            sums[~filled] = sample[rng.choice(size, int((~filled).sum()))]
+            centroids = normalize(sums)
+        return cls(centroids, len(vectors))
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """List of every vector: the index of its nearest centroid."""
+        return _nearest(vectors, self.centroids)
+
+    def inverted_lists(self, assignments: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows grouped by list: ``(order, offsets)``.
+
+        Stored in ``order``, the rows of list ``i`` are the contiguous
+        range ``offsets[i]:offsets[i + 1]``, which :meth:`scan` reads.
+        """
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=self.nlist))))
+        return order, offsets
+
+    def scan(self, vectors: np.ndarray, offsets: np.ndarray, query: np.ndarray,
+             nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and scores of the ``vectors`` in the ``nprobe`` lists nearest ``query``.
+
+        ``vectors`` must be stored grouped by list, as laid out by
+        :meth:`inverted_lists`; each list is then one contiguous slice.
+        """
+        nprobe = min(nprobe or probe_count(self.nlist), self.nlist)
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        ranges = [(offsets[list_], offsets[list_ + 1]) for list_ in probed.tolist()]
+        rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+        scores = np.concatenate([vectors[start:stop] @ query for start, stop in ranges])
+        return rows, scores
@@ -0,0 +1,120 @@
+"""Byte budgets for tool responses.
+
+Assistant responses and tool output can run to megabytes, more than a
+calling agent's context window holds. Responses are cut to a byte budget
+(about four bytes per token for English text) measured on their UTF-8 JSON
+encoding. Message bodies share the budget evenly, so short messages stay
+whole and only the longest are truncated; the rest of a truncated body can
+be fetched by byte range.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def encoded_size(value: Any) -> int:
+    """Size in bytes of ``value`` encoded as UTF-8 JSON."""
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _char_boundary(data: bytes, offset: int) -> int:
+    """``offset`` moved back to the start of the UTF-8 character it falls in."""
+    offset = max(0, min(offset, len(data)))
+    while 0 < offset < len(data) and data[offset] & 0xC0 == 0x80:
+        offset -= 1
+    return offset
+
+
+def byte_range(text: str, start: int = 0, end: Optional[int] = None) -> Tuple[str, int, int]:
+    """Bytes ``[start:end)`` of ``text``'s UTF-8 encoding as ``(text, start, end)``.
+
+    Both offsets move back to character boundaries, so the returned slice
+    decodes cleanly and ``end`` is where the next range should start. A
+    range narrower than the character at ``start`` still returns that
+    character, so reading range after range always makes progress.
+    """
+    data = text.encode("utf-8")
+    start = _char_boundary(data, start)
+    if end is None:
+        end = len(data)
+    elif end <= start:
+        end = start
+    else:
+        end = _char_boundary(data, end)
+        if end == start and start < len(data):
+            # Extend to the end of the character at start
+            end = start + 1
+            while end < len(data) and data[end] & 0xC0 == 0x80:
+                end += 1
+    return data[start:end].decode("utf-8"), start, end
+
+
+def body_cap(sizes: List[int], budget: int) -> Optional[int]:
+    """Largest per-body size at which bodies of ``sizes`` bytes fit in ``budget``.
+
+    Bodies smaller than the cap are kept whole and their unused share goes
+    to the larger ones. Returns None when everything fits.
+    """
+    remaining = max(budget, 0)
+    ordered = sorted(sizes)
+    for index, size in enumerate(ordered):
+        share = remaining // (len(ordered) - index)
+        if size > share:
+            return share
+        remaining -= size
+    return None
+
+
+def _escaped_size(text: str) -> int:
+    """Size in bytes of ``text`` inside a JSON string, escapes included."""
+    return encoded_size(text) - 2
+
+
+def _escaped_prefix(text: str, cap: int) -> str:
+    """Longest prefix of ``text`` whose escaped size is at most ``cap``."""
+    # Escapes only lengthen text, so the prefix lies within the first cap bytes
+    prefix = byte_range(text, 0, cap)[0] if cap > 0 else ''
+    low, high = 0, len(prefix)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _escaped_size(prefix[:middle]) <= cap:
+            low = middle
+        else:
+            high = middle - 1
+    return prefix[:low]
+
+
+def fit_messages(messages: List[Dict[str, Any]], response: Dict[str, Any], max_bytes: int) -> None:
+    """Truncate the ``body`` of ``messages``, which belong to ``response``, to fit ``max_bytes``.
+
+    Bodies are measured as escaped in the JSON response. Truncated messages
+    get ``truncated: True`` and ``body_bytes``, the size of the whole body
+    in UTF-8 as :func:`byte_range` counts it. Messages without a string
+    body are left as they are.
+    """
+    fitted = [message for message in messages
+              if isinstance(message, dict) and isinstance(message.get('body'), str)]
+    bodies = [message['body'] for message in fitted]
+    for message in fitted:
+        message['body'] = ''
+    sizes = [_escaped_size(body) for body in bodies]
+    # Truncation adds two fields to a message; reserve room for them
+    overhead = encoded_size(response) + len(fitted) * len(',"truncated":true,"body_bytes":0000000000')
+    cap = body_cap(sizes, max_bytes - overhead)
+    for message, body, size in zip(fitted, bodies, sizes):
+        if cap is None or size <= cap:
+            message['body'] = body
+        else:
+            message['body'] = _escaped_prefix(body, cap)
+            message['truncated'] = True
+            message['body_bytes'] = len(body.encode("utf-8"))
+
+
+def fit_results(results: List[Dict[str, Any]], max_bytes: int) -> int:
+    """How many of ``results``, taken in order, fit in ``max_bytes`` (at least one)."""
+    used = 0
+    for index, result in enumerate(results):
+        used += encoded_size(result) + 1
+        if used > max_bytes and index > 0:
+            return index
+    return len(results)
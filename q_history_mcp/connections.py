@@ -0,0 +1,58 @@
+"""SQLite connection reuse for the Q CLI history databases."""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Sequence
+
+# Read-side tuning: map the database into memory, keep a larger page cache
+# and never let these connections write.
+READ_PRAGMAS = (
+    "PRAGMA query_only = 1",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -16384",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class ThreadLocalConnections:
+    """Hands out one long-lived SQLite connection per thread.
+
+    Queries run on a small, fixed executor, so the number of connections is
+    bounded by its worker count (plus the event loop thread, if it queries).
+    """
+
+    def __init__(self, database: str, uri: bool = False, pragmas: Sequence[str] = ()):
+        """Remember how to open connections; nothing is opened until first use."""
+        self.database = database
+        self.uri = uri
+        self.pragmas = tuple(pragmas)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def get(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database, uri=self.uri, timeout=30, check_same_thread=False)
+            for pragma in self.pragmas:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Close every connection handed out so far."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+def read_only_connections(db_path: str) -> ThreadLocalConnections:
+    """Per-thread ``mode=ro`` connections with read-tuned pragmas."""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    return ThreadLocalConnections(uri, uri=True, pragmas=READ_PRAGMAS)
@@ -0,0 +1,45 @@
+"""Opaque keyset cursors for paging through listings and search results.
+
+A cursor records the sort key of the last row of a page, such as
+``["rowid", 812]`` or ``["rank", -3.2, 812]``, so the next page starts with
+a seek (``rowid < 812``) instead of skipping rows. Rows written by Q CLI
+after the first page get new, higher rowids, so pages never repeat or skip
+the rows that were already there.
+
+Each cursor is bound to a scope: the kind of query plus a fingerprint of
+its query text and filters. A cursor handed to a different query is
+rejected instead of silently returning the wrong page.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+from typing import Any, List
+
+
+def scope(kind: str, *parts: Any) -> str:
+    """Scope string for a query of ``kind`` with the given arguments."""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return f"{kind}:{digest}"
+
+
+def encode_cursor(cursor_scope: str, position: List[Any]) -> str:
+    """Opaque token for resuming after ``position`` within ``cursor_scope``."""
+    payload = json.dumps([cursor_scope, position], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, cursor_scope: str) -> List[Any]:
+    """The position stored in ``token``.
+
+    Raises ValueError if the token is malformed or belongs to another scope.
+    """
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        token_scope, position = json.loads(payload)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor") from None
+    if token_scope != cursor_scope or not isinstance(position, list) or not position:
+        raise ValueError("Cursor does not belong to this query; start again without a cursor")
+    return position
@@ -1,19 +1,340 @@
 """Database access for Q CLI conversation history."""
 
 import sqlite3
-import json
 import asyncio
+import datetime
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple, TypeVar
 import platform
 
+from q_history_mcp import json_backend
+from q_history_mcp.budget import fit_results
+from q_history_mcp.connections import read_only_connections
+from q_history_mcp.cursors import decode_cursor, encode_cursor, scope
+from q_history_mcp.filters import ConversationFilter
+from q_history_mcp.history_files import HistoryDirectory
+from q_history_mcp.index import HistoryIndex
+from q_history_mcp.models import (
+    CONVERSATION_ROLES, Message, full_path_from_key, parse_conversation, parse_conversation_value,
+    workspace_from_key,
+)
+from q_history_mcp.parallel import ScanPool, configured_processes
+from q_history_mcp.result_cache import ResultCache, configured_entries
+from q_history_mcp.streaming import summarize_conversation
+
+T = TypeVar("T")
+
+# Worker threads per database; each keeps its own read-only connection
+QUERY_WORKERS = 4
+
+# Listed when a conversation does not record its agent
+UNKNOWN_AGENT = 'Unknown (not stored in conversation data)'
+
+# Candidates each hybrid-search retriever returns, as a multiple of the limit
+HYBRID_DEPTH = 4
+
+# Reciprocal-rank fusion constant: a hit at rank r scores weight / (RRF_K + r)
+RRF_K = 60
+
+# Modes accepted by search_conversations
+SEARCH_MODES = ("text", "ranked", "fuzzy", "hybrid")
+
+# Seconds before the first retry of an index sync that failed, doubling per
+# failure up to INDEX_RETRY_MAX (e.g. another server holding the write lock)
+INDEX_RETRY_MIN = 5.0
+INDEX_RETRY_MAX = 300.0
+
+# Snippet prefix per message role
+_ROLE_LABELS = {'user': 'User', 'assistant': 'Assistant', 'tool': 'Tool'}
+
+
+def _preview(text: str) -> str:
+    """Truncate text for use as a conversation preview."""
+    return text[:100] + "..." if len(text) > 100 else text
+
+
+def _snippet(text: str) -> str:
+    """Truncate text for use as a search snippet."""
+    return text[:150] + "..." if len(text) > 150 else text
+
+
+def _iso_date(timestamp: float) -> str:
+    """ISO 8601 local time, with offset, of epoch seconds."""
+    return datetime.datetime.fromtimestamp(timestamp).astimezone().isoformat()
+
+
+# Listing fields computed inside SQLite with JSON1, so building a listing
+# never decodes whole ConversationState blobs in Python. Messages are counted
+# with the same rules as models.parse_conversation: non-empty prompts and
+# responses plus every ToolUse. The summary column is a small JSON array of
+# [message_count, first non-empty prompt in history order, earliest and
+# latest recorded time, user message count, tool result count].
+def _text_sql(value: str, path: str) -> str:
+    """SQL for the string at ``path`` of JSON ``value``, NULL for any other type."""
+    return f"CASE WHEN json_type({value}, '{path}') = 'text' THEN json_extract({value}, '{path}') END"
+
+
+def _prompt_sql(value: str, base: str) -> str:
+    """SQL for the prompt of the user message at ``base``."""
+    return (f"COALESCE(NULLIF({_text_sql(value, base + '.content.Prompt.prompt')}, ''), "
+            f"{_text_sql(value, base + '.content.CancelledToolUses.prompt')})")
+
+
+def _time_sql(value: str, path: str) -> str:
+    """SQL for the RFC 3339 string at ``path`` as epoch seconds (see models.parse_timestamp)."""
+    text = _text_sql(value, path)
+    # A date modifier normalizes impossible dates such as Feb 30 to March;
+    # reject those as Python does
+    return (f"CASE WHEN {text} GLOB '[0-9][0-9][0-9][0-9]-*'"
+            f" AND date(substr({text}, 1, 10), '+0 days') = substr({text}, 1, 10)"
+            f" THEN round((julianday({text}) - 2440587.5) * 86400.0, 3) END")
+
+
+def _epoch_ms_sql(value: str, path: str) -> str:
+    """SQL for the epoch milliseconds at ``path`` as epoch seconds (see models.parse_epoch_ms)."""
+    return (f"CASE WHEN json_type({value}, '{path}') IN ('integer', 'real') AND json_extract({value}, '{path}') > 0"
+            f" THEN round(json_extract({value}, '{path}') / 1000.0, 3) END")
+
+
+def _nullsafe_sql(function: str, terms: List[str]) -> str:
+    """Scalar ``min``/``max`` of ``terms`` that ignores NULL terms.
+
+    SQLite's multi-argument min()/max() are NULL if any argument is, so each
+    argument falls back to the other terms.
+    """
+    rotations = ["COALESCE(" + ", ".join(terms[i:] + terms[:i]) + ")" for i in range(len(terms))]
+    return f"{function}({', '.join(rotations)})"
+
+
+def _truthy_sql(value: str, path: str) -> str:
+    """SQL for the Python truthiness (0/1) of the JSON at ``path``."""
+    extract = f"json_extract({value}, '{path}')"
+    return (f"(CASE json_type({value}, '{path}')"
+            f" WHEN 'object' THEN {extract} != '{{}}' WHEN 'array' THEN {extract} != '[]'"
+            f" WHEN 'text' THEN {extract} != '' WHEN 'integer' THEN {extract} != 0"
+            f" WHEN 'real' THEN {extract} != 0 WHEN 'true' THEN 1 ELSE 0 END)")
+
+
+def _nonempty_array_sql(value: str, path: str) -> str:
+    return f"(json_type({value}, '{path}') IS 'array' AND json_extract({value}, '{path}') != '[]')"
+
+
+def _user_count_sql(value: str, base: str) -> str:
+    return f"(COALESCE({_prompt_sql(value, base)}, '') != '')"
+
+
+def _tool_count_sql(value: str, base: str) -> str:
+    """SQL for whether the user message at ``base`` carries tool results."""
+    results, cancelled = base + '.content.ToolUseResults', base + '.content.CancelledToolUses'
+    return (f"(CASE WHEN {_truthy_sql(value, results)}"
+            f" THEN {_nonempty_array_sql(value, results + '.tool_use_results')}"
+            f" ELSE {_nonempty_array_sql(value, cancelled + '.tool_use_results')} END)")
+
+
+def _assistant_count_sql(value: str, base: str) -> str:
+    return (f"(CASE WHEN json_type({value}, '{base}.Response') IS NOT NULL"
+            f" THEN COALESCE({_text_sql(value, base + '.Response.content')}, '') != ''"
+            f" ELSE json_type({value}, '{base}.ToolUse') IS 'object' END)")
+
+
+# Times recorded on an old-format history entry
+_OLD_ENTRY_TIMES = [
+    _time_sql('h.value', '$.user.timestamp'),
+    _epoch_ms_sql('h.value', '$.request_metadata.request_start_timestamp_ms'),
+    _epoch_ms_sql('h.value', '$.request_metadata.stream_end_timestamp_ms'),
+]
+_LISTING_SELECT = """
+SELECT c.rowid AS rowid, c.key AS key, json_extract(c.value, '$.conversation_id') AS conversation_id,
+       {agent} AS agent,
+       (SELECT json_array(
+                   COALESCE(SUM(e.message_count), 0),
+                   substr(MIN(CASE WHEN e.prompt != '' THEN printf('%012d', e.entry) || e.prompt END), 13),
+                   MIN(e.created_at),
+                   MAX(e.updated_at),
+                   COALESCE(SUM(e.user_count), 0),
+                   COALESCE(SUM(e.tool_count), 0))
+        FROM (
+            SELECT h.id AS entry,
+                   CASE
+                       WHEN h.type = 'object' AND json_type(h.value, '$.user') IS NOT NULL
+                           THEN {old_user_count} + {old_assistant_count}
+                       WHEN h.type = 'array' THEN (
+                           SELECT COALESCE(SUM(CASE WHEN json_type(m.value, '$.content') IS NOT NULL
+                                                    THEN {new_user_count} ELSE {new_assistant_count} END), 0)
+                           FROM json_each(h.value) m
+                           WHERE m.type = 'object')
+                       ELSE 0
+                   END AS message_count,
+                   CASE
+                       WHEN h.type = 'object' AND json_type(h.value, '$.user') IS NOT NULL
+                           THEN {old_user_count}
+                       WHEN h.type = 'array' THEN (
+                           SELECT SUM({new_user_count}) FROM json_each(h.value) m
+                           WHERE m.type = 'object' AND json_type(m.value, '$.content') IS NOT NULL)
+                   END AS user_count,
+                   CASE
+                       WHEN h.type = 'object' AND json_type(h.value, '$.user') IS NOT NULL
+                           THEN {old_tool_count}
+                       WHEN h.type = 'array' THEN (
+                           SELECT SUM({new_tool_count}) FROM json_each(h.value) m
+                           WHERE m.type = 'object' AND json_type(m.value, '$.content') IS NOT NULL)
+                   END AS tool_count,
+                   CASE h.type
+                       WHEN 'object' THEN {old_prompt}
+                       WHEN 'array' THEN (
+                           SELECT {new_prompt} FROM json_each(h.value) m
+                           WHERE m.type = 'object' AND {new_prompt} != ''
+                           ORDER BY m.id LIMIT 1)
+                   END AS prompt,
+                   CASE
+                       WHEN h.type = 'object' AND json_type(h.value, '$.user') IS NOT NULL
+                           THEN {old_created}
+                       WHEN h.type = 'array' THEN (
+                           SELECT MIN({new_time}) FROM json_each(h.value) m
+                           WHERE m.type = 'object' AND json_type(m.value, '$.content') IS NOT NULL)
+                   END AS created_at,
+                   CASE
+                       WHEN h.type = 'object' AND json_type(h.value, '$.user') IS NOT NULL
+                           THEN {old_updated}
+                       WHEN h.type = 'array' THEN (
+                           SELECT MAX({new_time}) FROM json_each(h.value) m
+                           WHERE m.type = 'object' AND json_type(m.value, '$.content') IS NOT NULL)
+                   END AS updated_at
+            FROM json_each(c.value, '$.history') h
+        ) e) AS summary
+FROM conversations c
+WHERE json_valid(c.value)
+""".format(
+    agent=_text_sql('c.value', '$.context_manager.current_profile'),
+    old_user_count=_user_count_sql('h.value', '$.user'),
+    old_tool_count=_tool_count_sql('h.value', '$.user'),
+    new_tool_count=_tool_count_sql('m.value', '$'),
+    old_assistant_count=_assistant_count_sql('h.value', '$.assistant'),
+    old_prompt=_prompt_sql('h.value', '$.user'),
+    new_user_count=_user_count_sql('m.value', '$'),
+    new_assistant_count=_assistant_count_sql('m.value', '$'),
+    new_prompt=_prompt_sql('m.value', '$'),
+    old_created=_nullsafe_sql('min', _OLD_ENTRY_TIMES),
+    old_updated=_nullsafe_sql('max', _OLD_ENTRY_TIMES),
+    new_time=_time_sql('m.value', '$.timestamp'),
+)
+_LISTING_SQL = _LISTING_SELECT + "ORDER BY c.rowid DESC\n"
+
+
+def _listing_filter_columns(now: float) -> Dict[str, str]:
+    """ConversationFilter columns of the rows of _LISTING_SELECT.
+
+    Conversations that record no time count as updated ``now``, which is
+    when an unindexed listing first sees them.
+    """
+    count = "json_extract(summary, '$[0]')"
+    user_count = "json_extract(summary, '$[4]')"
+    return {
+        'updated_at': f"COALESCE(json_extract(summary, '$[3]'), {now!r})",
+        'full_path': "CASE WHEN instr(key, '|') > 0 THEN substr(key, 1, instr(key, '|') - 1) ELSE key END",
+        'message_count': count,
+        'user': user_count,
+        'assistant': f"({count} - {user_count})",
+        'tool': "json_extract(summary, '$[5]')",
+    }
+
+
+def _cursor_position(cursor: Optional[str], cursor_scope: str) -> Tuple[Optional[str], List[Any]]:
+    """``(kind, position)`` of a cursor token, or ``(None, [])`` without one.
+    
+    Raises ValueError if the token belongs to another query or its position
+    is not one this module writes.
+    """
+    if not cursor:
+        return None, []
+    kind, *position = decode_cursor(cursor, cursor_scope)
+    valid = {
+        'rowid': lambda rowid: isinstance(rowid, int),
+        'rank': lambda rank, rowid: isinstance(rank, (int, float)) and isinstance(rowid, int),
+        'file': lambda mtime, conv_id: isinstance(mtime, (int, float)) and isinstance(conv_id, str),
+    }
+    try:
+        if valid[kind](*position):
+            return kind, position
+    except (KeyError, TypeError):
+        pass
+    raise ValueError("Invalid cursor")
+
+
+def _page(name: str, items: List[Dict[str, Any]], last: Optional[List[Any]], limit: int,
+          cursor_scope: str) -> Dict[str, Any]:
+    """A page of ``items``, with a cursor after ``last`` when the page is full."""
+    full = last is not None and len(items) >= limit
+    return {name: items, 'next_cursor': encode_cursor(cursor_scope, last) if full else None}
+
+
+def _message_window(offset: int, limit: Optional[int], from_end: bool) -> slice:
+    """Slice of a conversation's messages selected by ``offset``/``limit``/``from_end``."""
+    if offset < 0 or (limit is not None and limit < 1):
+        raise ValueError("offset must not be negative and limit must be positive")
+    if not from_end:
+        return slice(offset, None if limit is None else offset + limit)
+    return slice(None if limit is None else -(offset + limit), -offset if offset else None)
+
+
+def _results_page(results: List[Dict[str, Any]], positions: List[List[Any]], limit: int,
+                  cursor_scope: str, max_bytes: Optional[int]) -> Dict[str, Any]:
+    """A page of search ``results`` at cursor ``positions``, cut to ``max_bytes``."""
+    kept = fit_results(results, max_bytes) if max_bytes else len(results)
+    last = positions[kept - 1] if kept else None
+    if kept < len(results):
+        return {'results': results[:kept], 'next_cursor': encode_cursor(cursor_scope, last)}
+    return _page('results', results, last, limit, cursor_scope)
+
+
+def _numbered(message: Message) -> Dict[str, Any]:
+    """A parsed message in the detail tools' shape, with its ``seq``."""
+    result = message.to_dict()
+    result['seq'] = message.seq
+    return result
+
+
+def _check_limit(limit: int) -> None:
+    """Raise ValueError unless ``limit`` asks for at least one row."""
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+
+
+def _is_busy(error: Exception) -> bool:
+    """Whether ``error`` is SQLite giving up on a lock another connection holds."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _has_json1(conn: sqlite3.Connection) -> bool:
+    """Whether this SQLite build has the JSON1 functions."""
+    try:
+        conn.execute("SELECT json_valid('{}')")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
 
 class QCliDatabase:
     """Read-only access to Q CLI conversation database and history files."""
     
-    def __init__(self, db_path: Optional[str] = None, history_dir: Optional[str] = None):
-        """Initialize database connection."""
+    def __init__(self, db_path: Optional[str] = None, history_dir: Optional[str] = None,
+                 index_path: Optional[str] = None, scan_processes: Optional[int] = None,
+                 result_cache_entries: Optional[int] = None):
+        """Initialize database connection.
+        
+        ``scan_processes`` > 1 parses full-history scans (index builds and
+        unindexed searches) in that many worker processes; by default it
+        comes from ``Q_HISTORY_SCAN_PROCESSES``. ``result_cache_entries``
+        sizes the cache of listing and search results, which are kept until
+        the history changes (0 disables it); by default it comes from
+        ``Q_HISTORY_RESULT_CACHE``.
+        """
         if db_path is None or history_dir is None:
             # Auto-detect Q CLI paths based on platform
             home = Path.home()
@@ -41,274 +362,475 @@ class QCliDatabase:
         
         self.db_path = db_path
         self.history_dir = Path(history_dir)
+        self.index_path = index_path
+        self._index = None
+        self._index_failed = False
+        self._index_lock = threading.Lock()
+        self._index_retry_at = 0.0
+        self._index_backoff = INDEX_RETRY_MIN
+        self._vectors = None
+        self._embeddings = None
+        self._embeddings_loaded = False
+        self._read_connections = read_only_connections(db_path)
+        # When this process first saw each source rowid, for conversations
+        # that record no times and cannot be served from the index
+        self._first_seen: Dict[int, float] = {}
+        self._history_files = HistoryDirectory(self.history_dir)
+        if scan_processes is None:
+            scan_processes = configured_processes()
+        self._scan_pool = ScanPool(db_path, scan_processes) if scan_processes > 1 else None
+        if result_cache_entries is None:
+            result_cache_entries = configured_entries()
+        self._results = (ResultCache(db_path, self.history_dir, result_cache_entries)
+                         if result_cache_entries > 0 else None)
+        self._executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="q-history")
+    
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's read-only connection to the Q CLI database."""
+        return self._read_connections.get()
     
-    async def list_conversations(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """List recent conversations with metadata."""
+    async def _cached(self, key: Tuple[Any, ...], func: Callable[[], T]) -> T:
+        """Run ``func`` like :meth:`_run`, unless its result for ``key`` is cached and the history unchanged.
+        
+        The lookup reads SQLite and copies results, so it runs on the worker
+        threads too.
+        """
+        if self._results is None:
+            return await self._run(func)
+        results = self._results
+        
+        def _query():
+            fingerprint, result = results.lookup(key)
+            if result is None:
+                result = func()
+                results.store(key, result, fingerprint)
+            return result
+        
+        return await self._run(_query)
+    
+    async def _run(self, func: Callable[[], T]) -> T:
+        """Run a blocking query on this database's worker threads."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func)
+    
+    def close(self) -> None:
+        """Shut down worker threads and close all connections."""
+        self._executor.shutdown(wait=True)
+        self._read_connections.close()
+        self._history_files.close()
+        if self._scan_pool is not None:
+            self._scan_pool.close()
+        if self._embeddings is not None:
+            self._embeddings.close()
+        if self._results is not None:
+            self._results.close()
+        if self._index is not None:
+            self._index.close()
+    
+    def _iter_conversation_rows(self, conn: sqlite3.Connection, newest_first: bool = True,
+                                before: Optional[int] = None) -> Iterator[Tuple[int, str, str]]:
+        """Stream ``(rowid, key, value)`` rows from the conversations table, below rowid ``before``.
+        
+        Rows are pulled from SQLite one at a time, so only the current JSON
+        blob is held in memory and stopping early ends the scan.
+        """
+        order = "DESC" if newest_first else "ASC"
+        where, params = ("WHERE rowid < ?", (before,)) if before is not None else ("", ())
+        cursor = conn.execute(f"SELECT rowid, key, value FROM conversations {where} ORDER BY rowid {order}", params)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+    
+    def _times(self, rowid: int, created_at: Optional[float],
+               updated_at: Optional[float]) -> Tuple[float, float]:
+        """``(created_at, updated_at)``, using the first-seen time for rows that record none."""
+        if created_at is None:
+            created_at = updated_at = self._first_seen.setdefault(rowid, time.time())
+        return created_at, updated_at
+    
+    def _iter_listing_rows(self, conn: sqlite3.Connection, filters: Optional[ConversationFilter] = None,
+                           before: Optional[int] = None
+                           ) -> Iterator[Tuple[int, str, Optional[str], int, Optional[str], Optional[str],
+                                               float, float]]:
+        """Stream ``(rowid, key, conversation_id, message_count, first_prompt, agent, created_at, updated_at)``.
+        
+        Rows come newest first, starting below rowid ``before`` and limited
+        to those passing ``filters``. SQLite computes the fields and applies
+        the filter with JSON1 when it can; otherwise each value goes through
+        the streaming summarizer. Neither decodes whole conversations into
+        Python objects.
+        """
+        filters = filters or ConversationFilter()
+        if _has_json1(conn):
+            listing, params = _LISTING_SELECT, []
+            if before is not None:
+                listing += "AND c.rowid < ?\n"
+                params.append(before)
+            listing += "ORDER BY c.rowid DESC\n"
+            if not filters.is_empty:
+                where, filter_params = filters.sql(_listing_filter_columns(time.time()))
+                # LIMIT -1 stops SQLite from flattening the subquery, which
+                # would recompute the summary for every use in the filter
+                listing = (f"SELECT rowid, key, conversation_id, agent, summary FROM ({listing}LIMIT -1) "
+                           f"WHERE {where} ORDER BY rowid DESC")
+                params += filter_params
+            cursor = conn.execute(listing, params)
+            for rowid, key, conv_id, agent, summary in cursor:
+                message_count, first_prompt, created_at, updated_at = json_backend.loads(summary)[:4]
+                yield (rowid, key, conv_id, message_count, first_prompt, agent or None,
+                       *self._times(rowid, created_at, updated_at))
+            return
+        
+        for rowid, key, value in self._iter_conversation_rows(conn, before=before):
+            try:
+                summary = summarize_conversation(value)
+            except (ValueError, TypeError):
+                continue
+            created_at, updated_at = self._times(rowid, summary.created_at, summary.updated_at)
+            if filters.matches(updated_at, full_path_from_key(key), summary.message_count, summary.role_counts):
+                yield (rowid, key, summary.conversation_id, summary.message_count, summary.first_prompt,
+                       summary.agent, created_at, updated_at)
+    
+    def _get_index(self) -> Optional[HistoryIndex]:
+        """Return the synced sidecar index, or None if it cannot be used.
+        
+        An index that cannot be opened is given up for good. A failed sync,
+        such as a lock held past the timeout by another server building the
+        same index, only skips the index until a retry that backs off from
+        INDEX_RETRY_MIN to INDEX_RETRY_MAX seconds.
+        """
+        if self._index_failed or time.monotonic() < self._index_retry_at:
+            return None
+        try:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = HistoryIndex(self.db_path, self.index_path, self._read_connections,
+                                               self._scan_pool)
+        except (sqlite3.Error, OSError) as e:
+            if not _is_busy(e):
+                # Unwritable cache dir or unexpected source schema: use direct scans
+                print(f"Sidecar index unavailable, scanning the database directly: {e}", file=sys.stderr)
+                self._index_failed = True
+                return None
+            self._defer_index(e)
+            return None
+        try:
+            self._index.sync()
+        except (sqlite3.Error, OSError) as e:
+            self._defer_index(e)
+            return None
+        with self._index_lock:
+            self._index_backoff = INDEX_RETRY_MIN
+        return self._index
+    
+    def _defer_index(self, error: Exception) -> None:
+        """Skip the index after a transient failure until the next retry is due."""
+        with self._index_lock:
+            delay = self._index_backoff
+            self._index_retry_at = time.monotonic() + delay
+            self._index_backoff = min(delay * 2, INDEX_RETRY_MAX)
+        print(f"Sidecar index sync failed, scanning the database directly for {delay:.0f}s: {error}",
+              file=sys.stderr)
+    
+    def _get_vectors(self, index: HistoryIndex):
+        """The TF-IDF vector index over the synced sidecar ``index``, created on first use.
+        
+        Raises RuntimeError if numpy is not installed.
+        """
+        with self._index_lock:
+            if self._vectors is None:
+                try:
+                    from q_history_mcp.vectors import VectorIndex
+                except ImportError:
+                    raise RuntimeError("semantic_search requires numpy; reinstall with "
+                                       "pipx install '.[semantic]'") from None
+                self._vectors = VectorIndex(index)
+            return self._vectors
+    
+    def _get_embeddings(self, index: HistoryIndex):
+        """The background-encoded embedding index over ``index``, or None when no backend is configured."""
+        with self._index_lock:
+            if not self._embeddings_loaded:
+                try:
+                    from q_history_mcp.embeddings import EmbeddingIndex, configured_backend
+                except ImportError:
+                    # No numpy: semantic_search reports it
+                    return None
+                backend = configured_backend()
+                if backend is not None:
+                    self._embeddings = EmbeddingIndex(index, backend)
+                self._embeddings_loaded = True
+            return self._embeddings
+    
+    def _listing_entry(self, rowid: int, key: str, conv_id: Optional[str], message_count: int,
+                       first_prompt: Optional[str], agent: Optional[str], created_at: Optional[float],
+                       updated_at: Optional[float]) -> Dict[str, Any]:
+        """Format one conversation of a listing."""
+        created_at, updated_at = self._times(rowid, created_at, updated_at)
+        return {
+            'id': conv_id or key.split('/')[-1],
+            'message_count': message_count,
+            'preview': _preview(first_prompt) if first_prompt else "No preview available",
+            'created_date': _iso_date(created_at),
+            'updated_date': _iso_date(updated_at),
+            'workspace': workspace_from_key(key),
+            'full_path': full_path_from_key(key),
+            'agent': agent or UNKNOWN_AGENT
+        }
+    
+    def _text_search_result(self, hit: Dict[str, Any]) -> Dict[str, Any]:
+        """Format one text-search hit (``matches`` are ``(role, body)`` pairs)."""
+        created_at, updated_at = self._times(hit['rowid'], hit['created_at'], hit['updated_at'])
+        matching_snippets = [
+            f"{_ROLE_LABELS[role]}: {_snippet(body)}"
+            for role, body in hit['matches']
+        ]
+        return {
+            'id': hit['conversation_id'],
+            'workspace': workspace_from_key(hit['key']),
+            'created_date': _iso_date(created_at),
+            'updated_date': _iso_date(updated_at),
+            'message_count': hit['message_count'],
+            'preview': _preview(hit['first_prompt']) if hit['first_prompt'] else "No preview available",
+            'matching_snippets': matching_snippets[:3],  # Include up to 3 matching snippets
+            'match_count': len(matching_snippets)
+        }
+    
+    def _ranked_search_result(self, hit: Dict[str, Any]) -> Dict[str, Any]:
+        """Format one BM25-ranked hit from the sidecar index."""
+        return {
+            'id': hit['conversation_id'],
+            'workspace': workspace_from_key(hit['key']),
+            'created_date': _iso_date(hit['created_at']),
+            'updated_date': _iso_date(hit['updated_at']),
+            'message_count': hit['message_count'],
+            'preview': _preview(hit['first_prompt']) if hit['first_prompt'] else "No preview available",
+            'matching_snippets': [
+                f"{_ROLE_LABELS[match['role']]}: {match['snippet']}"
+                for match in hit['matches']
+            ],
+            'match_count': hit['match_count'],
+            'score': round(hit['score'], 4),
+            'highlights': [
+                {'seq': match['seq'], 'role': match['role'], 'offsets': match['offsets']}
+                for match in hit['matches']
+            ]
+        }
+    
+    def _conversation_from_index(self, index: HistoryIndex, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a conversation through the index's conversation_id lookup."""
+        found = index.lookup(conversation_id)
+        if found is None:
+            return None
+        
+        messages = [message.to_dict() for message in index.messages(found['rowid'])]
+        row = self.connection().execute(
+            "SELECT value FROM conversations WHERE rowid = ?", (found['rowid'],)).fetchone()
+        return {
+            'conversation_id': conversation_id,
+            'messages': messages,
+            'raw_data': json_backend.loads(row[0]) if row else None
+        }
+    
+    def find_conversation_value(self, conn: sqlite3.Connection, conversation_id: str) -> Optional[Tuple[str]]:
+        """Find a conversation's raw ``value`` by exact conversation_id without the index."""
+        found = self._find_conversation_row(conn, conversation_id)
+        return (found[2],) if found else None
+    
+    def _find_conversation_row(self, conn: sqlite3.Connection,
+                               conversation_id: str) -> Optional[Tuple[int, str, str]]:
+        """Find a conversation's ``(rowid, key, value)`` by exact conversation_id.
+        
+        The id is compared against the ``conversation_id`` field extracted by
+        SQLite's JSON1 functions, so ids mentioned inside other conversations'
+        text never match. Conversations without that field are known by the
+        last segment of their key.
+        """
+        stored_id = "CASE WHEN json_valid(value) THEN json_extract(value, '$.conversation_id') END"
+        result = conn.execute(
+            f"SELECT rowid, key, value FROM conversations WHERE {stored_id} = ? ORDER BY rowid DESC LIMIT 1",
+            (conversation_id,)).fetchone()
+        if result:
+            return result
+        
+        for rowid, key in conn.execute(
+                "SELECT rowid, key FROM conversations "
+                "WHERE json_valid(value) AND json_type(value, '$.conversation_id') IS NULL "
+                "ORDER BY rowid DESC").fetchall():
+            if key.split('/')[-1] == conversation_id:
+                return conn.execute("SELECT rowid, key, value FROM conversations WHERE rowid = ?",
+                                    (rowid,)).fetchone()
+        return None
+    
+    async def list_conversations(self, limit: int = 50,
+                                 filters: Optional[ConversationFilter] = None) -> List[Dict[str, Any]]:
+        """List recent conversations with metadata, limited to those passing ``filters``."""
+        return (await self.list_conversations_page(limit, filters))['conversations']
+    
+    async def list_conversations_page(self, limit: int = 50, filters: Optional[ConversationFilter] = None,
+                                      cursor: Optional[str] = None) -> Dict[str, Any]:
+        """One page of :meth:`list_conversations`.
+        
+        Returns ``{'conversations': [...], 'next_cursor': token or None}``;
+        passing ``next_cursor`` back with the same filters returns the next
+        page. Raises ValueError for a limit below one or a cursor from
+        another query.
+        """
+        _check_limit(limit)
+        filters = filters or ConversationFilter()
+        cursor_scope = scope('list', filters.key())
+        kind, position = _cursor_position(cursor, cursor_scope)
+        before = position[0] if kind == 'rowid' else None
+        
         def _query():
             results = []
+            last = None
             
-            # Read from SQLite database (main storage)
-            try:
-                import sqlite3
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    
-                    # Get rowid range to establish relative timestamps
-                    cursor.execute("SELECT MIN(rowid), MAX(rowid) FROM conversations")
-                    min_rowid, max_rowid = cursor.fetchone()
-                    
-                    cursor.execute("SELECT rowid, key, value FROM conversations ORDER BY rowid DESC")
-                    
-                    for rowid, key, value in cursor.fetchall():
-                        try:
-                            conv_data = json.loads(value)
-                            conv_id = conv_data.get('conversation_id', key.split('/')[-1])
-                            
-                            # Convert rowid to realistic timestamp (higher rowid = more recent)
-                            import datetime
-                            if max_rowid > min_rowid:
-                                # Spread conversations over last 90 days, with newest having highest rowid
-                                days_ago = 90 * (max_rowid - rowid) / (max_rowid - min_rowid)
-                            else:
-                                days_ago = 0
-                            estimated_timestamp = datetime.datetime.now() - datetime.timedelta(days=days_ago)
-                            
-                            # Count messages in history
-                            message_count = 0
-                            preview = "No preview available"
-                            agent_info = None
-                            
-                            if 'history' in conv_data and conv_data['history']:
-                                for history_entry in conv_data['history']:
-                                    if isinstance(history_entry, list):
-                                        # New format: list of messages
-                                        for msg in history_entry:
-                                            if isinstance(msg, dict):
-                                                if ('content' in msg and 'Prompt' in msg.get('content', {})) or 'ToolUse' in msg:
-                                                    message_count += 1
-                                        
-                                        # Get preview from first user prompt
-                                        if preview == "No preview available":
-                                            for msg in history_entry:
-                                                if isinstance(msg, dict) and 'content' in msg:
-                                                    if 'Prompt' in msg['content'] and 'prompt' in msg['content']['Prompt']:
-                                                        prompt_text = msg['content']['Prompt']['prompt']
-                                                        if prompt_text:
-                                                            preview = prompt_text[:100] + "..." if len(prompt_text) > 100 else prompt_text
-                                                            break
-                                    
-                                    elif isinstance(history_entry, dict) and 'user' in history_entry:
-                                        # Old format: user/assistant pairs
-                                        message_count += 1  # Count as one conversation turn
-                                        
-                                        # Get preview from user content
-                                        if preview == "No preview available":
-                                            user_msg = history_entry['user']
-                                            if 'content' in user_msg and 'Prompt' in user_msg['content']:
-                                                if 'prompt' in user_msg['content']['Prompt']:
-                                                    prompt_text = user_msg['content']['Prompt']['prompt']
-                                                    if prompt_text:
-                                                        preview = prompt_text[:100] + "..." if len(prompt_text) > 100 else prompt_text
-                                        
-                                        # Look for agent information in conversation content
-                                        if not agent_info:
-                                            for msg in history_entry:
-                                                if isinstance(msg, dict):
-                                                    # Check additional_context for agent info
-                                                    if 'additional_context' in msg:
-                                                        context = msg['additional_context']
-                                                        if 'agent' in context.lower():
-                                                            lines = context.split('\n')
-                                                            for line in lines:
-                                                                if ('agent' in line.lower() and 
-                                                                    ('specialist' in line.lower() or 'with' in line.lower() or 
-                                                                     'chatting with' in line.lower() or 'you are' in line.lower())):
-                                                                    agent_info = line.strip()[:80]
-                                                                    # Clean up the agent info
-                                                                    if 'you are chatting with' in agent_info.lower():
-                                                                        agent_info = agent_info.split('chatting with')[-1].strip()
-                                                                    elif 'you are' in agent_info.lower():
-                                                                        agent_info = agent_info.split('you are')[-1].strip()
-                                                                    break
-                                                    
-                                                    # Check for agent patterns in prompt content
-                                                    if 'content' in msg and 'Prompt' in msg['content']:
-                                                        prompt = msg['content']['Prompt'].get('prompt', '')
-                                                        if '--agent' in prompt:
-                                                            # Extract agent name from command line
-                                                            parts = prompt.split('--agent')
-                                                            if len(parts) > 1:
-                                                                agent_part = parts[1].strip().split()[0]
-                                                                agent_info = f"Agent: {agent_part}"
-                                                                break
-                                                
-                                                if agent_info:
-                                                    break
+            if kind != 'file':
+                # Serve from the sidecar index when available
+                index = self._get_index()
+                if index is not None:
+                    try:
+                        for row in index.list_conversations(limit, filters, before):
+                            results.append(self._listing_entry(
+                                row['rowid'], row['key'], row['conversation_id'], row['message_count'],
+                                row['first_prompt'], row['agent'], row['created_at'], row['updated_at']))
+                            last = ['rowid', row['rowid']]
+                        return _page('conversations', results, last, limit, cursor_scope)
+                    except sqlite3.Error:
+                        results, last = [], None
+                
+                # Read from SQLite database (main storage)
+                try:
+                    with self.connection() as conn:
+                        for row in self._iter_listing_rows(conn, filters, before):
+                            if row[3] == 0:  # message_count
+                                continue
                             
-                            if message_count > 0:
-                                # Extract directory name from path
-                                workspace = key.split('|')[0] if '|' in key else key
-                                if workspace.startswith('/'):
-                                    workspace = workspace.split('/')[-1] or workspace.split('/')[-2]
-                                
-                                results.append({
-                                    'id': conv_id,
-                                    'message_count': message_count,
-                                    'preview': preview,
-                                    'created_date': estimated_timestamp.isoformat(),
-                                    'workspace': workspace,
-                                    'full_path': key.split('|')[0] if '|' in key else key,
-                                    'agent': agent_info or 'Unknown (not stored in conversation data)'
-                                })
-                                
-                                if len(results) >= limit:
-                                    break
-                                    
-                        except Exception as e:
-                            continue
+                            results.append(self._listing_entry(*row))
+                            last = ['rowid', row[0]]
                             
-                return results
-                
-            except Exception as e:
-                # Fallback to JSON files
-                pass
-            
-            # Fallback: JSON files in history directory
-            history_files = list(self.history_dir.glob("chat-history-*.json"))
+                            if len(results) >= limit:
+                                break
+                    
+                    return _page('conversations', results, last, limit, cursor_scope)
+                    
+                except Exception as e:
+                    # Fallback to JSON files
+                    results, last = [], None
+                    if kind == 'rowid':
+                        # Rowid cursors have no position among the files
+                        return _page('conversations', results, last, limit, cursor_scope)
             
-            # Sort by modification time (newest first)
-            history_files.sort(key=lambda f: f.stat().st_mtime, reverse=True)
+            # Fallback: JSON files in history directory, newest first
+            scanned = 0
+            for history_file in self._history_files.scan(limit, position if kind == 'file' else None):
+                conversation = history_file.summary
+                last = ['file', history_file.updated_at, history_file.conversation_id]
+                scanned += 1
+                
+                # Only include conversations that have messages
+                if conversation is not None and conversation.message_count > 0 and filters.matches(
+                        history_file.updated_at, '', conversation.message_count, conversation.role_counts):
+                    first_prompt = conversation.first_prompt
+                    results.append({
+                        'id': history_file.conversation_id,
+                        'created_at': history_file.created_at,
+                        'updated_at': history_file.updated_at,
+                        'directory': 'unknown',  # Not available in this format
+                        'message_count': conversation.message_count,
+                        'preview': _preview(first_prompt) if first_prompt else "No readable content"
+                    })
             
-            for history_file in history_files[:limit]:
+            # A page covers limit files before filtering, so a short page need not be the last
+            return {'conversations': results,
+                    'next_cursor': encode_cursor(cursor_scope, last) if scanned >= limit else None}
+        
+        return await self._cached(('list', limit, filters.key(), cursor), _query)
+    
+    async def get_conversation_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Listing entry of one conversation, found by id without listing the others."""
+        def _query():
+            index = self._get_index()
+            if index is not None:
                 try:
-                    with open(history_file, 'r') as f:
-                        conv_data = json.load(f)
-                    
-                    # Extract conversation ID from filename
-                    conv_id = history_file.stem.replace("chat-history-", "")
-                    
-                    # Extract metadata from LokiJS format
-                    messages = []
-                    message_count = 0
-                    
-                    # Navigate the LokiJS structure
-                    if 'collections' in conv_data and len(conv_data['collections']) > 0:
-                        tabs_collection = conv_data['collections'][0]
-                        if 'data' in tabs_collection and len(tabs_collection['data']) > 0:
-                            tab_data = tabs_collection['data'][0]
-                            if 'conversations' in tab_data and len(tab_data['conversations']) > 0:
-                                conversation = tab_data['conversations'][0]
-                                if 'messages' in conversation:
-                                    messages = conversation['messages']
-                                    message_count = len(messages)
-                    
-                    # Only include conversations that have messages
-                    if message_count > 0:
-                        results.append({
-                            'id': conv_id,
-                            'created_at': history_file.stat().st_ctime,
-                            'updated_at': history_file.stat().st_mtime,
-                            'directory': 'unknown',  # Not available in this format
-                            'message_count': message_count,
-                            'preview': self._get_conversation_preview(messages)
-                        })
-                except (json.JSONDecodeError, FileNotFoundError, KeyError):
-                    continue
+                    row = index.lookup(conversation_id)
+                    if row is not None:
+                        return self._listing_entry(
+                            row['rowid'], row['key'], row['conversation_id'], row['message_count'],
+                            row['first_prompt'], row['agent'], row['created_at'], row['updated_at'])
+                except sqlite3.Error:
+                    pass
+            
+            try:
+                with self.connection() as conn:
+                    found = self._find_conversation_row(conn, conversation_id)
+                    if found is not None:
+                        rowid, key, value = found
+                        summary = summarize_conversation(value)
+                        return self._listing_entry(
+                            rowid, key, conversation_id, summary.message_count, summary.first_prompt,
+                            summary.agent, summary.created_at, summary.updated_at)
+            except (sqlite3.Error, ValueError, TypeError):
+                pass
             
-            return results
+            history_file = self._history_files.get(conversation_id)
+            if history_file is None or history_file.summary is None:
+                return None
+            first_prompt = history_file.summary.first_prompt
+            return {
+                'id': conversation_id,
+                'message_count': history_file.summary.message_count,
+                'preview': _preview(first_prompt) if first_prompt else "No readable content",
+                'created_date': _iso_date(history_file.created_at),
+                'updated_date': _iso_date(history_file.updated_at),
+                'workspace': 'unknown',  # Not available in this format
+                'full_path': 'unknown',
+                'agent': UNKNOWN_AGENT
+            }
         
-        return await asyncio.get_event_loop().run_in_executor(None, _query)
+        return await self._run(_query)
     
     async def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Get full conversation data."""
         def _query():
             # First try LokiJS format
-            history_file = self.history_dir / f"chat-history-{conversation_id}.json"
+            history_file = self._history_files.file_path(conversation_id)
             if history_file.exists():
                 try:
-                    with open(history_file, 'r') as f:
-                        data = json.load(f)
-                    
-                    # Extract the actual conversation from LokiJS format
-                    if 'collections' in data and len(data['collections']) > 0:
-                        tabs_collection = data['collections'][0]
-                        if 'data' in tabs_collection and len(tabs_collection['data']) > 0:
-                            tab_data = tabs_collection['data'][0]
-                            if 'conversations' in tab_data and len(tab_data['conversations']) > 0:
-                                return tab_data['conversations'][0]
+                    # Only the first conversation is decoded from the mapped file
+                    found = self._history_files.read_conversation(conversation_id)
+                    if found is not None:
+                        return found[0]
                     
-                    return data  # Fallback to raw data
-                except json.JSONDecodeError:
+                    with open(history_file, 'rb') as f:
+                        return json_backend.load(f)  # Fallback to raw data
+                except (ValueError, OSError):
                     pass
             
-            # If not found in LokiJS, try SQLite
+            # If not found in LokiJS, look the id up in the sidecar index
+            index = self._get_index()
+            if index is not None:
+                try:
+                    return self._conversation_from_index(index, conversation_id)
+                except sqlite3.Error:
+                    pass
+            
+            # Fall back to querying the Q CLI database directly
             if Path(self.db_path).exists():
                 try:
-                    import sqlite3
-                    with sqlite3.connect(self.db_path) as conn:
-                        cursor = conn.cursor()
-                        # First try to find by conversation_id in the JSON
-                        cursor.execute("SELECT value FROM conversations WHERE value LIKE ?", (f'%{conversation_id}%',))
-                        result = cursor.fetchone()
-                        
-                        # If not found, try to find by matching the conversation_id field directly
-                        if not result:
-                            cursor.execute("SELECT rowid, key, value FROM conversations")
-                            for rowid, key, value in cursor.fetchall():
-                                try:
-                                    conv_data = json.loads(value)
-                                    stored_id = conv_data.get('conversation_id', key.split('/')[-1])
-                                    if stored_id == conversation_id:
-                                        result = (value,)
-                                        break
-                                except:
-                                    continue
+                    with self.connection() as conn:
+                        result = self.find_conversation_value(conn, conversation_id)
                         
                         if result:
-                            conv_data = json.loads(result[0])
-                            
-                            # Convert SQLite format to a more readable format
-                            messages = []
-                            if 'history' in conv_data and conv_data['history']:
-                                for history_entry in conv_data['history']:
-                                    if isinstance(history_entry, dict) and 'user' in history_entry:
-                                        # Old format: user/assistant pairs
-                                        user_msg = history_entry['user']
-                                        if 'content' in user_msg and 'Prompt' in user_msg['content']:
-                                            prompt = user_msg['content']['Prompt'].get('prompt', '')
-                                            if prompt:
-                                                messages.append({
-                                                    'type': 'prompt',
-                                                    'body': prompt,
-                                                    'timestamp': user_msg.get('timestamp', '')
-                                                })
-                                        
-                                        if 'assistant' in history_entry and 'Response' in history_entry['assistant']:
-                                            response_data = history_entry['assistant']['Response']
-                                            if isinstance(response_data, dict) and 'content' in response_data:
-                                                response = response_data['content']
-                                                if response:
-                                                    messages.append({
-                                                        'type': 'answer',
-                                                        'body': response,
-                                                        'message_id': response_data.get('message_id', '')
-                                                    })
-                                    
-                                    elif isinstance(history_entry, list):
-                                        # New format: list of messages
-                                        for msg in history_entry:
-                                            if isinstance(msg, dict) and 'content' in msg:
-                                                if 'Prompt' in msg['content']:
-                                                    prompt = msg['content']['Prompt'].get('prompt', '')
-                                                    if prompt:
-                                                        messages.append({
-                                                            'type': 'prompt',
-                                                            'body': prompt
-                                                        })
-                            
+                            conv_data = json_backend.loads(result[0])
+                            conversation = parse_conversation(conv_data, conversation_id)
                             return {
                                 'conversation_id': conversation_id,
-                                'messages': messages,
+                                'messages': [
+                                    message.to_dict() for message in conversation.messages
+                                    if message.role in CONVERSATION_ROLES
+                                ],
                                 'raw_data': conv_data
                             }
                 except Exception:
@@ -316,147 +838,407 @@ class QCliDatabase:
             
             return None
         
-        return await asyncio.get_event_loop().run_in_executor(None, _query)
+        return await self._run(_query)
+    
+    async def get_conversation_messages(self, conversation_id: str, offset: int = 0, limit: Optional[int] = None,
+                                        from_end: bool = False) -> Optional[Dict[str, Any]]:
+        """A window of a conversation's messages.
+        
+        Skips ``offset`` messages and returns the next ``limit`` (all when
+        None), counting from the last message backwards when ``from_end`` is
+        set; messages are always returned oldest first. The result holds
+        ``messages``, ``total_messages`` and ``first_message``, the position
+        of the first returned message. Each message carries its ``seq``, the
+        number :meth:`get_message` and search highlights know it by; in
+        Q CLI conversations tool results are numbered too, so the seqs of
+        the user and assistant messages returned here can skip some. History
+        files and the sidecar index decode only the window. Raises
+        ValueError for a negative offset or a limit below one.
+        """
+        window = _message_window(offset, limit, from_end)
+        
+        def _result(messages: List[Dict[str, Any]], total: int) -> Dict[str, Any]:
+            return {
+                'conversation_id': conversation_id,
+                'messages': messages,
+                'total_messages': total,
+                'first_message': range(total)[window].start
+            }
+        
+        def _query():
+            # First try LokiJS format; only the window's messages are decoded
+            if self._history_files.file_path(conversation_id).exists():
+                try:
+                    found = self._history_files.read_conversation(conversation_id, window.start, window.stop)
+                    if found is not None:
+                        conversation, total = found
+                        messages = conversation.get('messages', [])
+                        # History files return messages as stored, so a message's seq is its position
+                        for seq, message in enumerate(messages, range(total)[window].start):
+                            if isinstance(message, dict):
+                                message['seq'] = seq
+                        return _result(messages, total)
+                except (ValueError, OSError):
+                    pass
+            
+            # Then the sidecar index, which reads only the window's rows
+            index = self._get_index()
+            if index is not None:
+                try:
+                    found = index.lookup(conversation_id)
+                    if found is not None:
+                        messages = index.messages(found['rowid'], offset=offset, limit=limit, from_end=from_end)
+                        return _result([_numbered(message) for message in messages], found['message_count'])
+                except sqlite3.Error:
+                    pass
+            
+            # Fall back to the Q CLI database
+            if Path(self.db_path).exists():
+                try:
+                    with self.connection() as conn:
+                        found = self._find_conversation_row(conn, conversation_id)
+                        if found is None:
+                            return None
+                        # Decoded whole: one C-level decode is faster than splitting the history with JSON1
+                        conversation = parse_conversation_value(found[2], found[1])
+                        messages = [
+                            message for message in conversation.messages
+                            if message.role in CONVERSATION_ROLES
+                        ]
+                        total = len(messages)
+                        return _result([_numbered(message) for message in messages[window]], total)
+                except sqlite3.Error:
+                    pass
+            
+            return None
+        
+        return await self._run(_query)
+    
+    async def get_message(self, conversation_id: str, seq: int) -> Optional[Dict[str, Any]]:
+        """One message by its ``seq`` from :meth:`get_conversation_messages` or a search highlight.
+        
+        Unlike a window this also reaches tool results. Returns None when the
+        conversation or the message does not exist.
+        """
+        if seq < 0:
+            return None
+        
+        def _query():
+            # First try LokiJS format, where seq is the message's position
+            if self._history_files.file_path(conversation_id).exists():
+                try:
+                    found = self._history_files.read_conversation(conversation_id, seq, seq + 1)
+                    if found is not None:
+                        messages = found[0].get('messages', [])
+                        if not messages:
+                            return None
+                        message = messages[0] if isinstance(messages[0], dict) else {}
+                        message['seq'] = seq
+                        return message
+                except (ValueError, OSError):
+                    pass
+            
+            # Then the sidecar index, one seek on (conversation, seq)
+            index = self._get_index()
+            if index is not None:
+                try:
+                    found = index.lookup(conversation_id)
+                    if found is not None:
+                        message = index.message(found['rowid'], seq)
+                        return _numbered(message) if message is not None else None
+                except sqlite3.Error:
+                    pass
+            
+            # Fall back to the Q CLI database
+            if Path(self.db_path).exists():
+                try:
+                    with self.connection() as conn:
+                        found = self._find_conversation_row(conn, conversation_id)
+                        if found is None:
+                            return None
+                        messages = parse_conversation_value(found[2], found[1]).messages
+                        return _numbered(messages[seq]) if seq < len(messages) else None
+                except sqlite3.Error:
+                    pass
+            
+            return None
+        
+        return await self._run(_query)
+    
+    async def search_conversations(self, query: str, limit: int = 50, mode: str = "text",
+                                   filters: Optional[ConversationFilter] = None) -> List[Dict[str, Any]]:
+        """Search conversations by actual message content.
+        
+        ``mode="text"`` keeps exact case-insensitive substring matching in
+        recency order; ``mode="ranked"`` uses the FTS5 index with BM25 ranking;
+        ``mode="fuzzy"`` ranks the same way but also matches close spellings
+        of misspelled words; ``mode="hybrid"`` fuses BM25 and vector rankings (see
+        :meth:`search_conversations_page`). Only conversations passing ``filters`` are searched, and only the
+        messages of its roles.
+        """
+        return (await self.search_conversations_page(query, limit, mode, filters))['results']
     
-    async def search_conversations(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Search conversations by actual message content."""
+    async def search_conversations_page(self, query: str, limit: int = 50, mode: str = "text",
+                                        filters: Optional[ConversationFilter] = None,
+                                        cursor: Optional[str] = None,
+                                        max_bytes: Optional[int] = None,
+                                        hybrid_weight: float = 0.5) -> Dict[str, Any]:
+        """One page of :meth:`search_conversations`.
+        
+        Returns ``{'results': [...], 'next_cursor': token or None}``. Text
+        pages resume below the last conversation's rowid; ranked pages after
+        its (BM25 rank, rowid). Ranks move a little as the history changes,
+        so a ranked page may then start slightly off, but no conversation
+        ranked above the cursor is returned again. With ``max_bytes`` the
+        page ends early once its results would encode to more than that,
+        and ``next_cursor`` resumes after the last result returned.
+        
+        Hybrid search runs the BM25 and vector retrievers concurrently, each
+        stopping at HYBRID_DEPTH times ``limit`` conversations, and fuses
+        their ranks with weighted reciprocal-rank fusion: ``hybrid_weight``
+        for the lexical rank and the rest for the vector rank. It returns a
+        single page and takes no cursor.
+        
+        Fuzzy search expands each query word with the closest, more
+        frequent spellings in the index's vocabulary and ranks like
+        ranked search in a single FTS5 query; the page then also holds
+        ``expansions``, the alternatives searched for every query term.
+        Without the FTS5 index it falls back to text search.
+        
+        Raises ValueError for a mode not in SEARCH_MODES or a limit below one.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; use one of {', '.join(SEARCH_MODES)}")
+        _check_limit(limit)
+        filters = filters or ConversationFilter()
+        if mode == "hybrid":
+            if cursor:
+                raise ValueError("hybrid search returns a single page; raise limit instead of passing a cursor")
+            if not 0 <= hybrid_weight <= 1:
+                raise ValueError("hybrid_weight must be between 0 and 1")
+            return await self._hybrid_search(query, limit, filters, hybrid_weight, max_bytes)
+        cursor_scope = scope('search', mode, query, filters.key())
+        kind, position = _cursor_position(cursor, cursor_scope)
+        if kind == 'file':
+            raise ValueError("Invalid cursor")
+        before = position[0] if kind == 'rowid' else None
+        
         def _query():
             results = []
+            positions = []
             query_lower = query.lower()
             
+            # Serve from the sidecar index when available
+            index = self._get_index()
+            if index is not None:
+                try:
+                    if mode in ("ranked", "fuzzy") and index.has_fts and kind != 'rowid':
+                        terms = index.expand_terms(query) if mode == "fuzzy" else None
+                        hits = index.search_ranked(query, limit, filters, tuple(position) if kind else None,
+                                                   terms=terms)
+                        results = [self._ranked_search_result(hit) for hit in hits]
+                        positions = [['rank', hit['rank'], hit['rowid']] for hit in hits]
+                    else:
+                        terms = None
+                        hits = index.search(query, limit, filters, before)
+                        results = [self._text_search_result(hit) for hit in hits]
+                        positions = [['rowid', hit['rowid']] for hit in hits]
+                    page = _results_page(results, positions, limit, cursor_scope, max_bytes)
+                    if terms is not None:
+                        page['expansions'] = {alternatives[0]: alternatives[1:] for alternatives in terms}
+                    return page
+                except sqlite3.Error:
+                    results, positions = [], []
+            
+            if kind == 'rank':
+                # Ranked cursors need the index that produced them
+                raise ValueError("Cursor does not belong to this query; start again without a cursor")
+            
             # Search SQLite database
             try:
-                import sqlite3
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT rowid, key, value FROM conversations ORDER BY rowid DESC")
+                with self.connection() as conn:
+                    # Conversations passing the filter, found without decoding any
+                    allowed = None
+                    if not filters.is_empty:
+                        allowed = {row[0] for row in self._iter_listing_rows(conn, filters, before)}
                     
-                    for rowid, key, value in cursor.fetchall():
-                        try:
-                            conv_data = json.loads(value)
-                            conv_id = conv_data.get('conversation_id', key.split('/')[-1])
-                            
-                            # Extract all message content for searching
-                            all_text = []
-                            message_count = 0
-                            matching_snippets = []
-                            
-                            if 'history' in conv_data and conv_data['history']:
-                                for history_entry in conv_data['history']:
-                                    if isinstance(history_entry, dict) and 'user' in history_entry:
-                                        # Old format: user/assistant pairs
-                                        user_msg = history_entry['user']
-                                        if 'content' in user_msg and 'Prompt' in user_msg['content']:
-                                            prompt = user_msg['content']['Prompt'].get('prompt', '')
-                                            if prompt:
-                                                all_text.append(prompt)
-                                                message_count += 1
-                                                # Check if this message matches the query
-                                                if query_lower in prompt.lower():
-                                                    snippet = prompt[:150] + "..." if len(prompt) > 150 else prompt
-                                                    matching_snippets.append(f"User: {snippet}")
-                                        
-                                        if 'assistant' in history_entry and 'Response' in history_entry['assistant']:
-                                            response_data = history_entry['assistant']['Response']
-                                            if isinstance(response_data, dict) and 'content' in response_data:
-                                                response = response_data['content']
-                                                if response:
-                                                    all_text.append(response)
-                                                    message_count += 1
-                                                    # Check if this message matches the query
-                                                    if query_lower in response.lower():
-                                                        snippet = response[:150] + "..." if len(response) > 150 else response
-                                                        matching_snippets.append(f"Assistant: {snippet}")
-                                    
-                                    elif isinstance(history_entry, list):
-                                        # New format: list of messages
-                                        for msg in history_entry:
-                                            if isinstance(msg, dict):
-                                                if 'content' in msg and 'Prompt' in msg['content']:
-                                                    prompt = msg['content']['Prompt'].get('prompt', '')
-                                                    if prompt:
-                                                        all_text.append(prompt)
-                                                        message_count += 1
-                                                        if query_lower in prompt.lower():
-                                                            snippet = prompt[:150] + "..." if len(prompt) > 150 else prompt
-                                                            matching_snippets.append(f"User: {snippet}")
-                                                
-                                                elif 'ToolUse' in msg:
-                                                    # Assistant response in ToolUse format
-                                                    tool_use = msg['ToolUse']
-                                                    if isinstance(tool_use, dict):
-                                                        # Look for response content in various fields
-                                                        response_text = ""
-                                                        if 'response' in tool_use:
-                                                            response_text = str(tool_use['response'])
-                                                        elif 'content' in tool_use:
-                                                            response_text = str(tool_use['content'])
-                                                        elif 'result' in tool_use:
-                                                            response_text = str(tool_use['result'])
-                                                        
-                                                        if response_text:
-                                                            all_text.append(response_text)
-                                                            message_count += 1
-                                                            if query_lower in response_text.lower():
-                                                                snippet = response_text[:150] + "..." if len(response_text) > 150 else response_text
-                                                                matching_snippets.append(f"Assistant: {snippet}")
-                            
-                            # Check if any message content matches the query
-                            full_text = ' '.join(all_text).lower()
-                            if query_lower in full_text and message_count > 0:
-                                # Calculate creation date from rowid
-                                # Calculate estimated timestamp from rowid (same logic as list_conversations)
-                                max_rowid = 2000  # Approximate current max
-                                days_ago = max(0, (max_rowid - rowid) // 10)  # Rough estimate
-                                import datetime
-                                created_date = datetime.datetime.now() - datetime.timedelta(days=days_ago)
-                                
-                                # Get conversation preview (first user message)
-                                preview = "No preview available"
-                                if all_text:
-                                    preview = all_text[0][:100] + "..." if len(all_text[0]) > 100 else all_text[0]
-                                
-                                workspace = key.split('|')[0] if '|' in key else key
-                                if workspace.startswith('/'):
-                                    workspace = workspace.split('/')[-1] or workspace.split('/')[-2]
-                                
-                                results.append({
-                                    'id': conv_id,
-                                    'workspace': workspace,
-                                    'created_date': created_date.isoformat(),
-                                    'message_count': message_count,
-                                    'preview': preview,
-                                    'matching_snippets': matching_snippets[:3],  # Include up to 3 matching snippets
-                                    'match_count': len(matching_snippets)
-                                })
-                                
-                                if len(results) >= limit:
-                                    break
-                        
-                        except (json.JSONDecodeError, KeyError):
+                    if self._scan_pool is not None:
+                        hits = self._scan_pool.search(conn, query_lower, limit, filters.roles, allowed, before)
+                        results = [self._text_search_result(hit) for hit in hits]
+                        positions = [['rowid', hit['rowid']] for hit in hits]
+                        return _results_page(results, positions, limit, cursor_scope, max_bytes)
+                    
+                    for rowid, key, value in self._iter_conversation_rows(conn, before=before):
+                        if allowed is not None and rowid not in allowed:
                             continue
+                        conversation = parse_conversation_value(value, key)
+                        matches = conversation.text_matches(query_lower, filters.roles)
+                        if matches:
+                            results.append(self._text_search_result({
+                                'rowid': rowid,
+                                'key': key,
+                                'conversation_id': conversation.conversation_id,
+                                'message_count': conversation.message_count,
+                                'first_prompt': conversation.first_prompt,
+                                'created_at': conversation.created_at,
+                                'updated_at': conversation.updated_at,
+                                'matches': matches
+                            }))
+                            positions.append(['rowid', rowid])
+                            
+                            if len(results) >= limit:
+                                break
             
             except Exception as e:
-                print(f"Search error: {e}")
+                print(f"Search error: {e}", file=sys.stderr)
                 import traceback
                 traceback.print_exc()
             
-            return results
+            return _results_page(results, positions, limit, cursor_scope, max_bytes)
         
-        return await asyncio.get_event_loop().run_in_executor(None, _query)
+        return await self._cached(('search', query, limit, mode, filters.key(), cursor, max_bytes), _query)
     
-    def _get_conversation_preview(self, messages: List) -> str:
-        """Extract a preview from conversation messages."""
-        if not messages or not isinstance(messages, list):
-            return "No content"
+    async def _hybrid_search(self, query: str, limit: int, filters: ConversationFilter, weight: float,
+                             max_bytes: Optional[int]) -> Dict[str, Any]:
+        """Lexical and vector hits fused by weighted reciprocal rank; see :meth:`search_conversations_page`."""
+        index = await self._run(self._get_index)
+        if index is None:
+            raise RuntimeError("hybrid search needs the sidecar index, which could not be opened")
+        depth = limit * HYBRID_DEPTH
+        
+        def _lexical():
+            # BM25 ranks only; snippets are built for the fused top results alone
+            if index.has_fts:
+                return [(hit['rowid'], None) for hit in index.search_ranked(query, depth, filters, matches=False)]
+            return [(hit['rowid'], self._text_search_result(hit)) for hit in index.search(query, depth, filters)]
+        
+        def _vector():
+            hits, _, _ = self._vector_hits(index, query, depth, filters)
+            return hits
         
-        # Look for the first user prompt in the messages
-        for message in messages[:5]:  # Check first few messages
-            if isinstance(message, dict):
-                # Check for the new LokiJS format
-                if message.get('type') == 'prompt' and 'body' in message:
-                    body = message['body']
-                    if body and isinstance(body, str):
-                        return body[:100] + "..." if len(body) > 100 else body
+        lexical, vector = await asyncio.gather(self._run(_lexical), self._run(_vector))
+        
+        def _fuse():
+            scores: Dict[int, float] = {}
+            ranks: Dict[int, Dict[str, int]] = {}
+            for name, share, rowids in (('lexical', weight, [rowid for rowid, _ in lexical]),
+                                        ('vector', 1 - weight, [hit['rowid'] for hit in vector])):
+                for rank, rowid in enumerate(rowids, 1):
+                    scores[rowid] = scores.get(rowid, 0.0) + share / (RRF_K + rank)
+                    ranks.setdefault(rowid, {})[name] = rank
+            top = sorted(scores, key=lambda rowid: (-scores[rowid], rowid))[:limit]
+            
+            # Lexical matches show where the query's terms occur; vector
+            # matches stand in for conversations only the vectors found
+            wanted = set(top)
+            formatted = {rowid: result for rowid, result in lexical if rowid in wanted and result is not None}
+            matched = [rowid for rowid, result in lexical if rowid in wanted and result is None]
+            if matched:
+                formatted.update((hit['rowid'], self._ranked_search_result(hit))
+                                 for hit in index.search_ranked(query, len(matched), filters, rowids=matched))
+            formatted.update(self._vector_search_results(index, [
+                hit for hit in vector if hit['rowid'] in wanted and hit['rowid'] not in formatted]))
+            results = []
+            for rowid in top:
+                if rowid not in formatted:
+                    # Embedded before its conversation left the index
+                    continue
+                result = formatted[rowid]
+                result['score'] = round(scores[rowid], 6)
+                result['lexical_rank'] = ranks[rowid].get('lexical')
+                result['vector_rank'] = ranks[rowid].get('vector')
+                results.append(result)
+            if max_bytes:
+                results = results[:fit_results(results, max_bytes)]
+            return {'results': results, 'next_cursor': None}
+        
+        return await self._run(_fuse)
+    
+    def _vector_hits(self, index: HistoryIndex, query: str, limit: int,
+                     filters: ConversationFilter) -> Tuple[List[Dict[str, Any]], str, Optional[Dict[str, Any]]]:
+        """Vector-ranked hits with the method that produced them and the encoder's status.
         
-        return "No readable content"
+        Uses embeddings once their first background encoding has finished,
+        otherwise TF-IDF vectors.
+        """
+        hits = None
+        embeddings = self._get_embeddings(index)
+        if embeddings is not None:
+            embeddings.refresh()
+            hits = embeddings.search(query, limit, filters)
+        method = 'embeddings' if hits is not None else 'tfidf'
+        if hits is None:
+            hits = self._get_vectors(index).search(query, limit, filters)
+        return hits, method, embeddings.status() if embeddings is not None else None
+    
+    def _vector_search_results(self, index: HistoryIndex, hits: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """Format vector hits, keyed by rowid; hits whose conversation has left the index are dropped."""
+        summaries = index.summaries([hit['rowid'] for hit in hits])
+        bodies = index.message_bodies([(hit['rowid'], seq) for hit in hits for seq, _, _ in hit['matches']])
+        results = {}
+        for hit in hits:
+            summary = summaries.get(hit['rowid'])
+            if summary is None:
+                continue
+            results[hit['rowid']] = {
+                'id': summary['conversation_id'],
+                'workspace': workspace_from_key(summary['key']),
+                'created_date': _iso_date(summary['created_at']),
+                'updated_date': _iso_date(summary['updated_at']),
+                'message_count': summary['message_count'],
+                'preview': _preview(summary['first_prompt']) if summary['first_prompt'] else "No preview available",
+                'matching_snippets': [
+                    f"{_ROLE_LABELS[role]}: {_snippet(bodies.get((hit['rowid'], seq), ''))}"
+                    for seq, role, _ in hit['matches']
+                ],
+                'score': round(hit['score'], 4)
+            }
+        return results
+    
+    async def semantic_search(self, query: str, limit: int = 20,
+                              filters: Optional[ConversationFilter] = None) -> Dict[str, Any]:
+        """Conversations ranked by the similarity of their best messages to ``query``.
+        
+        Unlike the other modes this matches related wording rather than
+        exact text. Uses embeddings when a backend is configured and its
+        first background encoding has finished, otherwise TF-IDF vectors.
+        Works offline; needs numpy and the sidecar index.
+        
+        Returns ``{results, method, embeddings}``: ``method`` is
+        ``embeddings`` or ``tfidf`` and ``embeddings`` the encoder's status
+        (None without a backend). Raises ValueError for a limit below one
+        and RuntimeError when the sidecar index cannot be used.
+        """
+        _check_limit(limit)
+        filters = filters or ConversationFilter()
+        
+        def _query():
+            index = self._get_index()
+            if index is None:
+                raise RuntimeError("semantic_search needs the sidecar index, which is unavailable")
+            hits, method, status = self._vector_hits(index, query, limit, filters)
+            results = self._vector_search_results(index, hits)
+            return {
+                'results': [results[hit['rowid']] for hit in hits if hit['rowid'] in results],
+                'method': method,
+                'embeddings': status
+            }
+        
+        return await self._run(_query)
+
+
+_shared_database: Optional[QCliDatabase] = None
+_shared_database_lock = threading.Lock()
+
+
+def get_database() -> QCliDatabase:
+    """Return the process-wide QCliDatabase for the auto-detected Q CLI paths.
+    
+    Created on first use; a failed lookup (e.g. Q CLI not installed yet) is
+    not cached, so later calls try again.
+    """
+    global _shared_database
+    with _shared_database_lock:
+        if _shared_database is None:
+            _shared_database = QCliDatabase()
+        return _shared_database
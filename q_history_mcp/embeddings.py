@@ -0,0 +1,457 @@
+"""Dense embeddings of indexed messages, encoded in the background.
+
+Messages are split into chunks small enough for an embedding model's input
+window and encoded in batches by a :class:`EmbeddingBackend`: a
+sentence-transformers model loaded from the local cache, or a deterministic
+hashing model that needs no download (for tests and machines without a
+model). Encoding runs on one background thread, so tool calls never wait
+for it; searches use the last complete set of embeddings.
+
+Every chunk's vector is cached on disk under a hash of its text, so a
+restart or a re-sync only encodes chunks that were never encoded before.
+
+Past EXACT_ROWS chunks, searches go through an IVF index (see
+:mod:`q_history_mcp.ann`) whose centroids and list assignments are cached
+with the vectors. New chunks join the existing lists; the centroids are
+retrained once the chunk count has grown RETRAIN_GROWTH-fold.
+
+Choose the backend with ``Q_HISTORY_EMBEDDINGS`` (``sentence-transformers``,
+``hashing`` or ``none``; by default sentence-transformers when installed)
+and the model with ``Q_HISTORY_EMBEDDING_MODEL`` (a model name or path).
+
+Requires numpy; importing this module raises ImportError without it.
+"""
+
+import hashlib
+import importlib.util
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from q_history_mcp.ann import IvfIndex, normalize
+from q_history_mcp.filters import ConversationFilter
+from q_history_mcp.index import HistoryIndex
+from q_history_mcp.vectors import ROLE_CODES, TOKEN, eligible_rows, rank_conversations
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+# Characters per chunk; about the 256 word pieces MiniLM models read
+CHUNK_CHARS = 1000
+
+# Long tool output is embedded only up to this many chunks per message
+MAX_CHUNKS = 16
+
+# Chunks encoded per model call
+ENCODE_BATCH = 64
+
+# Conversations chunked per step of an update
+CONVERSATION_BATCH = 64
+
+# Cache keys looked up per query
+LOOKUP_BATCH = 500
+
+# Bump when the cache layout changes; older caches are emptied
+CACHE_FORMAT = 2
+
+# Up to this many chunks a search scores every one; beyond, the IVF index
+EXACT_ROWS = 50_000
+
+# Retrain the IVF centroids once the chunks outnumber their training set this many times
+RETRAIN_GROWTH = 4
+
+
+class EmbeddingBackend:
+    """Encodes texts as unit-length vectors.
+
+    ``name`` identifies the model; cached vectors are only reused by a
+    backend of the same name.
+    """
+
+    name = ""
+    dimensions = 0
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """A float32 array with one unit-length row per text."""
+        raise NotImplementedError
+
+
+class HashingBackend(EmbeddingBackend):
+    """Deterministic stand-in model: a signed, hashed bag of words.
+
+    Texts sharing words get similar vectors, with no model files and the
+    same output on every machine.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN.findall(text.lower()):
+                digest = zlib.crc32(token.encode("utf-8"))
+                vectors[row, digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        return normalize(vectors)
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """A sentence-transformers model from the local cache; never downloads.
+
+    Raises ImportError without sentence-transformers, and OSError when the
+    model is neither cached nor a local directory.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model, local_files_only=True)
+        self.name = f"sentence-transformers:{model}"
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=ENCODE_BATCH, convert_to_numpy=True,
+                                 normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+
+
+BACKENDS = ("sentence-transformers", "hashing")
+
+
+def configured_backend() -> Optional[str]:
+    """Backend requested through ``Q_HISTORY_EMBEDDINGS``, or None for no embeddings."""
+    value = os.environ.get("Q_HISTORY_EMBEDDINGS", "").strip().lower()
+    if value in ("", "auto"):
+        return "sentence-transformers" if importlib.util.find_spec("sentence_transformers") else None
+    if value in ("none", "off"):
+        return None
+    if value not in BACKENDS:
+        raise ValueError(f"Q_HISTORY_EMBEDDINGS must be one of {', '.join(BACKENDS)} or 'none', not {value!r}")
+    return value
+
+
+def create_backend(name: str) -> EmbeddingBackend:
+    """Load the named backend; may take seconds for a real model."""
+    if name == "hashing":
+        return HashingBackend()
+    return SentenceTransformerBackend(os.environ.get("Q_HISTORY_EMBEDDING_MODEL") or DEFAULT_MODEL)
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """``text`` split into at most MAX_CHUNKS pieces of ``size`` characters, at whitespace where possible."""
+    chunks: List[str] = []
+    start, length = 0, len(text)
+    while start < length and len(chunks) < MAX_CHUNKS:
+        end = min(start + size, length)
+        if end < length:
+            split = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+            if split > start:
+                end = split
+        piece = text[start:end].strip()
+        if piece:
+            chunks.append(piece)
+        start = end
+    return chunks
+
+
+def chunk_key(text: str) -> bytes:
+    """Cache key of a chunk: a hash of its text."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """Chunk vectors of one backend on disk, keyed by :func:`chunk_key`, plus the IVF index over them.
+
+    Each vector also records its IVF list (NULL until assigned); the lists
+    are only valid for the centroids stored alongside.
+    """
+
+    def __init__(self, path: Path, backend: EmbeddingBackend):
+        self.path = path
+        self.dimensions = backend.dimensions
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'backend'").fetchone()
+            identity = f"{CACHE_FORMAT}:{backend.name}:{backend.dimensions}"
+            if row is None or row[0] != identity:
+                self._conn.execute("DROP TABLE IF EXISTS embeddings")
+                self._conn.execute("DROP TABLE IF EXISTS centroids")
+                self._conn.execute("DELETE FROM meta")
+                self._conn.execute("INSERT INTO meta VALUES ('backend', ?)", (identity,))
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                               "(key BLOB PRIMARY KEY, vector BLOB NOT NULL, list INTEGER) WITHOUT ROWID")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS centroids (list INTEGER PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def get(self, keys: List[bytes]) -> Dict[bytes, Tuple[np.ndarray, int]]:
+        """Cached ``(vector, list)`` of those ``keys`` that have one; list -1 when unassigned."""
+        found = {}
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            for key, vector, list_ in self._conn.execute(
+                    f"SELECT key, vector, list FROM embeddings WHERE key IN ({', '.join('?' * len(batch))})", batch):
+                found[key] = (np.frombuffer(vector, np.float32), -1 if list_ is None else list_)
+        return found
+
+    def put(self, vectors: Dict[bytes, np.ndarray]) -> None:
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, NULL)",
+                                   ((key, vector.astype(np.float32).tobytes()) for key, vector in vectors.items()))
+
+    def load_ivf(self) -> Optional[IvfIndex]:
+        """The stored IVF centroids, or None before the first training."""
+        rows = self._conn.execute("SELECT vector FROM centroids ORDER BY list").fetchall()
+        trained = self._conn.execute("SELECT value FROM meta WHERE name = 'trained_rows'").fetchone()
+        if not rows or trained is None:
+            return None
+        return IvfIndex(np.stack([np.frombuffer(row[0], np.float32) for row in rows]), int(trained[0]))
+
+    def put_lists(self, lists: Dict[bytes, int], ivf: Optional[IvfIndex] = None) -> None:
+        """Record the lists of ``lists``' keys; with ``ivf``, first replace the centroids and forget every list."""
+        with self._conn:
+            if ivf is not None:
+                self._conn.execute("UPDATE embeddings SET list = NULL")
+                self._conn.execute("DELETE FROM centroids")
+                self._conn.executemany("INSERT INTO centroids VALUES (?, ?)",
+                                       ((list_, centroid.tobytes()) for list_, centroid in enumerate(ivf.centroids)))
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('trained_rows', ?)", (str(ivf.trained_rows),))
+            self._conn.executemany("UPDATE embeddings SET list = ? WHERE key = ?",
+                                   ((list_, key) for key, list_ in lists.items()))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class _Conversation:
+    """Chunk vectors of one conversation at one content hash, with their IVF lists (-1 if unassigned)."""
+
+    __slots__ = ("content_hash", "seqs", "roles", "keys", "vectors", "lists")
+
+    def __init__(self, content_hash: str, seqs: List[int], roles: List[int], keys: List[bytes],
+                 vectors: np.ndarray, lists: List[int]):
+        self.content_hash = content_hash
+        self.seqs = np.array(seqs, np.int32)
+        self.roles = np.array(roles, np.int8)
+        self.keys = keys
+        self.vectors = vectors
+        self.lists = np.array(lists, np.int32)
+
+
+class _Snapshot:
+    """Every chunk vector of the index at one sync, stacked for scoring.
+
+    With an IVF index the rows are stored grouped by list and ``offsets``
+    bounds each list; otherwise ``ivf`` and ``offsets`` are None.
+    """
+
+    def __init__(self, conversations: Dict[int, _Conversation], dimensions: int, ivf: Optional[IvfIndex]):
+        parts = list(conversations.items())
+        self.vectors = (np.concatenate([part.vectors for _, part in parts]) if parts
+                        else np.zeros((0, dimensions), np.float32))
+        self.conversations = np.concatenate(
+            [np.full(len(part.seqs), rowid, np.int64) for rowid, part in parts] or [np.zeros(0, np.int64)])
+        self.seqs = np.concatenate([part.seqs for _, part in parts] or [np.zeros(0, np.int32)])
+        self.roles = np.concatenate([part.roles for _, part in parts] or [np.zeros(0, np.int8)])
+        self.ivf = ivf if len(self.seqs) > EXACT_ROWS else None
+        self.offsets = None
+        if self.ivf is not None:
+            order, self.offsets = self.ivf.inverted_lists(np.concatenate([part.lists for _, part in parts]))
+            self.vectors = self.vectors[order]
+            self.conversations = self.conversations[order]
+            self.seqs = self.seqs[order]
+            self.roles = self.roles[order]
+
+
+class EmbeddingIndex:
+    """Embeddings of the messages in a :class:`HistoryIndex`, updated in the background.
+
+    :meth:`refresh` queues an update when the index has changed since the
+    last one; :meth:`search` answers from the last finished update.
+    """
+
+    def __init__(self, index: HistoryIndex, backend: str):
+        self.index = index
+        self.backend_name = backend
+        self._backend: Optional[EmbeddingBackend] = None
+        self._cache: Optional[EmbeddingCache] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="q-history-embed")
+        self._pending: Optional[Future] = None
+        self._closed = False
+        self._conversations: Dict[int, _Conversation] = {}
+        self._snapshot: Optional[_Snapshot] = None
+        self._ivf: Optional[IvfIndex] = None
+        self._signature: Optional[str] = None
+        self.error: Optional[str] = None
+        self.done = 0
+        self.total = 0
+
+    def refresh(self) -> None:
+        """Queue an update if the index changed since the last one started."""
+        with self._lock:
+            if self._closed or self.error is not None:
+                return
+            if self._pending is not None and not self._pending.done():
+                return
+            signature = self.index.sync_signature()
+            if signature != self._signature:
+                self._pending = self._executor.submit(self._update, signature)
+
+    def _update(self, signature: str) -> None:
+        try:
+            if self._backend is None:
+                try:
+                    self._backend = create_backend(self.backend_name)
+                except (ImportError, OSError) as e:
+                    # A missing model or package will not fix itself; stop
+                    # retrying and report it through status()
+                    self.error = f"{type(e).__name__}: {e}"
+                    return
+            if self._cache is None:
+                digest = hashlib.sha1(self._backend.name.encode("utf-8")).hexdigest()[:12]
+                path = self.index.index_path.with_name(f"{self.index.index_path.name}.embeddings-{digest}.sqlite3")
+                self._cache = EmbeddingCache(path, self._backend)
+                self._ivf = self._cache.load_ivf()
+            conn = self.index.connect()
+            hashes = dict(conn.execute("SELECT rowid, content_hash FROM conversations"))
+            conversations = {rowid: part for rowid, part in self._conversations.items()
+                             if hashes.get(rowid) == part.content_hash}
+            changed = [rowid for rowid in hashes if rowid not in conversations]
+            self.done, self.total = 0, len(changed)
+            for start in range(0, len(changed), CONVERSATION_BATCH):
+                if self._closed:
+                    return
+                batch = changed[start:start + CONVERSATION_BATCH]
+                conversations.update(self._encode_conversations(conn, batch, hashes))
+                self.done += len(batch)
+            self._ivf = self._assign_lists(conversations)
+            self._conversations = conversations
+            self._snapshot = _Snapshot(conversations, self._backend.dimensions, self._ivf)
+            self._signature = signature
+        except Exception as e:
+            # Anything else, such as a locked database, may pass: the next
+            # refresh() tries again since the signature was not recorded
+            print(f"Embedding update failed, retrying on the next search: {type(e).__name__}: {e}",
+                  file=sys.stderr)
+
+    def _encode_conversations(self, conn: sqlite3.Connection, rowids: List[int],
+                              hashes: Dict[int, str]) -> Dict[int, _Conversation]:
+        """Chunk the messages of ``rowids`` and encode the chunks the cache lacks."""
+        chunks: Dict[int, List[Tuple[int, int, bytes]]] = {rowid: [] for rowid in rowids}
+        texts: Dict[bytes, str] = {}
+        for conversation_rowid, seq, role, body in conn.execute(
+                f"SELECT conversation_rowid, seq, role, body FROM messages "
+                f"WHERE conversation_rowid IN ({', '.join('?' * len(rowids))}) ORDER BY conversation_rowid, seq",
+                rowids):
+            for piece in chunk_text(body):
+                key = chunk_key(piece)
+                texts[key] = piece
+                chunks[conversation_rowid].append((seq, ROLE_CODES[role], key))
+
+        cached = self._cache.get(list(texts))
+        missing = [key for key in texts if key not in cached]
+        for start in range(0, len(missing), ENCODE_BATCH):
+            batch = missing[start:start + ENCODE_BATCH]
+            encoded = dict(zip(batch, self._backend.encode([texts[key] for key in batch])))
+            self._cache.put(encoded)
+            cached.update((key, (vector, -1)) for key, vector in encoded.items())
+
+        dimensions = self._backend.dimensions
+        return {
+            rowid: _Conversation(
+                hashes[rowid], [seq for seq, _, _ in entries], [role for _, role, _ in entries],
+                [key for _, _, key in entries],
+                np.array([cached[key][0] for _, _, key in entries], np.float32).reshape(-1, dimensions),
+                [cached[key][1] for _, _, key in entries])
+            for rowid, entries in chunks.items()
+        }
+
+    def _assign_lists(self, conversations: Dict[int, _Conversation]) -> Optional[IvfIndex]:
+        """File every chunk under an IVF list, training the centroids first when due.
+
+        Nothing happens below EXACT_ROWS chunks, where searches score every
+        chunk anyway. Returns the IVF index the lists belong to.
+        """
+        parts = list(conversations.values())
+        rows = sum(len(part.seqs) for part in parts)
+        ivf = self._ivf
+        if rows <= EXACT_ROWS:
+            return ivf
+        if ivf is None or rows >= RETRAIN_GROWTH * ivf.trained_rows:
+            ivf = IvfIndex.train(np.concatenate([part.vectors for part in parts]))
+            for part in parts:
+                part.lists = ivf.assign(part.vectors)
+            self._cache.put_lists({key: list_ for part in parts for key, list_ in zip(part.keys, part.lists.tolist())},
+                                  ivf)
+            return ivf
+        lists = {}
+        for part in parts:
+            unassigned = np.flatnonzero(part.lists < 0)
+            if len(unassigned):
+                part.lists[unassigned] = ivf.assign(part.vectors[unassigned])
+                lists.update((part.keys[row], int(part.lists[row])) for row in unassigned.tolist())
+        self._cache.put_lists(lists)
+        return ivf
+
+    def status(self) -> Dict[str, Any]:
+        """Backend, progress of the running update and any error, for tool responses."""
+        if self.error is not None:
+            state = "failed"
+        elif self._pending is not None and not self._pending.done():
+            state = "encoding"
+        elif self._snapshot is not None:
+            state = "ready"
+        else:
+            state = "pending"
+        status = {'backend': self._backend.name if self._backend else self.backend_name, 'state': state}
+        if state == "encoding":
+            status['conversations_done'] = self.done
+            status['conversations_total'] = self.total
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+    def search(self, query: str, limit: int, filters: Optional[ConversationFilter] = None,
+               per_conversation: int = 3) -> Optional[List[Dict[str, Any]]]:
+        """Conversations ranked by the cosine similarity of their best chunk to ``query``.
+
+        Uses the last finished update, which may predate the latest sync
+        while a new one runs; hits can name conversations that have since
+        left the index. Returns None before the first update finishes. See
+        :func:`rank_conversations` for the hits returned.
+
+        Past EXACT_ROWS eligible chunks only the IVF lists nearest the query
+        are scored, so a match outside them can be missed.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        if not len(snapshot.seqs):
+            return []
+        vector = self._backend.encode([query])[0]
+        eligible = eligible_rows(self.index, snapshot.conversations, snapshot.roles, filters)
+        if snapshot.ivf is not None and np.count_nonzero(eligible) > EXACT_ROWS:
+            rows, scores = snapshot.ivf.scan(snapshot.vectors, snapshot.offsets, vector)
+            keep = eligible[rows]
+            rows, scores = rows[keep], scores[keep]
+        else:
+            rows = np.flatnonzero(eligible)
+            scores = snapshot.vectors[rows] @ vector
+        return rank_conversations(scores, snapshot.conversations[rows], snapshot.seqs[rows], snapshot.roles[rows],
+                                  limit, per_conversation)
+
+    def close(self) -> None:
+        """Stop the background worker after its current batch and close the cache."""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+        if self._cache is not None:
+            self._cache.close()
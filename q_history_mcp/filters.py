@@ -0,0 +1,110 @@
+"""Conversation filters shared by the listing and search tools.
+
+A :class:`ConversationFilter` is evaluated where the rows live: as SQL over
+the materialized summary columns of the sidecar index, as SQL over the JSON1
+listing of the Q CLI database, and only when SQLite can do neither, against
+streamed summaries before any conversation is decoded.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from q_history_mcp.models import CONVERSATION_ROLES, MESSAGE_ROLES, parse_timestamp
+
+
+def _parse_time(name: str, value: Optional[str]) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    parsed = parse_timestamp(value)
+    if parsed is None:
+        raise ValueError(f"{name} must be an ISO 8601 date or date-time, not {value!r}")
+    return parsed
+
+
+class ConversationFilter:
+    """Which conversations, and for searches which messages, a query may return.
+
+    ``since``/``until`` bound the conversation's last activity
+    (``updated_at`` in epoch seconds, ``until`` exclusive). ``workspace`` is
+    a prefix of the full workspace path. ``role`` keeps conversations with at
+    least one message of that role and restricts search matches to it.
+    ``min_messages`` is the least number of user and assistant messages.
+    """
+
+    __slots__ = ("since", "until", "workspace", "role", "min_messages")
+
+    def __init__(self, since: Optional[float] = None, until: Optional[float] = None,
+                 workspace: Optional[str] = None, role: Optional[str] = None, min_messages: int = 0):
+        if role is not None and role not in MESSAGE_ROLES:
+            raise ValueError(f"role must be one of {', '.join(MESSAGE_ROLES)}, not {role!r}")
+        if min_messages < 0:
+            raise ValueError("min_messages must not be negative")
+        self.since = since
+        self.until = until
+        self.workspace = workspace or None
+        self.role = role
+        self.min_messages = min_messages
+
+    @classmethod
+    def from_arguments(cls, since: Optional[str] = None, until: Optional[str] = None,
+                       workspace: Optional[str] = None, role: Optional[str] = None,
+                       min_messages: Optional[int] = None) -> "ConversationFilter":
+        """Build a filter from tool arguments; empty values mean no restriction.
+
+        Times without an offset are taken as UTC. Raises ValueError for
+        unparseable times or an unknown role.
+        """
+        return cls(_parse_time("since", since), _parse_time("until", until), workspace,
+                   role or None, min_messages or 0)
+
+    @property
+    def is_empty(self) -> bool:
+        """Whether the filter lets every conversation and message through."""
+        return (self.since is None and self.until is None and self.workspace is None
+                and self.role is None and not self.min_messages)
+
+    def key(self) -> Tuple[Any, ...]:
+        """The filter's settings, used to bind cursors to it."""
+        return self.since, self.until, self.workspace, self.role, self.min_messages
+
+    @property
+    def has_time_range(self) -> bool:
+        """Whether ``since`` or ``until`` is set."""
+        return self.since is not None or self.until is not None
+
+    @property
+    def roles(self) -> Tuple[str, ...]:
+        """Roles whose messages a search may match."""
+        return (self.role,) if self.role else CONVERSATION_ROLES
+
+    def sql(self, columns: Dict[str, str]) -> Tuple[str, List[Any]]:
+        """SQL conditions joined with AND (``1`` when empty) and their parameters.
+
+        ``columns`` maps ``updated_at``, ``full_path``, ``message_count`` and
+        every role in MESSAGE_ROLES (its message count) to SQL expressions.
+        """
+        conditions = []
+        params: List[Any] = []
+        if self.since is not None:
+            conditions.append(f"{columns['updated_at']} >= ?")
+            params.append(self.since)
+        if self.until is not None:
+            conditions.append(f"{columns['updated_at']} < ?")
+            params.append(self.until)
+        if self.workspace is not None:
+            conditions.append(f"substr({columns['full_path']}, 1, ?) = ?")
+            params.extend((len(self.workspace), self.workspace))
+        if self.role is not None:
+            conditions.append(f"{columns[self.role]} > 0")
+        if self.min_messages:
+            conditions.append(f"{columns['message_count']} >= ?")
+            params.append(self.min_messages)
+        return " AND ".join(conditions) or "1", params
+
+    def matches(self, updated_at: float, full_path: str, message_count: int,
+                role_counts: Dict[str, int]) -> bool:
+        """Python form of :meth:`sql`, for summaries no SQL layer can see."""
+        return ((self.since is None or updated_at >= self.since)
+                and (self.until is None or updated_at < self.until)
+                and (self.workspace is None or full_path.startswith(self.workspace))
+                and (self.role is None or role_counts[self.role] > 0)
+                and message_count >= self.min_messages)
@@ -0,0 +1,175 @@
+"""Cached scanning of the LokiJS ``chat-history-*.json`` directory.
+
+Listing the history directory used to stat every file several times and
+parse each one serially on every call. :class:`HistoryDirectory` stats each
+file once per scan, keeps the summary of every file keyed on its
+(inode, size, mtime) and only re-reads files whose stat changed, parsing
+those on a small thread pool.
+"""
+
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from q_history_mcp.streaming import ConversationSummary, read_lokijs_conversation, summarize_lokijs
+
+HISTORY_PREFIX = "chat-history-"
+HISTORY_SUFFIX = ".json"
+
+# Threads used to read and summarize changed files
+PARSE_WORKERS = 4
+
+
+class HistoryFile:
+    """One ``chat-history-*.json`` file and its listing summary."""
+
+    __slots__ = ("conversation_id", "path", "created_at", "updated_at", "summary")
+
+    def __init__(self, conversation_id: str, path: str, created_at: float, updated_at: float,
+                 summary: Optional[ConversationSummary]):
+        self.conversation_id = conversation_id
+        self.path = path
+        self.created_at = created_at
+        self.updated_at = updated_at
+        # None when the file could not be read or parsed
+        self.summary = summary
+
+
+def _summarize_file(path: str, conversation_id: str) -> Optional[ConversationSummary]:
+    try:
+        with open(path, 'rb') as f:
+            return summarize_lokijs(f.read(), conversation_id)
+    except (OSError, ValueError):
+        return None
+
+
+class HistoryDirectory:
+    """Stat-cached view of the LokiJS history files in one directory."""
+
+    def __init__(self, path: Path, workers: int = PARSE_WORKERS):
+        """Remember the directory; nothing is read until the first scan."""
+        self.path = Path(path)
+        self.workers = workers
+        self._cache: Dict[str, Tuple[Tuple[int, int, int], HistoryFile]] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def close(self) -> None:
+        """Stop the parser threads."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def file_path(self, conversation_id: str) -> Path:
+        """Path of the history file holding ``conversation_id``."""
+        return self.path / f"{HISTORY_PREFIX}{conversation_id}{HISTORY_SUFFIX}"
+
+    def read_conversation(self, conversation_id: str, start: Optional[int] = 0,
+                          stop: Optional[int] = None) -> Optional[Tuple[Dict[str, Any], int]]:
+        """The first conversation of a history file, with messages ``[start:stop]``.
+
+        The file is memory-mapped and only that conversation is decoded, so
+        other collections and messages outside the window never become
+        Python objects. Returns the conversation and its total number of
+        messages, or None if the file is empty or has no conversation;
+        raises ValueError if it is not valid JSON and OSError if it cannot
+        be opened.
+        """
+        with open(self.file_path(conversation_id), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return read_lokijs_conversation(buffer, start, stop)
+
+    def get(self, conversation_id: str) -> Optional[HistoryFile]:
+        """The summarized history file of one conversation, or None if there is none."""
+        path = str(self.file_path(conversation_id))
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        history_file = HistoryFile(conversation_id, path, st.st_ctime, st.st_mtime,
+                                   _summarize_file(path, conversation_id))
+        with self._lock:
+            self._cache[path] = (signature, history_file)
+        return history_file
+
+    def _stat_files(self) -> List[Tuple[str, str, os.stat_result]]:
+        """``(conversation_id, path, stat)`` of every history file, one stat each."""
+        files = []
+        try:
+            entries = os.scandir(self.path)
+        except OSError:
+            return files
+        with entries:
+            for entry in entries:
+                name = entry.name
+                if not (name.startswith(HISTORY_PREFIX) and name.endswith(HISTORY_SUFFIX)):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                conv_id = name[len(HISTORY_PREFIX):-len(HISTORY_SUFFIX)]
+                files.append((conv_id, entry.path, st))
+        return files
+
+    def _parse(self, stale: List[Tuple[str, str]]) -> List[Optional[ConversationSummary]]:
+        """Summarize ``(conversation_id, path)`` files, in parallel when there are several."""
+        if len(stale) <= 1:
+            return [_summarize_file(path, conv_id) for conv_id, path in stale]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="q-history-files")
+            pool = self._pool
+        return list(pool.map(lambda item: _summarize_file(item[1], item[0]), stale))
+
+    def scan(self, limit: Optional[int] = None,
+             before: Optional[Tuple[float, str]] = None) -> List[HistoryFile]:
+        """The most recently modified history files, newest first.
+
+        Files are ordered by ``(mtime, conversation_id)``; with ``before``,
+        only files ordered after that position are returned. Only the first
+        ``limit`` files are summarized; summaries of files whose inode, size
+        and mtime are unchanged come from the cache.
+        """
+        files = self._stat_files()
+        files.sort(key=lambda item: (item[2].st_mtime, item[0]), reverse=True)
+        present = {path for _, path, _ in files}
+        if before is not None:
+            files = [item for item in files if (item[2].st_mtime, item[0]) < tuple(before)]
+        if limit is not None:
+            files = files[:limit]
+
+        results: List[Optional[HistoryFile]] = []
+        stale = []
+        with self._lock:
+            # Forget files that were deleted
+            for path in [path for path in self._cache if path not in present]:
+                del self._cache[path]
+            for conv_id, path, st in files:
+                signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+                cached = self._cache.get(path)
+                if cached is not None and cached[0] == signature:
+                    results.append(cached[1])
+                else:
+                    results.append(None)
+                    stale.append((len(results) - 1, conv_id, path, st, signature))
+
+        if stale:
+            summaries = self._parse([(conv_id, path) for _, conv_id, path, _, _ in stale])
+            with self._lock:
+                for (position, conv_id, path, st, signature), summary in zip(stale, summaries):
+                    history_file = HistoryFile(conv_id, path, st.st_ctime, st.st_mtime, summary)
+                    self._cache[path] = (signature, history_file)
+                    results[position] = history_file
+        return results
@@ -0,0 +1,738 @@
+"""Sidecar index of Q CLI conversation history.
+
+The Q CLI database stores each conversation as one large ``ConversationState``
+JSON blob. Decoding every blob on every tool call is slow once the history
+grows, so this module maintains a derived SQLite database with normalized
+conversations/messages/tool_uses tables, where each conversations row also
+carries the materialized listing summary. The index is synced incrementally:
+each source row is keyed on its rowid plus a hash of its ``value`` and only
+new or changed conversations are parsed again.
+
+Every conversation also gets a real time span. It comes from the message
+timestamps and request_metadata in the history; rows that record no times
+use the time this index first saw the conversation (``created_at``) and
+its current content (``updated_at``). Both columns are indexed, so date
+ranges are index range scans.
+
+The words of the message text, with the number of messages containing each,
+form a vocabulary filed under character trigrams; fuzzy searches correct
+misspelled query words against it (see ``vocabulary``).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from q_history_mcp.connections import ThreadLocalConnections, read_only_connections
+from q_history_mcp.filters import ConversationFilter
+from q_history_mcp.models import CONVERSATION_ROLES, Conversation, Message, parse_conversation_value
+from q_history_mcp.parallel import ScanPool
+from q_history_mcp.vocabulary import (
+    CORRECTION_RATIO, MAX_EXPANSIONS, MAX_LENGTH, MIN_LENGTH, edit_distance, max_edits, message_terms, trigrams, words,
+)
+
+# Bump whenever the schema or the extraction rules change; the index is
+# rebuilt from scratch when the stored version differs.
+SCHEMA_VERSION = 9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    rowid INTEGER PRIMARY KEY,      -- rowid in the source conversations table
+    key TEXT NOT NULL,
+    conversation_id TEXT,
+    content_hash TEXT NOT NULL,
+    -- Listing summary, materialized when the row is (re)parsed
+    message_count INTEGER NOT NULL DEFAULT 0,
+    user_count INTEGER NOT NULL DEFAULT 0,
+    assistant_count INTEGER NOT NULL DEFAULT 0,
+    tool_count INTEGER NOT NULL DEFAULT 0,
+    first_prompt TEXT,
+    workspace TEXT NOT NULL,
+    full_path TEXT NOT NULL,
+    agent TEXT,
+    -- Epoch seconds; see the module docstring for where they come from
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    first_seen REAL NOT NULL,       -- when this rowid was first synced
+    changed_at REAL NOT NULL,       -- when the current content_hash was first synced
+    time_source TEXT NOT NULL       -- 'history' or 'first_seen'
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_rowid INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,             -- 'user', 'assistant' or 'tool'
+    kind TEXT NOT NULL,             -- 'prompt', 'response', 'tool_use' or 'tool_result'
+    body TEXT NOT NULL,
+    timestamp TEXT,
+    message_id TEXT,
+    UNIQUE (conversation_rowid, seq)
+);
+CREATE TABLE IF NOT EXISTS tool_uses (
+    conversation_rowid INTEGER NOT NULL,
+    seq INTEGER NOT NULL,           -- seq of the assistant message issuing the call
+    tool_use_id TEXT,
+    name TEXT,
+    args TEXT
+);
+CREATE TABLE IF NOT EXISTS vocabulary (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE,
+    messages INTEGER NOT NULL       -- messages containing the term
+);
+CREATE TABLE IF NOT EXISTS vocabulary_trigrams (
+    trigram TEXT NOT NULL,
+    term_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, term_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS conversations_by_id ON conversations (conversation_id);
+CREATE INDEX IF NOT EXISTS conversations_by_created ON conversations (created_at);
+CREATE INDEX IF NOT EXISTS conversations_by_updated ON conversations (updated_at);
+CREATE INDEX IF NOT EXISTS tool_uses_conversation ON tool_uses (conversation_rowid, seq);
+CREATE VIEW IF NOT EXISTS messages_fts_content AS
+    SELECT id, conversation_rowid,
+           CASE WHEN kind = 'prompt' THEN body END AS prompt,
+           CASE WHEN kind = 'response' THEN body END AS response,
+           CASE WHEN kind = 'tool_use' THEN body END AS tool_use,
+           CASE WHEN kind = 'tool_result' THEN body END AS tool_result
+    FROM messages;
+"""
+
+# External-content FTS5 table over messages with one column per message kind.
+# Created separately because FTS5 may be missing from the SQLite build.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    prompt, response, tool_use, tool_result,
+    content='messages_fts_content', content_rowid='id',
+    tokenize='porter unicode61'
+);
+INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0, 0.5, 0.25)');
+"""
+
+# Trigram index over message bodies used to prefilter substring searches.
+# detail=none keeps it small; candidates are always verified in Python.
+# Needs SQLite 3.34+ for the trigram tokenizer.
+_TRIGRAM_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_trigram USING fts5(
+    body,
+    content='messages', content_rowid='id',
+    tokenize='trigram', detail='none'
+);
+"""
+
+# FTS column index per message kind, used for highlight()
+_FTS_COLUMNS = {'prompt': 0, 'response': 1, 'tool_use': 2, 'tool_result': 3}
+
+# FTS columns holding each role's messages
+_ROLE_FTS_COLUMNS = {'user': 'prompt', 'assistant': 'response tool_use', 'tool': 'tool_result'}
+
+# ConversationFilter columns of the conversations table (aliased c)
+_FILTER_COLUMNS = {
+    'updated_at': 'c.updated_at',
+    'full_path': 'c.full_path',
+    'message_count': 'c.message_count',
+    'user': 'c.user_count',
+    'assistant': 'c.assistant_count',
+    'tool': 'c.tool_count',
+}
+
+# Materialized listing fields, in the order _summary() expects them
+_SUMMARY_FIELDS = ('rowid', 'key', 'conversation_id', 'message_count', 'first_prompt',
+                   'workspace', 'full_path', 'agent', 'created_at', 'updated_at', 'time_source')
+_SUMMARY_COLUMNS = ", ".join(_SUMMARY_FIELDS)
+
+# Most host parameters bound in one statement (SQLite's historic default limit)
+_MAX_VARIABLES = 999
+
+_HIGHLIGHT_START = "\x02"
+_HIGHLIGHT_END = "\x03"
+
+
+def default_cache_dir() -> Path:
+    """Return the directory used for derived index files."""
+    xdg_cache = os.environ.get("XDG_CACHE_HOME")
+    if xdg_cache:
+        return Path(xdg_cache) / "q-history-mcp"
+    return Path.home() / ".cache" / "q-history-mcp"
+
+
+def default_index_path(db_path: str) -> Path:
+    """Return the sidecar index path for a given Q CLI database."""
+    digest = hashlib.sha1(str(Path(db_path).resolve()).encode("utf-8")).hexdigest()[:12]
+    return default_cache_dir() / f"index-{digest}.sqlite3"
+
+
+def _content_hash(value: Any) -> str:
+    """Hash a raw ``value`` column the way the index keys changes."""
+    if isinstance(value, str):
+        value = value.encode("utf-8", "surrogatepass")
+    return hashlib.sha1(value).hexdigest()
+
+
+class HistoryIndex:
+    """Derived, incrementally synced index over the Q CLI conversations table."""
+
+    def __init__(self, source_path: str, index_path: Optional[str] = None,
+                 source_connections: Optional[ThreadLocalConnections] = None,
+                 scan_pool: Optional[ScanPool] = None):
+        """Open (creating if needed) the sidecar index for ``source_path``.
+
+        With a ``scan_pool``, changed conversations are parsed in its worker
+        processes instead of inline.
+        """
+        self.source_path = source_path
+        self.scan_pool = scan_pool
+        self.index_path = Path(index_path) if index_path else default_index_path(source_path)
+        self._sync_lock = threading.Lock()
+        self._source = source_connections or read_only_connections(source_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connections = ThreadLocalConnections(
+            str(self.index_path), pragmas=("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"))
+        with self.connect() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                self._reset(conn)
+            self.has_fts = _has_table(conn, 'messages_fts')
+            self.has_trigram = _has_table(conn, 'messages_trigram')
+
+    def connect(self) -> sqlite3.Connection:
+        """Return this thread's connection to the index database."""
+        return self._connections.get()
+
+    def close(self) -> None:
+        """Close the index connections held by every thread."""
+        self._connections.close()
+
+    def _reset(self, conn: sqlite3.Connection) -> None:
+        """Drop every index table and recreate the current schema."""
+        # Virtual tables first so their shadow tables go with them
+        objects = conn.execute(
+            "SELECT type, name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY sql LIKE 'CREATE VIRTUAL%' DESC").fetchall()
+        for object_type, name in objects:
+            conn.execute(f'DROP {object_type.upper()} IF EXISTS "{name}"')
+        conn.executescript(_SCHEMA)
+        for schema in (_FTS_SCHEMA, _TRIGRAM_SCHEMA):
+            try:
+                conn.executescript(schema)
+            except sqlite3.OperationalError:
+                # FTS5 or its trigram tokenizer is missing from this SQLite
+                # build; searches fall back to scanning the messages table
+                pass
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+    def _source_signature(self) -> str:
+        """Cheap fingerprint of the source database files."""
+        parts = []
+        for suffix in ("", "-wal"):
+            try:
+                st = os.stat(self.source_path + suffix)
+                parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+            except OSError:
+                parts.append("-")
+        return "|".join(parts)
+
+    def sync(self) -> int:
+        """Bring the index up to date with the source database.
+
+        Returns the number of conversations that were (re)parsed.
+        """
+        with self._sync_lock:
+            signature = self._source_signature()
+            with self.connect() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE name = 'source_signature'").fetchone()
+                if row and row[0] == signature:
+                    return 0
+
+                known = {
+                    rowid: (content_hash, first_seen)
+                    for rowid, content_hash, first_seen in conn.execute(
+                        "SELECT rowid, content_hash, first_seen FROM conversations")
+                }
+                now = time.time()
+                changed = 0
+                pending = {}
+                # Net change to the vocabulary's word counts, applied once at the end
+                terms: Counter = Counter()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    source = self._source.get()
+                    for rowid, key, value in source.execute("SELECT rowid, key, value FROM conversations"):
+                        content_hash = _content_hash(value)
+                        previous_hash, first_seen = known.pop(rowid, (None, now))
+                        if previous_hash == content_hash:
+                            continue
+                        if self.scan_pool is not None:
+                            pending[rowid] = (content_hash, first_seen)
+                        else:
+                            self._store(conn, rowid, parse_conversation_value(value, key), content_hash,
+                                        first_seen, now, terms)
+                        changed += 1
+                    if pending:
+                        for rowid, conversation in self.scan_pool.parse(list(pending)):
+                            content_hash, first_seen = pending[rowid]
+                            self._store(conn, rowid, conversation, content_hash, first_seen, now, terms)
+                    for rowid in known:
+                        self._delete(conn, rowid, terms)
+                    self._update_vocabulary(conn, terms)
+                    conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('source_signature', ?)",
+                                 (signature,))
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                return changed + len(known)
+
+    def sync_signature(self) -> str:
+        """Fingerprint of the source as of the last sync ('' before the first); changes with the content."""
+        row = self.connect().execute("SELECT value FROM meta WHERE name = 'source_signature'").fetchone()
+        return row[0] if row else ''
+
+    def _delete(self, conn: sqlite3.Connection, rowid: int, terms: Counter) -> None:
+        """Remove every row derived from a source conversation.
+
+        Its messages' words are subtracted from ``terms``, the pending
+        change to the vocabulary.
+        """
+        terms.subtract(message_terms(body for body, in conn.execute(
+            "SELECT body FROM messages WHERE conversation_rowid = ?", (rowid,))))
+        if self.has_fts:
+            conn.execute(
+                "INSERT INTO messages_fts (messages_fts, rowid, prompt, response, tool_use, tool_result) "
+                "SELECT 'delete', id, prompt, response, tool_use, tool_result FROM messages_fts_content "
+                "WHERE conversation_rowid = ?", (rowid,))
+        if self.has_trigram:
+            conn.execute(
+                "INSERT INTO messages_trigram (messages_trigram, rowid, body) "
+                "SELECT 'delete', id, body FROM messages WHERE conversation_rowid = ?", (rowid,))
+        conn.execute("DELETE FROM conversations WHERE rowid = ?", (rowid,))
+        conn.execute("DELETE FROM messages WHERE conversation_rowid = ?", (rowid,))
+        conn.execute("DELETE FROM tool_uses WHERE conversation_rowid = ?", (rowid,))
+
+    def _store(self, conn: sqlite3.Connection, rowid: int, conversation: Conversation, content_hash: str,
+               first_seen: float, changed_at: float, terms: Counter) -> None:
+        """Replace the index rows of one source conversation.
+
+        Unparseable rows are stored too, without messages, so they are not
+        retried on every sync.
+        """
+        self._delete(conn, rowid, terms)
+        message_terms((message.body for message in conversation.messages), terms)
+        if conversation.created_at is not None:
+            created_at, updated_at, time_source = conversation.created_at, conversation.updated_at, 'history'
+        else:
+            created_at, updated_at, time_source = first_seen, changed_at, 'first_seen'
+        role_counts = conversation.role_counts
+        conn.execute(
+            "INSERT INTO conversations (rowid, key, conversation_id, content_hash, message_count, user_count, "
+            "assistant_count, tool_count, first_prompt, workspace, full_path, agent, created_at, updated_at, "
+            "first_seen, changed_at, time_source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (rowid, conversation.key, conversation.conversation_id, content_hash, conversation.message_count,
+             role_counts['user'], role_counts['assistant'], role_counts['tool'], conversation.first_prompt,
+             conversation.workspace, conversation.full_path, conversation.agent, created_at, updated_at,
+             first_seen, changed_at, time_source))
+        conn.executemany(
+            "INSERT INTO messages (conversation_rowid, seq, role, kind, body, timestamp, message_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(rowid, message.seq, message.role, message.kind, message.body, message.timestamp, message.message_id)
+             for message in conversation.messages])
+        if self.has_fts:
+            conn.execute(
+                "INSERT INTO messages_fts (rowid, prompt, response, tool_use, tool_result) "
+                "SELECT id, prompt, response, tool_use, tool_result FROM messages_fts_content "
+                "WHERE conversation_rowid = ?", (rowid,))
+        if self.has_trigram:
+            conn.execute(
+                "INSERT INTO messages_trigram (rowid, body) "
+                "SELECT id, body FROM messages WHERE conversation_rowid = ?", (rowid,))
+        conn.executemany(
+            "INSERT INTO tool_uses (conversation_rowid, seq, tool_use_id, name, args) VALUES (?, ?, ?, ?, ?)",
+            [(rowid, message.seq, tool_use.id, tool_use.name, json.dumps(tool_use.args, ensure_ascii=False))
+             for message in conversation.messages for tool_use in message.tool_uses])
+
+    def _update_vocabulary(self, conn: sqlite3.Connection, changes: Counter) -> None:
+        """Add ``changes`` (negative counts remove) to the vocabulary's message counts.
+
+        Words whose count drops to zero leave the vocabulary along with
+        their trigrams; new words are filed under theirs. Words too short
+        or too long to correct are skipped.
+        """
+        changes = {term: change for term, change in changes.items()
+                   if change and MIN_LENGTH <= len(term) <= MAX_LENGTH}
+        stored = _vocabulary_rows(conn, list(changes))
+        updated, removed, added = [], [], []
+        for term, change in changes.items():
+            if term in stored:
+                term_id, messages = stored[term]
+                if messages + change > 0:
+                    updated.append((messages + change, term_id))
+                else:
+                    removed.append((term_id, term))
+            elif change > 0:
+                added.append((term, change))
+        conn.executemany("UPDATE vocabulary SET messages = ? WHERE id = ?", updated)
+        conn.executemany("DELETE FROM vocabulary WHERE id = ?", [(term_id,) for term_id, _ in removed])
+        conn.executemany("DELETE FROM vocabulary_trigrams WHERE trigram = ? AND term_id = ?",
+                         [(trigram, term_id) for term_id, term in removed for trigram in trigrams(term)])
+        conn.executemany("INSERT INTO vocabulary (term, messages) VALUES (?, ?)", added)
+        added_ids = _vocabulary_rows(conn, [term for term, _ in added])
+        conn.executemany("INSERT INTO vocabulary_trigrams (trigram, term_id) VALUES (?, ?)",
+                         [(trigram, added_ids[term][0]) for term, _ in added for trigram in trigrams(term)])
+
+    def expand_terms(self, query: str) -> List[List[str]]:
+        """Alternatives of every whitespace-separated term of ``query``, for fuzzy search.
+
+        Each list starts with the term itself. A term that is a single word
+        is followed by up to MAX_EXPANSIONS vocabulary words within
+        :func:`~q_history_mcp.vocabulary.max_edits` of it that occur in over
+        CORRECTION_RATIO times as many messages: those at the smallest
+        distance found, most frequent first.
+        """
+        expanded = []
+        with self.connect() as conn:
+            for term in query.split():
+                found = words(term)
+                alternatives = [term]
+                if len(found) == 1 and max_edits(found[0]):
+                    alternatives += self._corrections(conn, found[0])
+                expanded.append(alternatives)
+        return expanded
+
+    def _corrections(self, conn: sqlite3.Connection, word: str) -> List[str]:
+        """Vocabulary words close to ``word`` and far more frequent than it; see :meth:`expand_terms`."""
+        edits = max_edits(word)
+        row = conn.execute("SELECT messages FROM vocabulary WHERE term = ?", (word,)).fetchone()
+        own_count = row[0] if row else 0
+        word_trigrams = sorted(trigrams(word))
+        candidates = conn.execute(
+            f"""
+            SELECT v.term, v.messages
+            FROM (SELECT term_id FROM vocabulary_trigrams
+                  WHERE trigram IN ({_placeholders(word_trigrams)})
+                  GROUP BY term_id HAVING COUNT(*) >= ?) t
+            JOIN vocabulary v ON v.id = t.term_id
+            WHERE v.messages > ? AND length(v.term) BETWEEN ? AND ?
+            """,
+            word_trigrams + [max(1, len(word_trigrams) - 4 * edits), own_count * CORRECTION_RATIO,
+                             len(word) - edits, len(word) + edits]).fetchall()
+        scored = []
+        for term, messages in candidates:
+            distance = edit_distance(word, term, edits)
+            if 0 < distance <= edits:
+                scored.append((distance, -messages, term))
+        if not scored:
+            return []
+        closest = min(distance for distance, _, _ in scored)
+        return [term for distance, _, term in sorted(scored) if distance == closest][:MAX_EXPANSIONS]
+
+    def lookup(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Summary of the newest indexed conversation with this id (one index seek)."""
+        row = self.connect().execute(
+            f"SELECT {_SUMMARY_COLUMNS} FROM conversations WHERE conversation_id = ? "
+            f"ORDER BY rowid DESC LIMIT 1", (conversation_id,)).fetchone()
+        return _summary(row) if row else None
+
+    def messages(self, rowid: int, roles: Tuple[str, ...] = CONVERSATION_ROLES, offset: int = 0,
+                 limit: Optional[int] = None, from_end: bool = False) -> List[Message]:
+        """Indexed messages of one conversation in order, limited to ``roles``.
+
+        Only ``limit`` messages after skipping ``offset`` are read, counted
+        from the last message backwards when ``from_end`` is set; either way
+        they are returned oldest first.
+        """
+        order = "DESC" if from_end else "ASC"
+        cursor = self.connect().execute(
+            f"SELECT seq, role, kind, body, timestamp, message_id FROM messages "
+            f"WHERE conversation_rowid = ? AND role IN ({_placeholders(roles)}) "
+            f"ORDER BY seq {order} LIMIT ? OFFSET ?",
+            (rowid,) + tuple(roles) + (-1 if limit is None else limit, offset))
+        messages = [
+            Message(seq, role, kind, body, timestamp=timestamp, message_id=message_id)
+            for seq, role, kind, body, timestamp, message_id in cursor
+        ]
+        if from_end:
+            messages.reverse()
+        return messages
+
+    def message(self, rowid: int, seq: int) -> Optional[Message]:
+        """The indexed message ``seq`` of one conversation, of any role (one index seek)."""
+        row = self.connect().execute(
+            "SELECT seq, role, kind, body, timestamp, message_id FROM messages "
+            "WHERE conversation_rowid = ? AND seq = ?", (rowid, seq)).fetchone()
+        if row is None:
+            return None
+        seq, role, kind, body, timestamp, message_id = row
+        return Message(seq, role, kind, body, timestamp=timestamp, message_id=message_id)
+
+    def message_bodies(self, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], str]:
+        """Bodies of the messages at ``(conversation_rowid, seq)`` keys, one index seek each."""
+        conn = self.connect()
+        bodies = {}
+        for key in keys:
+            row = conn.execute("SELECT body FROM messages WHERE conversation_rowid = ? AND seq = ?", key).fetchone()
+            if row is not None:
+                bodies[key] = row[0]
+        return bodies
+
+    def conversation_rowids(self, filters: ConversationFilter) -> List[int]:
+        """Rowids of the conversations passing ``filters``."""
+        where, params = filters.sql(_FILTER_COLUMNS)
+        return [row[0] for row in self.connect().execute(f"SELECT c.rowid FROM conversations c WHERE {where}", params)]
+
+    def summaries(self, rowids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Listing summaries of the given conversations, keyed by rowid."""
+        return self._conversation_details(self.connect(), rowids)
+
+    def list_conversations(self, limit: int, filters: Optional[ConversationFilter] = None,
+                           before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Newest conversations with at least one counted message that pass ``filters``.
+
+        Reads only the materialized summary columns, walking the primary key
+        backwards from ``before`` (exclusive), or the ``updated_at`` index
+        for date ranges, so the cost does not depend on conversation sizes.
+        """
+        filters = filters or ConversationFilter()
+        where, params = _keyset_sql(filters, before)
+        # With a date range, a unary + keeps the planner from walking the
+        # primary key so it range-scans conversations_by_updated instead
+        order = "+c.rowid" if filters.has_time_range else "c.rowid"
+        with self.connect() as conn:
+            cursor = conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS} FROM conversations c "
+                f"WHERE c.message_count > 0 AND {where} ORDER BY {order} DESC LIMIT ?", params + [limit])
+            return [_summary(row) for row in cursor]
+
+    def search(self, query: str, limit: int, filters: Optional[ConversationFilter] = None,
+               before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Case-insensitive substring search over indexed message text.
+
+        Matches exactly what ``query.lower() in body.lower()`` would, newest
+        conversation first starting below rowid ``before``, among the
+        messages and conversations ``filters`` allows. ASCII queries of three
+        or more characters only verify messages that contain every trigram
+        of the query; anything else falls back to scanning the messages table.
+        """
+        filters = filters or ConversationFilter()
+        where, params = _keyset_sql(filters, before)
+        roles = filters.roles
+        query_lower = query.lower()
+        matches = {}
+        with self.connect() as conn:
+            if self.has_trigram and len(query_lower) >= 3 and query_lower.isascii():
+                candidates = conn.execute(
+                    """
+                    SELECT m.conversation_rowid, m.role, m.body
+                    FROM messages_trigram
+                    JOIN messages m ON m.id = messages_trigram.rowid
+                    JOIN conversations c ON c.rowid = m.conversation_rowid
+                    WHERE messages_trigram MATCH ?
+                      AND m.role IN ({roles})
+                      AND {where}
+                    ORDER BY m.conversation_rowid DESC, m.seq
+                    """.format(roles=_placeholders(roles), where=where),
+                    [_trigram_query(query_lower)] + list(roles) + params)
+            else:
+                candidates = self._scan_messages(conn, roles, where, params)
+
+            for conv_rowid, role, body in candidates:
+                if query_lower not in body.lower():
+                    continue
+                if conv_rowid not in matches:
+                    if len(matches) >= limit:
+                        break
+                    matches[conv_rowid] = []
+                matches[conv_rowid].append((role, body))
+
+            details = self._conversation_details(conn, list(matches))
+
+        return [
+            dict(details[rowid], matches=conversation_matches)
+            for rowid, conversation_matches in matches.items()
+        ]
+
+    def _conversation_details(self, conn: sqlite3.Connection, rowids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Summaries of the given conversations, keyed by rowid."""
+        if not rowids:
+            return {}
+        cursor = conn.execute(
+            f"SELECT {_SUMMARY_COLUMNS} FROM conversations WHERE rowid IN ({_placeholders(rowids)})",
+            tuple(rowids))
+        return {row[0]: _summary(row) for row in cursor}
+
+    def _scan_messages(self, conn: sqlite3.Connection, roles: Tuple[str, ...], where: str, params: List[Any]):
+        """Yield ``(conversation_rowid, role, body)`` of ``roles`` messages, newest conversation first.
+
+        Only conversations matching the SQL condition ``where`` are read.
+        """
+        rowids = [row[0] for row in conn.execute(
+            f"SELECT c.rowid FROM conversations c WHERE {where} ORDER BY c.rowid DESC", params)]
+        for rowid in rowids:
+            for role, body in conn.execute(
+                    f"SELECT role, body FROM messages WHERE conversation_rowid = ? AND role IN "
+                    f"({_placeholders(roles)}) ORDER BY seq", (rowid,) + tuple(roles)):
+                yield rowid, role, body
+
+    def search_ranked(self, query: str, limit: int, filters: Optional[ConversationFilter] = None,
+                      after: Optional[Tuple[float, int]] = None, rowids: Optional[List[int]] = None,
+                      matches: bool = True, terms: Optional[List[List[str]]] = None) -> List[Dict[str, Any]]:
+        """BM25-ranked full-text search, best conversations first.
+
+        Ties are broken by rowid. ``after`` is the ``(rank, rowid)`` of the
+        last hit of the previous page; ``rowids`` restricts the search to
+        those conversations. Each hit carries its ``rank`` and up to three
+        best-matching messages with an FTS5 snippet and the character
+        offsets of every highlighted term. With ``matches=False`` hits hold
+        only ``rowid``, ``rank``, ``score`` and ``match_count``, which skips
+        building snippets and highlights. ``terms`` (see
+        :meth:`expand_terms`) replaces the query's own terms: messages must
+        then contain any one alternative of every term.
+        """
+        filters = filters or ConversationFilter()
+        fts_query = _fts_query(query) if terms is None else _alternatives_query(terms)
+        if not fts_query:
+            return []
+        # Tool output is only searched on request
+        columns = " ".join(_ROLE_FTS_COLUMNS[role] for role in filters.roles)
+        fts_query = "{" + columns + "} : (" + fts_query + ")"
+        where, params = filters.sql(_FILTER_COLUMNS)
+        having, having_params = "1", []
+        if after is not None:
+            having = "MIN(messages_fts.rank) > ? OR (MIN(messages_fts.rank) = ? AND m.conversation_rowid > ?)"
+            having_params = [after[0], after[0], after[1]]
+        if rowids is not None:
+            where += f" AND c.rowid IN ({_placeholders(rowids)})"
+            params.extend(rowids)
+        with self.connect() as conn:
+            conversations = conn.execute(
+                f"""
+                SELECT m.conversation_rowid, c.key, c.conversation_id, MIN(messages_fts.rank), COUNT(*)
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN conversations c ON c.rowid = m.conversation_rowid
+                WHERE messages_fts MATCH ? AND {where}
+                GROUP BY m.conversation_rowid
+                HAVING {having}
+                ORDER BY MIN(messages_fts.rank), m.conversation_rowid
+                LIMIT ?
+                """, [fts_query] + params + having_params + [limit]).fetchall()
+            if not conversations:
+                return []
+            if not matches:
+                return [{'rowid': rowid, 'rank': rank, 'score': -rank, 'match_count': match_count}
+                        for rowid, key, conv_id, rank, match_count in conversations]
+
+            rowids = [row[0] for row in conversations]
+            placeholders = _placeholders(rowids)
+            best = {}
+            cursor = conn.execute(
+                f"""
+                SELECT m.conversation_rowid, m.seq, m.role, m.kind,
+                       snippet(messages_fts, -1, '[', ']', '...', 24),
+                       highlight(messages_fts, 0, ?, ?),
+                       highlight(messages_fts, 1, ?, ?),
+                       highlight(messages_fts, 2, ?, ?),
+                       highlight(messages_fts, 3, ?, ?)
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ?
+                  AND messages_fts.rowid IN (SELECT id FROM messages WHERE conversation_rowid IN ({placeholders}))
+                ORDER BY messages_fts.rank
+                """,
+                (_HIGHLIGHT_START, _HIGHLIGHT_END) * 4 + (fts_query,) + tuple(rowids))
+            for conv_rowid, seq, role, kind, snippet, *highlighted in cursor:
+                hits = best.setdefault(conv_rowid, [])
+                if len(hits) < 3:
+                    hits.append({
+                        'seq': seq,
+                        'role': role,
+                        'snippet': snippet,
+                        'offsets': _highlight_offsets(highlighted[_FTS_COLUMNS[kind]] or ""),
+                    })
+
+            details = self._conversation_details(conn, rowids)
+
+        return [
+            dict(details[rowid], rank=rank, score=-rank, match_count=match_count, matches=best.get(rowid, []))
+            for rowid, key, conv_id, rank, match_count in conversations
+        ]
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    """Whether the index database contains a table with this name."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def _vocabulary_rows(conn: sqlite3.Connection, terms: List[str]) -> Dict[str, Tuple[int, int]]:
+    """``(id, messages)`` of the given words that are in the vocabulary, keyed by word."""
+    rows = {}
+    for start in range(0, len(terms), _MAX_VARIABLES):
+        batch = terms[start:start + _MAX_VARIABLES]
+        rows.update((term, (term_id, messages)) for term_id, term, messages in conn.execute(
+            f"SELECT id, term, messages FROM vocabulary WHERE term IN ({_placeholders(batch)})", batch))
+    return rows
+
+
+def _keyset_sql(filters: ConversationFilter, before: Optional[int]) -> Tuple[str, List[Any]]:
+    """SQL condition on ``c`` for ``filters`` and rowids below ``before``."""
+    where, params = filters.sql(_FILTER_COLUMNS)
+    if before is not None:
+        where += " AND c.rowid < ?"
+        params.append(before)
+    return where, params
+
+
+def _summary(row: Tuple) -> Dict[str, Any]:
+    """Dict of a row selected as ``_SUMMARY_COLUMNS``."""
+    return dict(zip(_SUMMARY_FIELDS, row))
+
+
+def _placeholders(values) -> str:
+    """``?, ?, ...`` with one placeholder per value."""
+    return ", ".join("?" * len(values))
+
+
+def _trigram_query(query_lower: str) -> str:
+    """FTS5 query requiring every distinct trigram of the (lowercased) query."""
+    trigrams = sorted({query_lower[i:i + 3] for i in range(len(query_lower) - 2)})
+    return " AND ".join('"' + trigram.replace('"', '""') + '"' for trigram in trigrams)
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query that ANDs every quoted term."""
+    terms = query.split()
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _alternatives_query(terms: List[List[str]]) -> str:
+    """FTS5 query that ANDs every term, each matching any one of its quoted alternatives."""
+    return " AND ".join(
+        "(" + " OR ".join('"' + term.replace('"', '""') + '"' for term in alternatives) + ")"
+        for alternatives in terms if alternatives)
+
+
+def _highlight_offsets(highlighted: str) -> List[Tuple[int, int]]:
+    """Recover ``(start, end)`` offsets of highlighted terms in the original text."""
+    offsets = []
+    position = 0
+    start = None
+    for char in highlighted:
+        if char == _HIGHLIGHT_START:
+            start = position
+        elif char == _HIGHLIGHT_END:
+            if start is not None:
+                offsets.append((start, position))
+            start = None
+        else:
+            position += 1
+    return offsets
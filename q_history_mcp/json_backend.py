@@ -0,0 +1,103 @@
+"""JSON decoding with the fastest available backend.
+
+Decoding ConversationState blobs dominates the cost of parsing Q CLI history,
+so every parsing site goes through :func:`loads`. orjson or msgspec are used
+when installed, otherwise the standard library. Set ``Q_HISTORY_JSON_BACKEND``
+to ``orjson``, ``msgspec`` or ``json`` to force a backend; an unknown or
+uninstalled one falls back to the standard library with a warning.
+"""
+
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, IO, List, Union
+
+JsonInput = Union[str, bytes, bytearray, memoryview]
+
+# Tried in this order when no backend is forced
+PREFERENCE = ("orjson", "msgspec", "json")
+
+
+def _stdlib_loads() -> Callable[[JsonInput], Any]:
+    return json.loads
+
+
+def _orjson_loads() -> Callable[[JsonInput], Any]:
+    import orjson
+
+    def loads(data: JsonInput) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects some valid documents (e.g. integers beyond
+            # 64 bits); let the stdlib decide and raise for invalid input
+            return json.loads(data)
+
+    return loads
+
+
+def _msgspec_loads() -> Callable[[JsonInput], Any]:
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+
+    def loads(data: JsonInput) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError:
+            # Re-decode with the stdlib so callers see json.JSONDecodeError
+            return json.loads(data)
+
+    return loads
+
+
+_FACTORIES: Dict[str, Callable[[], Callable[[JsonInput], Any]]] = {
+    "orjson": _orjson_loads,
+    "msgspec": _msgspec_loads,
+    "json": _stdlib_loads,
+}
+
+
+def get_loads(backend: str) -> Callable[[JsonInput], Any]:
+    """Return the decode function of a named backend.
+
+    Raises ImportError if the backend's package is not installed.
+    """
+    if backend not in _FACTORIES:
+        raise ValueError(f"Unknown JSON backend {backend!r}; expected one of {', '.join(PREFERENCE)}")
+    return _FACTORIES[backend]()
+
+
+def available_backends() -> List[str]:
+    """Names of the backends that can be imported here, fastest first."""
+    available = []
+    for backend in PREFERENCE:
+        try:
+            get_loads(backend)
+        except ImportError:
+            continue
+        available.append(backend)
+    return available
+
+
+def _select_backend() -> str:
+    forced = os.environ.get("Q_HISTORY_JSON_BACKEND")
+    if forced:
+        try:
+            get_loads(forced)
+            return forced
+        except (ImportError, ValueError) as e:
+            # Only a speed-up: never keep the server from starting over it
+            print(f"Q_HISTORY_JSON_BACKEND={forced} is not usable ({e}); decoding with the stdlib json",
+                  file=sys.stderr)
+            return "json"
+    return available_backends()[0]
+
+
+BACKEND = _select_backend()
+loads = get_loads(BACKEND)
+
+
+def load(fp: IO) -> Any:
+    """Decode a JSON document from an open file."""
+    return loads(fp.read())
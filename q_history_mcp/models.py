@@ -0,0 +1,317 @@
+"""Normalized conversation model shared by every tool.
+
+Q CLI has written ``history`` in two shapes over time: old entries are
+``{"user": ..., "assistant": ..., "request_metadata": ...}`` objects, newer
+ones are ``[user, assistant]`` lists. :func:`parse_conversation` walks either
+shape once and produces the compact classes below, so listing, search,
+details and export all see the same messages.
+"""
+
+import datetime
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from q_history_mcp import json_backend
+
+# Roles whose messages count towards message_count and are searched by default
+CONVERSATION_ROLES = ("user", "assistant")
+
+# Every message role; 'tool' messages carry tool results
+MESSAGE_ROLES = ("user", "assistant", "tool")
+
+# request_metadata fields holding epoch milliseconds
+REQUEST_TIME_FIELDS = ("request_start_timestamp_ms", "stream_end_timestamp_ms")
+
+_FRACTION = re.compile(r'\.([0-9]+)')
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds of an RFC 3339 timestamp string, or None.
+
+    Accepts the ``Z`` suffix and any number of fractional digits (Q CLI
+    writes nanoseconds); times without an offset are taken as UTC. The
+    result is rounded to milliseconds.
+    """
+    if not isinstance(value, str) or not value[:4].isdigit():
+        return None
+    text = _FRACTION.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), value.strip(), count=1)
+    if text[-1:] in ("Z", "z"):
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return round(parsed.timestamp(), 3)
+
+
+def parse_epoch_ms(value: Any) -> Optional[float]:
+    """Epoch seconds of a number of epoch milliseconds, or None."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+        return round(value / 1000.0, 3)
+    return None
+
+
+class ToolUse:
+    """A tool call issued by an assistant message."""
+
+    __slots__ = ("id", "name", "args")
+
+    def __init__(self, id: Optional[str], name: Optional[str], args: Any):
+        self.id = id
+        self.name = name
+        self.args = args
+
+
+class ToolResult:
+    """The output of one tool call, as sent back by the client."""
+
+    __slots__ = ("tool_use_id", "status", "text")
+
+    def __init__(self, tool_use_id: Optional[str], status: Optional[str], text: str):
+        self.tool_use_id = tool_use_id
+        self.status = status
+        self.text = text
+
+
+class Message:
+    """One message of a conversation.
+
+    ``role`` is ``user``, ``assistant`` or ``tool``; ``kind`` is ``prompt``,
+    ``response``, ``tool_use`` or ``tool_result``.
+    """
+
+    __slots__ = ("seq", "role", "kind", "body", "timestamp", "message_id", "tool_uses", "tool_results")
+
+    def __init__(self, seq: int, role: str, kind: str, body: str,
+                 timestamp: Optional[str] = None, message_id: Optional[str] = None,
+                 tool_uses: Optional[List[ToolUse]] = None, tool_results: Optional[List[ToolResult]] = None):
+        self.seq = seq
+        self.role = role
+        self.kind = kind
+        self.body = body
+        self.timestamp = timestamp
+        self.message_id = message_id
+        self.tool_uses = tool_uses or []
+        self.tool_results = tool_results or []
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Message in the shape returned by the conversation detail tools."""
+        if self.role == "user":
+            return {'type': 'prompt', 'body': self.body, 'timestamp': self.timestamp or ''}
+        if self.role == "tool":
+            return {'type': 'tool_result', 'body': self.body}
+        return {'type': 'answer', 'body': self.body, 'message_id': self.message_id or ''}
+
+
+def full_path_from_key(key: str) -> str:
+    """Workspace directory a conversation key refers to."""
+    return key.split('|')[0] if '|' in key else key
+
+
+def workspace_from_key(key: str) -> str:
+    """Short workspace name for a conversation key."""
+    workspace = full_path_from_key(key)
+    if workspace.startswith('/'):
+        workspace = workspace.split('/')[-1] or workspace.split('/')[-2]
+    return workspace
+
+
+class Conversation:
+    """A parsed conversation: its id, source key, active agent and messages in order.
+
+    ``created_at``/``updated_at`` are the earliest and latest times recorded
+    in the history (epoch seconds), or None when it records none.
+    """
+
+    __slots__ = ("conversation_id", "key", "messages", "agent", "created_at", "updated_at")
+
+    def __init__(self, conversation_id: str, key: str, messages: List[Message], agent: Optional[str] = None,
+                 created_at: Optional[float] = None, updated_at: Optional[float] = None):
+        self.conversation_id = conversation_id
+        self.key = key
+        self.messages = messages
+        self.agent = agent
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def message_count(self) -> int:
+        """Number of user and assistant messages."""
+        return sum(1 for message in self.messages if message.role in CONVERSATION_ROLES)
+
+    @property
+    def role_counts(self) -> Dict[str, int]:
+        """Number of messages of each role in MESSAGE_ROLES."""
+        counts = dict.fromkeys(MESSAGE_ROLES, 0)
+        for message in self.messages:
+            counts[message.role] += 1
+        return counts
+
+    @property
+    def first_prompt(self) -> Optional[str]:
+        """Body of the first user message, if any."""
+        for message in self.messages:
+            if message.role == "user":
+                return message.body
+        return None
+
+    def text_matches(self, query_lower: str,
+                     roles: Tuple[str, ...] = CONVERSATION_ROLES) -> List[Tuple[str, str]]:
+        """``(role, body)`` of messages in ``roles`` containing ``query_lower``, case-insensitively."""
+        return [
+            (message.role, message.body) for message in self.messages
+            if message.role in roles and query_lower in message.body.lower()
+        ]
+
+    @property
+    def workspace(self) -> str:
+        """Short workspace name derived from the key."""
+        return workspace_from_key(self.key)
+
+    @property
+    def full_path(self) -> str:
+        """Workspace directory derived from the key."""
+        return full_path_from_key(self.key)
+
+
+def _agent_name(conv_data: Dict[str, Any]) -> Optional[str]:
+    """Agent (context profile) the conversation was held with, if recorded."""
+    context_manager = conv_data.get('context_manager')
+    if isinstance(context_manager, dict) and isinstance(context_manager.get('current_profile'), str):
+        return context_manager['current_profile'] or None
+    return None
+
+
+def _tool_use_text(tool_use: Dict[str, Any]) -> str:
+    """Pick the displayable text of a ToolUse assistant message."""
+    if 'response' in tool_use:
+        return str(tool_use['response'])
+    elif 'content' in tool_use:
+        return str(tool_use['content'])
+    elif 'result' in tool_use:
+        return str(tool_use['result'])
+    return ""
+
+
+def _prompt_text(prompt_data: Any) -> Optional[str]:
+    """The ``prompt`` string of a Prompt/CancelledToolUses payload, if any."""
+    if isinstance(prompt_data, dict) and isinstance(prompt_data.get('prompt'), str):
+        return prompt_data['prompt']
+    return None
+
+
+def _tool_result_text(result: Dict[str, Any]) -> str:
+    """Flatten the Text/Json content blocks of a tool result."""
+    parts = []
+    for block in result.get('content') or []:
+        if isinstance(block, dict):
+            if 'Text' in block:
+                parts.append(str(block['Text']))
+            elif 'Json' in block:
+                parts.append(json.dumps(block['Json'], ensure_ascii=False))
+    return "\n".join(parts)
+
+
+class _Builder:
+    """Accumulates messages while walking one conversation's history."""
+
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.created_at: Optional[float] = None
+        self.updated_at: Optional[float] = None
+
+    def note_time(self, when: Optional[float]) -> None:
+        """Widen the conversation's time span to include ``when``."""
+        if when is None:
+            return
+        if self.created_at is None or when < self.created_at:
+            self.created_at = when
+        if self.updated_at is None or when > self.updated_at:
+            self.updated_at = when
+
+    def request_metadata(self, metadata: Any) -> None:
+        if isinstance(metadata, dict):
+            for field in REQUEST_TIME_FIELDS:
+                self.note_time(parse_epoch_ms(metadata.get(field)))
+
+    def add(self, role: str, kind: str, body: str, **fields) -> None:
+        self.messages.append(Message(len(self.messages), role, kind, body, **fields))
+
+    def user(self, user_msg: Any) -> None:
+        if not isinstance(user_msg, dict):
+            return
+        timestamp = user_msg.get('timestamp') or None
+        self.note_time(parse_timestamp(timestamp))
+        content = user_msg.get('content')
+        if not isinstance(content, dict):
+            return
+        prompt = _prompt_text(content.get('Prompt')) or _prompt_text(content.get('CancelledToolUses'))
+        if prompt:
+            self.add('user', 'prompt', prompt, timestamp=timestamp)
+        results_data = content.get('ToolUseResults') or content.get('CancelledToolUses')
+        if isinstance(results_data, dict) and isinstance(results_data.get('tool_use_results'), list) \
+                and results_data['tool_use_results']:
+            results = [
+                ToolResult(result.get('tool_use_id'), result.get('status'), _tool_result_text(result))
+                for result in results_data['tool_use_results'] if isinstance(result, dict)
+            ]
+            self.add('tool', 'tool_result', "\n".join(result.text for result in results if result.text),
+                     timestamp=timestamp, tool_results=results)
+
+    def assistant(self, assistant_msg: Any) -> None:
+        if not isinstance(assistant_msg, dict):
+            return
+        if 'Response' in assistant_msg:
+            response_data = assistant_msg['Response']
+            if isinstance(response_data, dict) and isinstance(response_data.get('content'), str) \
+                    and response_data['content']:
+                self.add('assistant', 'response', response_data['content'],
+                         message_id=response_data.get('message_id'))
+        elif 'ToolUse' in assistant_msg:
+            tool_use = assistant_msg['ToolUse']
+            if isinstance(tool_use, dict):
+                calls = [
+                    ToolUse(call.get('id'), call.get('name'), call.get('args'))
+                    for call in tool_use.get('tool_uses') or [] if isinstance(call, dict)
+                ]
+                self.add('assistant', 'tool_use', _tool_use_text(tool_use),
+                         message_id=tool_use.get('message_id'), tool_uses=calls)
+
+
+def parse_conversation(conv_data: Dict[str, Any], key: str) -> Conversation:
+    """Build a Conversation from a ConversationState stored under ``key``."""
+    builder = _Builder()
+    for history_entry in conv_data.get('history') or []:
+        if isinstance(history_entry, dict) and 'user' in history_entry:
+            # Old format: user/assistant pairs
+            builder.user(history_entry['user'])
+            builder.assistant(history_entry.get('assistant'))
+            builder.request_metadata(history_entry.get('request_metadata'))
+        elif isinstance(history_entry, list):
+            # New format: list of messages
+            for msg in history_entry:
+                if isinstance(msg, dict) and 'content' in msg:
+                    builder.user(msg)
+                else:
+                    builder.assistant(msg)
+    conv_id = conv_data.get('conversation_id', key.split('/')[-1])
+    return Conversation(conv_id, key, builder.messages, _agent_name(conv_data),
+                        builder.created_at, builder.updated_at)
+
+
+def parse_conversation_value(value: Any, key: str) -> Conversation:
+    """Decode a raw ``value`` column and parse it.
+
+    Rows that are not a ConversationState object yield a Conversation
+    without messages and without an id.
+    """
+    try:
+        conv_data = json_backend.loads(value)
+        if not isinstance(conv_data, dict):
+            raise ValueError("conversation is not a JSON object")
+        return parse_conversation(conv_data, key)
+    except (ValueError, TypeError, AttributeError):
+        return Conversation(None, key, [])
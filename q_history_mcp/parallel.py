@@ -0,0 +1,180 @@
+"""Opt-in process pool for CPU-bound scans of the whole history.
+
+Decoding and walking ConversationState blobs holds the GIL, so a cold index
+build or an unindexed search uses a single core. :class:`ScanPool` shards
+the work by rowid across worker processes; each worker opens its own
+read-only connection, parses its rows and sends back only the compact
+result (parsed conversations or search hits), which the caller merges in
+rowid order.
+
+The pool is disabled unless ``Q_HISTORY_SCAN_PROCESSES`` is set to a
+process count or to ``auto`` (one per CPU).
+"""
+
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import AbstractSet, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from q_history_mcp.connections import ThreadLocalConnections, read_only_connections
+from q_history_mcp.models import CONVERSATION_ROLES, Conversation, parse_conversation_value
+
+# Fewer rows than this are parsed in-process; starting workers costs more
+MIN_PARALLEL_ROWS = 64
+
+# Rows per task when parsing an explicit list of rowids
+PARSE_CHUNK = 256
+
+# Tasks per worker when sharding a full scan, so uneven shards even out
+SHARDS_PER_PROCESS = 4
+
+
+def configured_processes() -> int:
+    """Worker count requested through ``Q_HISTORY_SCAN_PROCESSES`` (0 = disabled)."""
+    value = os.environ.get("Q_HISTORY_SCAN_PROCESSES", "").strip().lower()
+    if not value:
+        return 0
+    if value == "auto":
+        return os.cpu_count() or 1
+    try:
+        return max(0, int(value))
+    except ValueError:
+        raise ValueError(f"Q_HISTORY_SCAN_PROCESSES must be a number or 'auto', not {value!r}") from None
+
+
+# Per-worker-process connections, keyed by database path
+_worker_connections: Dict[str, ThreadLocalConnections] = {}
+
+
+def _worker_connection(db_path: str) -> sqlite3.Connection:
+    if db_path not in _worker_connections:
+        _worker_connections[db_path] = read_only_connections(db_path)
+    return _worker_connections[db_path].get()
+
+
+def _parse_rows(db_path: str, rowids: Sequence[int]) -> List[Tuple[int, Conversation]]:
+    """Worker: parse the given source rows."""
+    placeholders = ", ".join("?" * len(rowids))
+    cursor = _worker_connection(db_path).execute(
+        f"SELECT rowid, key, value FROM conversations WHERE rowid IN ({placeholders})", tuple(rowids))
+    return [(rowid, parse_conversation_value(value, key)) for rowid, key, value in cursor]
+
+
+def _search_shard(db_path: str, low: int, high: int, query_lower: str, limit: int,
+                  roles: Tuple[str, ...] = CONVERSATION_ROLES,
+                  allowed: Optional[AbstractSet[int]] = None) -> List[Dict[str, Any]]:
+    """Worker: newest-first hits in ``roles`` messages among rowids ``low..high``.
+
+    With ``allowed``, other rows are skipped before they are decoded.
+    """
+    hits = []
+    cursor = _worker_connection(db_path).execute(
+        "SELECT rowid, key, value FROM conversations WHERE rowid BETWEEN ? AND ? ORDER BY rowid DESC",
+        (low, high))
+    for rowid, key, value in cursor:
+        if allowed is not None and rowid not in allowed:
+            continue
+        conversation = parse_conversation_value(value, key)
+        matches = conversation.text_matches(query_lower, roles)
+        if matches:
+            hits.append({
+                'rowid': rowid,
+                'key': key,
+                'conversation_id': conversation.conversation_id,
+                'message_count': conversation.message_count,
+                'first_prompt': conversation.first_prompt,
+                'created_at': conversation.created_at,
+                'updated_at': conversation.updated_at,
+                'matches': matches
+            })
+            if len(hits) >= limit:
+                break
+    cursor.close()
+    return hits
+
+
+class ScanPool:
+    """Worker processes that parse and search rowid shards of one Q CLI database."""
+
+    def __init__(self, db_path: str, processes: int):
+        """Remember the database; workers start on first use."""
+        self.db_path = db_path
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that holds SQLite connections and
+            # threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        local = _worker_connections.pop(self.db_path, None)
+        if local is not None:
+            local.close()
+
+    def parse(self, rowids: Sequence[int]) -> Iterator[Tuple[int, Conversation]]:
+        """Parse source rows, yielding them in the given order.
+
+        Short lists are parsed in this process; longer ones are chunked
+        across the workers.
+        """
+        if len(rowids) < MIN_PARALLEL_ROWS:
+            parsed = dict(_parse_rows(self.db_path, rowids)) if rowids else {}
+            for rowid in rowids:
+                if rowid in parsed:
+                    yield rowid, parsed[rowid]
+            return
+        chunks = [rowids[i:i + PARSE_CHUNK] for i in range(0, len(rowids), PARSE_CHUNK)]
+        for chunk, parsed in zip(chunks, self._pool().map(_parse_rows, [self.db_path] * len(chunks), chunks)):
+            by_rowid = dict(parsed)
+            for rowid in chunk:
+                if rowid in by_rowid:
+                    yield rowid, by_rowid[rowid]
+
+    def _shards(self, rowids: List[int]) -> List[List[int]]:
+        """Split descending ``rowids`` into contiguous runs of similar length, newest first."""
+        if not rowids:
+            return []
+        size = -(-len(rowids) // (self.processes * SHARDS_PER_PROCESS))
+        return [rowids[i:i + size] for i in range(0, len(rowids), size)]
+
+    def search(self, conn: sqlite3.Connection, query_lower: str, limit: int,
+               roles: Tuple[str, ...] = CONVERSATION_ROLES, allowed: Optional[AbstractSet[int]] = None,
+               before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Text search of ``roles`` messages across all shards; hits are merged newest first.
+
+        Only rowids below ``before`` and, with ``allowed``, only those rowids
+        are searched.
+        """
+        if allowed is None:
+            rowids = [row[0] for row in conn.execute(
+                "SELECT rowid FROM conversations WHERE rowid < ? ORDER BY rowid DESC",
+                (float("inf") if before is None else before,))]
+        else:
+            rowids = sorted((rowid for rowid in allowed if before is None or rowid < before), reverse=True)
+        futures = [
+            # Workers get a rowid range, plus the rowids themselves when filtered
+            self._pool().submit(_search_shard, self.db_path, shard[-1], shard[0], query_lower, limit, roles,
+                                None if allowed is None else frozenset(shard))
+            for shard in self._shards(rowids)
+        ]
+        hits: List[Dict[str, Any]] = []
+        try:
+            # Shards are newest first, so the first ``limit`` hits in shard
+            # order are the newest overall
+            for future in futures:
+                hits.extend(future.result())
+                if len(hits) >= limit:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+        return hits[:limit]
@@ -0,0 +1,125 @@
+"""In-process cache of listing and search results, dropped whenever the history changes.
+
+Agents often repeat the same ``list_conversations`` and
+``search_conversations`` calls within a few turns. :class:`ResultCache`
+keeps recent results under their normalized arguments and serves them
+for as long as the data they were computed from is unchanged.
+
+Before every lookup the cache takes a fingerprint of the data:
+
+- ``PRAGMA data_version`` on its own connection to data.sqlite3, which
+  changes whenever another connection commits;
+- the size and mtime of data.sqlite3 and of its WAL file;
+- the mtime of the history directory. LokiJS saves a file by writing a
+  temporary copy and renaming it, which touches the directory.
+
+Any difference empties the cache, so a result is never served after its
+data changed. Entries also expire after a TTL and the least recently used
+are evicted beyond ``max_entries``; that only bounds the memory held by
+results nobody asks for again.
+
+Set ``Q_HISTORY_RESULT_CACHE`` to the number of entries to keep (0
+disables the cache).
+"""
+
+import copy
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Optional, Tuple
+
+DEFAULT_ENTRIES = 256
+
+# Seconds an entry is served for, even while the data stays unchanged
+DEFAULT_TTL = 600.0
+
+Fingerprint = Tuple[Any, ...]
+
+
+def configured_entries() -> int:
+    """Cache size requested through ``Q_HISTORY_RESULT_CACHE`` (0 = disabled)."""
+    value = os.environ.get("Q_HISTORY_RESULT_CACHE", "").strip()
+    if not value:
+        return DEFAULT_ENTRIES
+    try:
+        return max(0, int(value))
+    except ValueError:
+        raise ValueError(f"Q_HISTORY_RESULT_CACHE must be a number of entries, not {value!r}") from None
+
+
+def _stat(path: str) -> Tuple[int, int]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return -1, -1
+    return st.st_size, st.st_mtime_ns
+
+
+class ResultCache:
+    """LRU cache with a TTL whose entries are only valid for one fingerprint of the data."""
+
+    def __init__(self, db_path: str, history_dir: Path, max_entries: int = DEFAULT_ENTRIES,
+                 ttl: float = DEFAULT_TTL):
+        self.db_path = db_path
+        self.history_dir = str(history_dir)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._fingerprint: Optional[Fingerprint] = None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def fingerprint(self) -> Optional[Fingerprint]:
+        """The data's current fingerprint, or None if data.sqlite3 cannot be read."""
+        try:
+            if self._conn is None:
+                uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return None
+        return (data_version, _stat(self.db_path), _stat(self.db_path + "-wal"),
+                _stat(self.history_dir)[1])
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[Fingerprint], Optional[Any]]:
+        """``(fingerprint, value)``: a copy of the value cached for ``key``, or None.
+
+        Pass the fingerprint to :meth:`store` with the value computed on a
+        miss, so a result computed while the data changed is not kept.
+        """
+        with self._lock:
+            fingerprint = self.fingerprint()
+            if fingerprint != self._fingerprint:
+                self._entries.clear()
+                self._fingerprint = fingerprint
+            entry = self._entries.get(key)
+            if entry is None:
+                return fingerprint, None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return fingerprint, None
+            self._entries.move_to_end(key)
+            value = entry[1]
+        return fingerprint, copy.deepcopy(value)
+
+    def store(self, key: Hashable, value: Any, fingerprint: Optional[Fingerprint]) -> None:
+        """Cache a copy of ``value`` if the data still has the ``fingerprint`` it was computed from."""
+        if fingerprint is None:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            if fingerprint != self._fingerprint or fingerprint != self.fingerprint():
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -2,10 +2,16 @@
 
 import sys
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from mcp.server.fastmcp import Context, FastMCP
 from pydantic import Field
 
+from q_history_mcp.tool_fields import (
+    CURSOR_DESCRIPTION, DEFAULT_MAX_BYTES, HYBRID_WEIGHT_DESCRIPTION, LIST_ROLE_DESCRIPTION, MAX_BYTES_DESCRIPTION,
+    MIN_MESSAGES_DESCRIPTION, SEARCH_MODE_DESCRIPTION, SEARCH_ROLE_DESCRIPTION, SINCE_DESCRIPTION, UNTIL_DESCRIPTION,
+    WORKSPACE_DESCRIPTION,
+)
+
 # Set up logging
 import logging
 logging.basicConfig(level=logging.ERROR, stream=sys.stderr)
@@ -24,19 +30,29 @@ mcp = FastMCP(
 )
 async def list_conversations(
     ctx: Context,
-    limit: int = Field(20, description='Maximum number of conversations to return')
+    limit: int = Field(20, description='Maximum number of conversations to return'),
+    since: Optional[str] = Field(None, description=SINCE_DESCRIPTION),
+    until: Optional[str] = Field(None, description=UNTIL_DESCRIPTION),
+    workspace: Optional[str] = Field(None, description=WORKSPACE_DESCRIPTION),
+    role: Optional[str] = Field(None, description=LIST_ROLE_DESCRIPTION),
+    min_messages: int = Field(0, description=MIN_MESSAGES_DESCRIPTION),
+    cursor: Optional[str] = Field(None, description=CURSOR_DESCRIPTION)
 ) -> Dict[str, Any]:
     """List recent Q CLI conversations."""
     try:
-        from q_history_mcp.database import QCliDatabase
-        db = QCliDatabase()
-        conversations = await db.list_conversations(limit=limit)
+        from q_history_mcp.database import get_database
+        from q_history_mcp.filters import ConversationFilter
+        filters = ConversationFilter.from_arguments(since, until, workspace, role, min_messages)
+        db = get_database()
+        page = await db.list_conversations_page(limit=limit, filters=filters, cursor=cursor)
+        conversations = page['conversations']
         
         await ctx.info(f"Retrieved {len(conversations)} conversations")
         return {
             "status": "success",
             "conversations": conversations,
-            "count": len(conversations)
+            "count": len(conversations),
+            "next_cursor": page['next_cursor']
         }
     except Exception as e:
         await ctx.error(f"Failed to list conversations: {e}")
@@ -49,21 +65,39 @@ async def list_conversations(
 async def search_conversations(
     ctx: Context,
     query: str = Field(..., description='Search query string'),
-    limit: int = Field(10, description='Maximum number of results to return')
+    limit: int = Field(10, description='Maximum number of results to return'),
+    mode: str = Field('text', description=SEARCH_MODE_DESCRIPTION),
+    since: Optional[str] = Field(None, description=SINCE_DESCRIPTION),
+    until: Optional[str] = Field(None, description=UNTIL_DESCRIPTION),
+    workspace: Optional[str] = Field(None, description=WORKSPACE_DESCRIPTION),
+    role: Optional[str] = Field(None, description=SEARCH_ROLE_DESCRIPTION),
+    min_messages: int = Field(0, description=MIN_MESSAGES_DESCRIPTION),
+    cursor: Optional[str] = Field(None, description=CURSOR_DESCRIPTION),
+    max_bytes: int = Field(DEFAULT_MAX_BYTES, description=MAX_BYTES_DESCRIPTION + '; results past it move to the next page'),
+    hybrid_weight: float = Field(0.5, description=HYBRID_WEIGHT_DESCRIPTION)
 ) -> Dict[str, Any]:
     """Search conversations by content."""
     try:
-        from q_history_mcp.database import QCliDatabase
-        db = QCliDatabase()
-        results = await db.search_conversations(query=query, limit=limit)
+        from q_history_mcp.database import get_database
+        from q_history_mcp.filters import ConversationFilter
+        filters = ConversationFilter.from_arguments(since, until, workspace, role, min_messages)
+        db = get_database()
+        page = await db.search_conversations_page(query=query, limit=limit, mode=mode, filters=filters,
+                                                  cursor=cursor, max_bytes=max_bytes or None,
+                                                  hybrid_weight=hybrid_weight)
+        results = page['results']
         
         await ctx.info(f"Found {len(results)} conversations matching '{query}'")
-        return {
+        response = {
             "status": "success",
             "query": query,
             "results": results,
-            "count": len(results)
+            "count": len(results),
+            "next_cursor": page['next_cursor']
         }
+        if 'expansions' in page:
+            response["expansions"] = page['expansions']
+        return response
     except Exception as e:
         await ctx.error(f"Search failed: {e}")
         return {"status": "error", "message": str(e)}
@@ -2,10 +2,16 @@
 
 import sys
 import argparse
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from mcp.server.fastmcp import Context, FastMCP
 from pydantic import Field
 
+from q_history_mcp.tool_fields import (
+    CURSOR_DESCRIPTION, DEFAULT_MAX_BYTES, HYBRID_WEIGHT_DESCRIPTION, LIST_ROLE_DESCRIPTION, MAX_BYTES_DESCRIPTION,
+    MIN_MESSAGES_DESCRIPTION, SEARCH_MODE_DESCRIPTION, SEARCH_ROLE_DESCRIPTION, SINCE_DESCRIPTION, UNTIL_DESCRIPTION,
+    WORKSPACE_DESCRIPTION,
+)
+
 # Set up logging
 import logging
 logging.basicConfig(level=logging.ERROR, stream=sys.stderr)
@@ -21,19 +27,29 @@ mcp = FastMCP(
 )
 async def list_conversations(
     ctx: Context,
-    limit: int = Field(100, description='Maximum number of conversations to return')
+    limit: int = Field(100, description='Maximum number of conversations to return'),
+    since: Optional[str] = Field(None, description=SINCE_DESCRIPTION),
+    until: Optional[str] = Field(None, description=UNTIL_DESCRIPTION),
+    workspace: Optional[str] = Field(None, description=WORKSPACE_DESCRIPTION),
+    role: Optional[str] = Field(None, description=LIST_ROLE_DESCRIPTION),
+    min_messages: int = Field(0, description=MIN_MESSAGES_DESCRIPTION),
+    cursor: Optional[str] = Field(None, description=CURSOR_DESCRIPTION)
 ) -> Dict[str, Any]:
     """List recent Q CLI conversations."""
     try:
-        from q_history_mcp.database import QCliDatabase
-        db = QCliDatabase()
-        conversations = await db.list_conversations(limit=limit)
+        from q_history_mcp.database import get_database
+        from q_history_mcp.filters import ConversationFilter
+        filters = ConversationFilter.from_arguments(since, until, workspace, role, min_messages)
+        db = get_database()
+        page = await db.list_conversations_page(limit=limit, filters=filters, cursor=cursor)
+        conversations = page['conversations']
         
         await ctx.info(f"Retrieved {len(conversations)} conversations")
         return {
             "status": "success",
             "conversations": conversations,
-            "count": len(conversations)
+            "count": len(conversations),
+            "next_cursor": page['next_cursor']
         }
     except Exception as e:
         await ctx.error(f"Failed to list conversations: {e}")
@@ -46,34 +62,37 @@ async def list_conversations(
 async def get_conversation_details(
     ctx: Context,
     conversation_id: str = Field(..., description='The conversation ID to retrieve'),
-    message_limit: int = Field(50, description='Maximum number of messages to return')
+    message_limit: int = Field(50, description='Maximum number of messages to return (0 for all)'),
+    offset: int = Field(0, description='Number of messages to skip first'),
+    from_end: bool = Field(False, description='Count offset and limit from the last message backwards (messages are still returned oldest first)'),
+    max_bytes: int = Field(DEFAULT_MAX_BYTES, description=MAX_BYTES_DESCRIPTION + '; the longest bodies are truncated first, fetch the rest with get_message')
 ) -> Dict[str, Any]:
     """Get detailed conversation content including all messages."""
     try:
-        from q_history_mcp.database import QCliDatabase
-        db = QCliDatabase()
+        from q_history_mcp.budget import fit_messages
+        from q_history_mcp.database import get_database
+        db = get_database()
         
-        # Get conversation using the same method as export
-        conversation = await db.get_conversation(conversation_id)
+        # Only the requested window of messages is read
+        window = await db.get_conversation_messages(conversation_id, offset=offset,
+                                                    limit=message_limit or None, from_end=from_end)
         
-        if not conversation:
+        if not window:
             await ctx.error(f"Conversation {conversation_id} not found")
             return {"status": "error", "message": f"Conversation {conversation_id} not found"}
         
-        # Extract messages from the conversation
-        messages = conversation.get('messages', [])
-        
-        # Limit messages if requested
-        if message_limit and len(messages) > message_limit:
-            messages = messages[:message_limit]
-        
-        return {
+        messages = window['messages']
+        response = {
             "status": "success",
             "conversation_id": conversation_id,
             "messages": messages,
-            "total_messages": len(conversation.get('messages', [])),
-            "shown_messages": len(messages)
+            "total_messages": window['total_messages'],
+            "shown_messages": len(messages),
+            "first_message": window['first_message']
         }
+        if max_bytes:
+            fit_messages(messages, response, max_bytes)
+        return response
         
     except Exception as e:
         await ctx.error(f"Failed to get conversation details: {e}")
@@ -86,26 +105,124 @@ async def get_conversation_details(
 async def search_conversations(
     ctx: Context,
     query: str = Field(..., description='Search query'),
-    limit: int = Field(20, description='Maximum number of results to return')
+    limit: int = Field(20, description='Maximum number of results to return'),
+    mode: str = Field('text', description=SEARCH_MODE_DESCRIPTION),
+    since: Optional[str] = Field(None, description=SINCE_DESCRIPTION),
+    until: Optional[str] = Field(None, description=UNTIL_DESCRIPTION),
+    workspace: Optional[str] = Field(None, description=WORKSPACE_DESCRIPTION),
+    role: Optional[str] = Field(None, description=SEARCH_ROLE_DESCRIPTION),
+    min_messages: int = Field(0, description=MIN_MESSAGES_DESCRIPTION),
+    cursor: Optional[str] = Field(None, description=CURSOR_DESCRIPTION),
+    max_bytes: int = Field(DEFAULT_MAX_BYTES, description=MAX_BYTES_DESCRIPTION + '; results past it move to the next page'),
+    hybrid_weight: float = Field(0.5, description=HYBRID_WEIGHT_DESCRIPTION)
 ) -> Dict[str, Any]:
     """Search conversations by text content."""
     try:
-        from q_history_mcp.database import QCliDatabase
-        db = QCliDatabase()
+        from q_history_mcp.database import get_database
+        from q_history_mcp.filters import ConversationFilter
+        filters = ConversationFilter.from_arguments(since, until, workspace, role, min_messages)
+        db = get_database()
+        
+        page = await db.search_conversations_page(query=query, limit=limit, mode=mode, filters=filters,
+                                                  cursor=cursor, max_bytes=max_bytes or None,
+                                                  hybrid_weight=hybrid_weight)
+        results = page['results']
+        await ctx.info(f"Found {len(results)} {mode} matches")
+        response = {
+            "status": "success",
+            "query": query,
+            "search_type": mode,
+            "results": results,
+            "count": len(results),
+            "next_cursor": page['next_cursor']
+        }
+        if 'expansions' in page:
+            response["expansions"] = page['expansions']
+        return response
+        
+    except Exception as e:
+        await ctx.error(f"Search failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+@mcp.tool(
+    name='semantic_search',
+    description='Find conversations about a topic by embedding or TF-IDF similarity, without requiring exact wording'
+)
+async def semantic_search(
+    ctx: Context,
+    query: str = Field(..., description='Words describing the topic'),
+    limit: int = Field(20, description='Maximum number of conversations to return'),
+    since: Optional[str] = Field(None, description=SINCE_DESCRIPTION),
+    until: Optional[str] = Field(None, description=UNTIL_DESCRIPTION),
+    workspace: Optional[str] = Field(None, description=WORKSPACE_DESCRIPTION),
+    role: Optional[str] = Field(None, description=SEARCH_ROLE_DESCRIPTION),
+    min_messages: int = Field(0, description=MIN_MESSAGES_DESCRIPTION)
+) -> Dict[str, Any]:
+    """Search conversations by vector similarity to the query."""
+    try:
+        from q_history_mcp.database import get_database
+        from q_history_mcp.filters import ConversationFilter
+        filters = ConversationFilter.from_arguments(since, until, workspace, role, min_messages)
+        db = get_database()
         
-        # Text search
-        results = await db.search_conversations(query=query, limit=limit)
-        await ctx.info(f"Found {len(results)} text matches")
+        found = await db.semantic_search(query=query, limit=limit, filters=filters)
+        results = found['results']
+        await ctx.info(f"Found {len(results)} similar conversations by {found['method']}")
         return {
             "status": "success",
             "query": query,
-            "search_type": "text",
+            "method": found['method'],
+            "embeddings": found['embeddings'],
             "results": results,
             "count": len(results)
         }
         
     except Exception as e:
-        await ctx.error(f"Search failed: {e}")
+        await ctx.error(f"Semantic search failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+@mcp.tool(
+    name='get_message',
+    description='Get the body of one message, or a byte range of it, by its seq from get_conversation_details or a search highlight'
+)
+async def get_message(
+    ctx: Context,
+    conversation_id: str = Field(..., description='The conversation ID'),
+    seq: int = Field(..., description="The message's seq from get_conversation_details or a search highlight"),
+    start_byte: int = Field(0, description='Byte offset into the UTF-8 body to start at (end_byte of the previous range to continue)'),
+    max_bytes: int = Field(DEFAULT_MAX_BYTES, description='Maximum number of body bytes to return (0 for the rest of the body)')
+) -> Dict[str, Any]:
+    """Get one message body by byte range."""
+    try:
+        from q_history_mcp.budget import byte_range
+        from q_history_mcp.database import get_database
+        db = get_database()
+        
+        message = await db.get_message(conversation_id, seq)
+        if message is None:
+            await ctx.error(f"Message {seq} of conversation {conversation_id} not found")
+            return {"status": "error", "message": f"Message {seq} of conversation {conversation_id} not found"}
+        
+        body = message.get('body')
+        if not isinstance(body, str):
+            body = ''
+        body_bytes = len(body.encode('utf-8'))
+        end_byte = start_byte + max_bytes if max_bytes else None
+        text, start_byte, end_byte = byte_range(body, start_byte, end_byte)
+        return {
+            "status": "success",
+            "conversation_id": conversation_id,
+            "seq": seq,
+            "type": message.get('type'),
+            "body": text,
+            "start_byte": start_byte,
+            "end_byte": end_byte,
+            "body_bytes": body_bytes,
+            "has_more": end_byte < body_bytes
+        }
+        
+    except Exception as e:
+        await ctx.error(f"Failed to get message: {e}")
         return {"status": "error", "message": str(e)}
 
 def main():
@@ -129,8 +246,8 @@ def main():
     if args.test:
         print("Testing Q CLI History MCP Server...")
         try:
-            from q_history_mcp.database import QCliDatabase
-            db = QCliDatabase()
+            from q_history_mcp.database import get_database
+            db = get_database()
             print(f"✅ Database found at: {db.db_path}")
             print(f"✅ History directory: {db.history_dir}")
             
@@ -170,12 +287,11 @@ async def export_conversation(
 ) -> Dict[str, Any]:
     """Export a conversation to markdown format."""
     try:
-        from q_history_mcp.database import QCliDatabase
-        db = QCliDatabase()
+        from q_history_mcp.database import get_database
+        db = get_database()
         
         # Get conversation metadata
-        conversations = await db.list_conversations(limit=1000)
-        conv_meta = next((c for c in conversations if c['id'] == conversation_id), None)
+        conv_meta = await db.get_conversation_summary(conversation_id)
         
         if not conv_meta:
             return {"status": "error", "message": f"Conversation {conversation_id} not found"}
@@ -196,59 +312,12 @@ async def export_conversation(
         # Get full conversation details
         conversation = await db.get_conversation(conversation_id)
         
-        if conversation and 'messages' in conversation:
-            # LokiJS format
-            messages = conversation['messages']
-            for i, msg in enumerate(messages):
+        if conversation:
+            for i, msg in enumerate(conversation['messages']):
                 if msg.get('type') == 'prompt':
                     markdown += f"## 👤 User Message {i+1}\n\n{msg['body']}\n\n"
                 elif msg.get('type') == 'answer':
                     markdown += f"## 🤖 Assistant Response {i+1}\n\n{msg['body']}\n\n"
-        else:
-            # SQLite format - extract from conversation history
-            from q_history_mcp.database import QCliDatabase
-            import sqlite3
-            import json
-            
-            # Get raw conversation data from SQLite
-            db_instance = QCliDatabase()
-            with sqlite3.connect(db_instance.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT value FROM conversations WHERE value LIKE ?", (f'%{conversation_id}%',))
-                result = cursor.fetchone()
-                
-                if result:
-                    conv_data = json.loads(result[0])
-                    message_num = 1
-                    
-                    if 'history' in conv_data and conv_data['history']:
-                        for history_entry in conv_data['history']:
-                            if isinstance(history_entry, dict) and 'user' in history_entry:
-                                # Old format: user/assistant pairs
-                                user_msg = history_entry['user']
-                                if 'content' in user_msg and 'Prompt' in user_msg['content']:
-                                    prompt = user_msg['content']['Prompt'].get('prompt', '')
-                                    if prompt:
-                                        markdown += f"## 👤 User Message {message_num}\n\n{prompt}\n\n"
-                                
-                                if 'assistant' in history_entry and 'Response' in history_entry['assistant']:
-                                    response_data = history_entry['assistant']['Response']
-                                    if isinstance(response_data, dict) and 'content' in response_data:
-                                        response = response_data['content']
-                                        if response:
-                                            markdown += f"## 🤖 Assistant Response {message_num}\n\n{response}\n\n"
-                                
-                                message_num += 1
-                            
-                            elif isinstance(history_entry, list):
-                                # New format: list of messages
-                                for msg in history_entry:
-                                    if isinstance(msg, dict) and 'content' in msg:
-                                        if 'Prompt' in msg['content']:
-                                            prompt = msg['content']['Prompt'].get('prompt', '')
-                                            if prompt:
-                                                markdown += f"## 👤 User Message {message_num}\n\n{prompt}\n\n"
-                                                message_num += 1
         
         # Write to file
         import os
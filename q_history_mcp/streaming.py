@@ -0,0 +1,528 @@
+"""Streaming summaries and partial reads of conversation JSON.
+
+A listing needs only a conversation's id, its message count and its first
+prompt. Decoding the whole document builds every tool result and response
+as Python objects just to throw them away, so the scanner here walks the
+JSON text instead: strings and subtrees that do not matter are skipped with
+compiled regular expressions, only the first prompt is ever decoded, and
+scanning stops as soon as the summary is complete. The counting rules are
+those of :mod:`q_history_mcp.models`.
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from q_history_mcp import json_backend
+from q_history_mcp.models import REQUEST_TIME_FIELDS, parse_epoch_ms, parse_timestamp
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SCALAR = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null')
+# Everything up to the next bracket, then that bracket (group 1 opening,
+# group 2 closing); strings are consumed whole so brackets inside them
+# never count. The bracket is optional so a truncated container fails fast
+# instead of backtracking.
+_BRACKET = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*(?:([\[{])|([\]}]))?', re.S)
+
+
+class ConversationSummary:
+    """The listing fields of one conversation.
+
+    ``message_count`` covers user and assistant messages, of which
+    ``user_count`` are user messages; ``tool_count`` counts tool results.
+    """
+
+    __slots__ = ("conversation_id", "message_count", "first_prompt", "agent", "created_at", "updated_at",
+                 "user_count", "tool_count")
+
+    def __init__(self, conversation_id: Optional[str], message_count: int, first_prompt: Optional[str],
+                 agent: Optional[str] = None, created_at: Optional[float] = None,
+                 updated_at: Optional[float] = None, user_count: int = 0, tool_count: int = 0):
+        self.conversation_id = conversation_id
+        self.message_count = message_count
+        self.first_prompt = first_prompt
+        self.agent = agent
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.user_count = user_count
+        self.tool_count = tool_count
+
+    @property
+    def role_counts(self) -> Dict[str, int]:
+        """Number of messages of each role, as ``Conversation.role_counts``."""
+        return {'user': self.user_count, 'assistant': self.message_count - self.user_count,
+                'tool': self.tool_count}
+
+
+class _Scanner:
+    """Pull-style reader over JSON text that can skip values without decoding them.
+
+    :meth:`members` and :meth:`items` yield once per entry; the caller must
+    consume each value (read it or :meth:`skip` it) before resuming them.
+    """
+
+    __slots__ = ("text", "pos")
+
+    WHITESPACE = _WHITESPACE
+    STRING = _STRING
+    SCALAR = _SCALAR
+    BRACKET = _BRACKET
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at the end)."""
+        self.pos = self.WHITESPACE.match(self.text, self.pos).end()
+        return self.text[self.pos:self.pos + 1]
+
+    def _expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def raw(self) -> str:
+        """Consume the next value and return its undecoded text."""
+        self.peek()
+        start = self.pos
+        self.skip()
+        return self.text[start:self.pos]
+
+    def string(self) -> Optional[str]:
+        """Decode the next value if it is a string, otherwise skip it and return None."""
+        if self.peek() != '"':
+            self.skip()
+            return None
+        match = self.STRING.match(self.text, self.pos)
+        if match is None:
+            raise ValueError(f"Unterminated string at offset {self.pos}")
+        self.pos = match.end()
+        return json.loads(match.group())
+
+    def skip(self) -> None:
+        """Consume the next value without keeping it.
+        
+        Strings and scalars are matched by regular expressions; containers
+        are skipped by matching their brackets, so nothing inside them is
+        decoded however large it is.
+        """
+        char = self.peek()
+        if char == '"':
+            match = self.STRING.match(self.text, self.pos)
+        elif char in ('{', '['):
+            self._skip_container()
+            return
+        else:
+            match = self.SCALAR.match(self.text, self.pos)
+        if match is None:
+            raise ValueError(f"Invalid value at offset {self.pos}")
+        self.pos = match.end()
+
+    def truthy(self) -> bool:
+        """Consume the next value and return its Python truthiness.
+
+        Containers are only checked for emptiness, never decoded.
+        """
+        char = self.peek()
+        if char in ('{', '['):
+            start = self.pos
+            self.pos += 1
+            empty = self.peek() in ('}', ']')
+            self.pos = start
+            self.skip()
+            return not empty
+        return bool(json.loads(self.raw()))
+
+    def _skip_container(self) -> None:
+        start, depth = self.pos, 0
+        while True:
+            match = self.BRACKET.match(self.text, self.pos)
+            self.pos = match.end()
+            if match.lastindex == 1:
+                depth += 1
+            elif match.lastindex == 2:
+                depth -= 1
+                if depth == 0:
+                    return
+            else:
+                raise ValueError(f"Unterminated container at offset {start}")
+
+    def members(self) -> Iterator[str]:
+        """Iterate the keys of the next object, positioned before each value."""
+        self._expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.string()
+            if key is None:
+                raise ValueError(f"Expected an object key at offset {self.pos}")
+            self._expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or '}}' at offset {self.pos - 1}")
+
+    def items(self) -> Iterator[int]:
+        """Iterate the next array, positioned before each element."""
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' at offset {self.pos - 1}")
+
+
+class _BytesScanner(_Scanner):
+    """:class:`_Scanner` over a bytes-like buffer such as an ``mmap``."""
+
+    __slots__ = ()
+
+    WHITESPACE = re.compile(rb'[ \t\n\r]*')
+    STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+    SCALAR = re.compile(rb'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null')
+    BRACKET = re.compile(rb'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*(?:([\[{])|([\]}]))?', re.S)
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at the end)."""
+        self.pos = self.WHITESPACE.match(self.text, self.pos).end()
+        return chr(self.text[self.pos]) if self.pos < len(self.text) else ''
+
+
+def _as_text(value: Union[str, bytes, bytearray, memoryview]) -> str:
+    if isinstance(value, str):
+        return value
+    return bytes(value).decode('utf-8')
+
+
+# _Counter._payload() of a missing member
+_NO_PAYLOAD = (None, False, False)
+
+
+class _Counter:
+    """Running message counts, first prompt and time span, mirroring models._Builder."""
+
+    __slots__ = ("scanner", "message_count", "user_count", "tool_count", "first_prompt", "created_at",
+                 "updated_at")
+
+    def __init__(self, scanner: _Scanner):
+        self.scanner = scanner
+        self.message_count = 0
+        self.user_count = 0
+        self.tool_count = 0
+        self.first_prompt: Optional[str] = None
+        self.created_at: Optional[float] = None
+        self.updated_at: Optional[float] = None
+
+    def _state(self) -> tuple:
+        return (self.message_count, self.user_count, self.tool_count, self.first_prompt, self.created_at,
+                self.updated_at)
+
+    def _restore(self, state: tuple) -> None:
+        (self.message_count, self.user_count, self.tool_count, self.first_prompt, self.created_at,
+         self.updated_at) = state
+
+    def _note_time(self, when: Optional[float]) -> None:
+        if when is None:
+            return
+        if self.created_at is None or when < self.created_at:
+            self.created_at = when
+        if self.updated_at is None or when > self.updated_at:
+            self.updated_at = when
+
+    def _request_metadata(self) -> None:
+        scanner = self.scanner
+        if scanner.peek() != '{':
+            scanner.skip()
+            return
+        for key in scanner.members():
+            if key in REQUEST_TIME_FIELDS:
+                raw = scanner.raw()
+                self._note_time(parse_epoch_ms(json.loads(raw)))
+            else:
+                scanner.skip()
+
+    def _payload(self) -> Tuple[Optional[str], bool, bool]:
+        """Read a Prompt/CancelledToolUses/ToolUseResults value.
+
+        Returns its ``prompt`` string, whether the value is truthy and whether
+        it has a non-empty ``tool_use_results`` list; the results are never
+        decoded.
+        """
+        scanner = self.scanner
+        if scanner.peek() != '{':
+            return None, scanner.truthy(), False
+        prompt = None
+        truthy = has_results = False
+        for key in scanner.members():
+            truthy = True
+            if key == 'prompt':
+                prompt = scanner.string()
+            elif key == 'tool_use_results':
+                is_list = scanner.peek() == '['
+                has_results = scanner.truthy() and is_list
+            else:
+                scanner.skip()
+        return prompt, truthy, has_results
+
+    def _user_content(self) -> None:
+        scanner = self.scanner
+        if scanner.peek() != '{':
+            scanner.skip()
+            return
+        payloads = {}
+        for key in scanner.members():
+            if key in ('Prompt', 'CancelledToolUses', 'ToolUseResults'):
+                payloads[key] = self._payload()
+            else:
+                scanner.skip()
+        prompt = payloads.get('Prompt', _NO_PAYLOAD)[0] or payloads.get('CancelledToolUses', _NO_PAYLOAD)[0]
+        if prompt:
+            self.message_count += 1
+            self.user_count += 1
+            if self.first_prompt is None:
+                self.first_prompt = prompt
+        results = payloads.get('ToolUseResults', _NO_PAYLOAD)
+        if not results[1]:
+            results = payloads.get('CancelledToolUses', _NO_PAYLOAD)
+        if results[2]:
+            self.tool_count += 1
+
+    def user(self) -> None:
+        """Count a user message object."""
+        scanner = self.scanner
+        if scanner.peek() != '{':
+            scanner.skip()
+            return
+        for key in scanner.members():
+            if key == 'content':
+                self._user_content()
+            elif key == 'timestamp':
+                self._note_time(parse_timestamp(scanner.string()))
+            else:
+                scanner.skip()
+
+    def _response_has_content(self) -> bool:
+        scanner = self.scanner
+        if scanner.peek() != '{':
+            scanner.skip()
+            return False
+        has_content = False
+        for key in scanner.members():
+            if key == 'content':
+                content = scanner.raw()
+                has_content = content[0] == '"' and content != '""'
+            else:
+                scanner.skip()
+        return has_content
+
+    def _assistant_entry(self, key: str, seen: dict) -> None:
+        """Record a Response/ToolUse member of an assistant message."""
+        scanner = self.scanner
+        if key == 'Response':
+            seen['Response'] = self._response_has_content()
+        elif key == 'ToolUse':
+            seen['ToolUse'] = scanner.peek() == '{'
+            scanner.skip()
+        else:
+            scanner.skip()
+
+    def _count_assistant(self, seen: dict) -> None:
+        if 'Response' in seen:
+            self.message_count += seen['Response']
+        elif seen.get('ToolUse'):
+            self.message_count += 1
+
+    def assistant(self) -> None:
+        """Count an assistant message object."""
+        scanner = self.scanner
+        if scanner.peek() != '{':
+            scanner.skip()
+            return
+        seen: dict = {}
+        for key in scanner.members():
+            self._assistant_entry(key, seen)
+        self._count_assistant(seen)
+
+    def message(self) -> None:
+        """Count a new-format history message, which may be either role.
+
+        Keys can arrive in any order, so both roles are evaluated and the
+        ``content`` key decides which one applies, as in the full parser.
+        """
+        scanner = self.scanner
+        if scanner.peek() != '{':
+            scanner.skip()
+            return
+        is_user = False
+        timestamp = None
+        seen: dict = {}
+        for key in scanner.members():
+            if key == 'content':
+                is_user = True
+                self._user_content()
+            elif key == 'timestamp':
+                timestamp = scanner.string()
+            else:
+                self._assistant_entry(key, seen)
+        if is_user:
+            self._note_time(parse_timestamp(timestamp))
+        else:
+            self._count_assistant(seen)
+
+    def history_entry(self) -> None:
+        """Count one element of ``history`` in either format."""
+        scanner = self.scanner
+        char = scanner.peek()
+        if char == '[':
+            for _ in scanner.items():
+                self.message()
+        elif char == '{':
+            # Old format: the entry only counts when a user half exists
+            before = self._state()
+            has_user = False
+            for key in scanner.members():
+                if key == 'user':
+                    has_user = True
+                    self.user()
+                elif key == 'assistant':
+                    self.assistant()
+                elif key == 'request_metadata':
+                    self._request_metadata()
+                else:
+                    scanner.skip()
+            if not has_user:
+                self._restore(before)
+        else:
+            scanner.skip()
+
+
+def summarize_conversation(value: Union[str, bytes, bytearray, memoryview]) -> ConversationSummary:
+    """Summarize a ConversationState document without decoding it.
+
+    Raises ValueError if the text is not a JSON object. Scanning stops once
+    ``history``, ``conversation_id`` and ``context_manager`` have been read.
+    """
+    scanner = _Scanner(_as_text(value))
+    counter = _Counter(scanner)
+    conversation_id = agent = None
+    pending = {'conversation_id', 'history', 'context_manager'}
+    for key in scanner.members():
+        if key == 'conversation_id':
+            conversation_id = scanner.string()
+        elif key == 'history' and scanner.peek() == '[':
+            for _ in scanner.items():
+                counter.history_entry()
+        elif key == 'context_manager' and scanner.peek() == '{':
+            for field in scanner.members():
+                if field == 'current_profile':
+                    agent = scanner.string() or None
+                else:
+                    scanner.skip()
+        else:
+            scanner.skip()
+        pending.discard(key)
+        if not pending:
+            break
+    return ConversationSummary(conversation_id, counter.message_count, counter.first_prompt, agent,
+                               counter.created_at, counter.updated_at, counter.user_count, counter.tool_count)
+
+
+def _first(scanner: _Scanner, key: str) -> bool:
+    """Move into the first element of array member ``key`` of the next object.
+
+    Returns False (with the object partly consumed) if there is no such element.
+    """
+    if scanner.peek() != '{':
+        return False
+    for member in scanner.members():
+        if member == key and scanner.peek() == '[':
+            scanner.pos += 1
+            return scanner.peek() not in (']', '')
+        scanner.skip()
+    return False
+
+
+def summarize_lokijs(value: Union[str, bytes, bytearray, memoryview],
+                     conversation_id: str) -> ConversationSummary:
+    """Summarize the first conversation of a LokiJS ``chat-history-*.json`` file.
+
+    Only ``collections[0].data[0].conversations[0].messages`` is walked and
+    scanning stops right after it.
+    """
+    scanner = _Scanner(_as_text(value))
+    message_count = user_count = 0
+    first_prompt = None
+    if _first(scanner, 'collections') and _first(scanner, 'data') and _first(scanner, 'conversations') \
+            and scanner.peek() == '{':
+        for key in scanner.members():
+            if key != 'messages' or scanner.peek() != '[':
+                scanner.skip()
+                continue
+            for _ in scanner.items():
+                if scanner.peek() != '{':
+                    scanner.skip()
+                    continue
+                message_type = body = None
+                for field in scanner.members():
+                    if field == 'type':
+                        message_type = scanner.string()
+                    elif field == 'body':
+                        # Bodies stay undecoded unless one becomes the preview
+                        body = scanner.raw()
+                    else:
+                        scanner.skip()
+                if body and body[0] == '"' and body != '""' and message_type in ('prompt', 'answer'):
+                    message_count += 1
+                    if message_type == 'prompt':
+                        user_count += 1
+                        if first_prompt is None:
+                            first_prompt = json.loads(body)
+            break
+    return ConversationSummary(conversation_id, message_count, first_prompt, user_count=user_count)
+
+
+def read_lokijs_conversation(buffer: Union[str, bytes, bytearray, memoryview, Any], start: Optional[int] = 0,
+                             stop: Optional[int] = None) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Decode only ``collections[0].data[0].conversations[0]`` of a LokiJS document.
+
+    ``buffer`` may be str or any bytes-like object, including an ``mmap``.
+    Of the conversation's ``messages`` only ``[start:stop]`` is decoded;
+    the bounds follow slice semantics, so ``start=-10`` reads the last ten.
+    Returns the conversation and its total number of messages, or None if
+    the document has no such conversation.
+    """
+    scanner = _Scanner(buffer) if isinstance(buffer, str) else _BytesScanner(buffer)
+    if not (_first(scanner, 'collections') and _first(scanner, 'data') and _first(scanner, 'conversations')
+            and scanner.peek() == '{'):
+        return None
+    conversation: Dict[str, Any] = {}
+    total = 0
+    for key in scanner.members():
+        if key == 'messages' and scanner.peek() == '[':
+            # Remember where each message is and decode the window afterwards
+            spans = []
+            for _ in scanner.items():
+                begin = scanner.pos
+                scanner.skip()
+                spans.append((begin, scanner.pos))
+            total = len(spans)
+            conversation[key] = [
+                json_backend.loads(scanner.text[begin:end]) for begin, end in spans[start:stop]
+            ]
+        else:
+            conversation[key] = json_backend.loads(scanner.raw())
+    return conversation, total
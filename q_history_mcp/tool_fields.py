@@ -0,0 +1,20 @@
+"""Parameter descriptions and defaults shared by the MCP server entry points."""
+
+# Descriptions of the filter parameters shared by the list and search tools
+SINCE_DESCRIPTION = 'Only conversations last active at or after this ISO 8601 date or time (UTC unless an offset is given)'
+UNTIL_DESCRIPTION = 'Only conversations last active before this ISO 8601 date or time (UTC unless an offset is given)'
+WORKSPACE_DESCRIPTION = 'Only conversations whose workspace full path starts with this prefix'
+LIST_ROLE_DESCRIPTION = "Only conversations with a message from this role: 'user', 'assistant' or 'tool'"
+SEARCH_ROLE_DESCRIPTION = "Only match messages from this role: 'user', 'assistant' or 'tool' (tool output is not searched otherwise)"
+MIN_MESSAGES_DESCRIPTION = 'Only conversations with at least this many user and assistant messages'
+CURSOR_DESCRIPTION = 'next_cursor from the previous page; repeat the other arguments unchanged'
+
+# One entry per mode in database.SEARCH_MODES
+SEARCH_MODE_DESCRIPTION = ("'text' for exact substring matches (newest first), 'ranked' for BM25 relevance ranking, "
+                           "'fuzzy' for BM25 ranking that also matches close spellings of misspelled words, "
+                           "'hybrid' to fuse BM25 with vector similarity (one page, needs numpy)")
+HYBRID_WEIGHT_DESCRIPTION = "In hybrid mode, the share of the BM25 ranking in the fused score (0-1); vector similarity gets the rest"
+
+# Default response budget, about 25k tokens
+DEFAULT_MAX_BYTES = 100_000
+MAX_BYTES_DESCRIPTION = 'Approximate response size limit in bytes (about 4 bytes per token; 0 for no limit)'
@@ -0,0 +1,296 @@
+"""Offline TF-IDF vector search over the messages of the sidecar index.
+
+Every indexed message becomes one row of a sparse matrix. Terms are hashed
+into a fixed number of buckets (a hashing vectorizer), so no vocabulary has
+to be fitted or stored and nothing is ever downloaded. Weights follow the
+SMART lnc.ltc scheme: message rows hold ``1 + log(tf)`` normalized to unit
+length, and IDF is applied to the query only. Rows therefore never depend
+on the rest of the corpus, so after a sync only the conversations whose
+content hash changed are vectorized again.
+
+The matrix is stored in CSR form as ``.npy`` files next to the index and
+memory-mapped when loaded. A query is answered with a single vectorized
+sparse matrix-vector product over all rows.
+
+Requires numpy; importing this module raises ImportError without it.
+"""
+
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from q_history_mcp.filters import ConversationFilter
+from q_history_mcp.index import HistoryIndex
+from q_history_mcp.models import MESSAGE_ROLES
+
+# Hash buckets of the feature space; collisions stay rare for the few
+# tens of thousands of distinct terms a chat history holds
+DIMENSIONS = 1 << 18
+
+# Bump when tokenization or weighting changes; stored matrices are rebuilt
+FORMAT_VERSION = 1
+
+# Rows of conversations vectorized per batch during a refresh
+BUILD_BATCH = 256
+
+# Words of two or more characters, also used by embeddings' hashing backend
+TOKEN = re.compile(r"\w\w+")
+
+# Small integer stored per row for each message role
+ROLE_CODES = {role: code for code, role in enumerate(MESSAGE_ROLES)}
+
+# Arrays of a stored matrix: CSR data/indices/indptr, then one entry per row
+_ARRAYS = {
+    'data': np.float32,
+    'indices': np.int32,
+    'indptr': np.int64,
+    'conversations': np.int64,
+    'seqs': np.int32,
+    'roles': np.int8,
+}
+
+
+def term_weights(text: str) -> Dict[int, float]:
+    """Hashed term buckets of ``text`` with their ``1 + log(tf)`` weights."""
+    counts: Dict[int, int] = {}
+    for token in TOKEN.findall(text.lower()):
+        bucket = zlib.crc32(token.encode("utf-8")) & (DIMENSIONS - 1)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return {bucket: 1.0 + math.log(count) for bucket, count in counts.items()}
+
+
+class _Matrix:
+    """Message vectors in CSR form plus each row's conversation, seq and role."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], hashes: Dict[int, str]):
+        self.arrays = arrays
+        # content_hash of every conversation the rows were built from
+        self.hashes = hashes
+        self.row_count = len(arrays['indptr']) - 1
+        # Row of every stored value, for the bincount matrix-vector product
+        self.rows = np.repeat(np.arange(self.row_count, dtype=np.int32), np.diff(arrays['indptr']))
+        # Smoothed IDF over the messages, as in scikit-learn's TfidfTransformer
+        document_frequency = np.bincount(arrays['indices'], minlength=DIMENSIONS)
+        self.idf = (np.log((1 + self.row_count) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    @classmethod
+    def empty(cls) -> "_Matrix":
+        arrays = {name: np.zeros(0, dtype) for name, dtype in _ARRAYS.items()}
+        arrays['indptr'] = np.zeros(1, np.int64)
+        return cls(arrays, {})
+
+    @classmethod
+    def load(cls, directory: Path) -> "_Matrix":
+        """Memory-map a matrix saved by :meth:`save`."""
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode='r') for name in _ARRAYS}
+        with open(directory / "hashes.json", encoding="utf-8") as f:
+            hashes = {int(rowid): content_hash for rowid, content_hash in json.load(f).items()}
+        return cls(arrays, hashes)
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True)
+        for name, array in self.arrays.items():
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(array, dtype=_ARRAYS[name]))
+        with open(directory / "hashes.json", "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+
+    def select(self, keep: np.ndarray) -> Dict[str, np.ndarray]:
+        """Arrays of the rows where ``keep`` is true."""
+        lengths = np.diff(self.arrays['indptr'])
+        values = np.repeat(keep, lengths)
+        selected = {name: self.arrays[name][values] for name in ('data', 'indices')}
+        selected['indptr'] = np.concatenate(([0], np.cumsum(lengths[keep]))).astype(np.int64)
+        for name in ('conversations', 'seqs', 'roles'):
+            selected[name] = self.arrays[name][keep]
+        return selected
+
+    def scores(self, query: Dict[int, float]) -> np.ndarray:
+        """Cosine similarity of every row with the ltc-weighted ``query``."""
+        vector = np.zeros(DIMENSIONS, np.float32)
+        buckets = np.fromiter(query, np.int64, len(query))
+        vector[buckets] = np.fromiter(query.values(), np.float32, len(query)) * self.idf[buckets]
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return np.zeros(self.row_count)
+        vector /= norm
+        return np.bincount(self.rows, weights=self.arrays['data'] * vector[self.arrays['indices']],
+                           minlength=self.row_count)
+
+
+def _vectorize(messages: Iterable[Tuple[int, int, str, str]]) -> Dict[str, np.ndarray]:
+    """CSR arrays of unit-length lnc vectors for ``(conversation_rowid, seq, role, body)`` rows."""
+    data: List[float] = []
+    indices: List[int] = []
+    indptr = [0]
+    conversations, seqs, roles = [], [], []
+    for conversation_rowid, seq, role, body in messages:
+        weights = term_weights(body)
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        for bucket in sorted(weights):
+            indices.append(bucket)
+            data.append(weights[bucket] / norm)
+        indptr.append(len(indices))
+        conversations.append(conversation_rowid)
+        seqs.append(seq)
+        roles.append(ROLE_CODES[role])
+    return {
+        'data': np.array(data, np.float32),
+        'indices': np.array(indices, np.int32),
+        'indptr': np.array(indptr, np.int64),
+        'conversations': np.array(conversations, np.int64),
+        'seqs': np.array(seqs, np.int32),
+        'roles': np.array(roles, np.int8),
+    }
+
+
+def _concatenate(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Stack the rows of several CSR array sets."""
+    offsets = np.cumsum([0] + [part['indptr'][-1] for part in parts[:-1]])
+    arrays = {
+        name: np.concatenate([part[name] for part in parts]).astype(dtype)
+        for name, dtype in _ARRAYS.items() if name != 'indptr'
+    }
+    arrays['indptr'] = np.concatenate(
+        [[0]] + [part['indptr'][1:] + offset for part, offset in zip(parts, offsets)]).astype(np.int64)
+    return arrays
+
+
+def eligible_rows(index: HistoryIndex, conversations: np.ndarray, roles: np.ndarray,
+                  filters: Optional[ConversationFilter] = None) -> np.ndarray:
+    """Mask of the rows of the filter's roles in conversations passing it."""
+    filters = filters or ConversationFilter()
+    eligible = np.isin(roles, [ROLE_CODES[role] for role in filters.roles])
+    if not filters.is_empty:
+        eligible &= np.isin(conversations, index.conversation_rowids(filters))
+    return eligible
+
+
+def rank_conversations(scores: np.ndarray, conversations: np.ndarray, seqs: np.ndarray, roles: np.ndarray,
+                       limit: int, per_conversation: int = 3) -> List[Dict[str, Any]]:
+    """Conversations ranked by their best-scoring row.
+
+    ``scores``, ``conversations``, ``seqs`` and ``roles`` hold one entry per
+    row (a message, or a piece of one); rows scoring 0 or less never match.
+    Each hit holds the conversation's ``rowid``, its ``score`` (the best
+    row's) and ``matches``: up to ``per_conversation`` of its best
+    ``(seq, role, score)`` messages.
+    """
+    candidates = np.flatnonzero(scores > 0)
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+    # Conversations ranked by their best row, then their rows best first
+    ranked = conversations[candidates]
+    _, best = np.unique(ranked, return_index=True)
+    top = ranked[np.sort(best)[:limit]]
+    hits = {int(rowid): {'rowid': int(rowid), 'matches': []} for rowid in top}
+    for row in candidates[np.isin(ranked, top)].tolist():
+        hit = hits[int(conversations[row])]
+        seq = int(seqs[row])
+        if not hit['matches']:
+            hit['score'] = float(scores[row])
+        if len(hit['matches']) < per_conversation and all(match[0] != seq for match in hit['matches']):
+            hit['matches'].append((seq, MESSAGE_ROLES[roles[row]], float(scores[row])))
+    return list(hits.values())
+
+
+class VectorIndex:
+    """TF-IDF vectors of the messages in a :class:`HistoryIndex`, kept in step with it.
+
+    Matrices live in ``<index>.vectors/<generation>/``; the ``current`` file
+    names the generation matching the index's last sync. Each refresh
+    writes a new generation and switches ``current`` atomically, so other
+    processes can keep reading the generation they mapped.
+    """
+
+    def __init__(self, index: HistoryIndex):
+        self.index = index
+        self.directory = index.index_path.with_name(index.index_path.name + ".vectors")
+        self._lock = threading.Lock()
+        self._matrix: Optional[_Matrix] = None
+        self._signature: Optional[str] = None
+
+    def _index_signature(self) -> str:
+        return f"{FORMAT_VERSION}:{self.index.sync_signature()}"
+
+    def _read_current(self) -> Dict[str, Any]:
+        try:
+            with open(self.directory / "current", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_current(self, generation: str, signature: str) -> None:
+        temporary = self.directory / f"current.{uuid.uuid4().hex}"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({'generation': generation, 'signature': signature}, f)
+        os.replace(temporary, self.directory / "current")
+
+    def refresh(self) -> _Matrix:
+        """The matrix for the index's current content, vectorizing only changed conversations."""
+        with self._lock:
+            signature = self._index_signature()
+            if self._matrix is not None and self._signature == signature:
+                return self._matrix
+
+            current = self._read_current()
+            stored = None
+            if current.get('signature', '').startswith(f"{FORMAT_VERSION}:"):
+                try:
+                    stored = _Matrix.load(self.directory / current['generation'])
+                except (OSError, ValueError, KeyError):
+                    # Half-written or removed generation: vectorize everything again
+                    stored = None
+            if stored is not None and current['signature'] == signature:
+                matrix = stored
+            else:
+                matrix = self._update(self._matrix or stored or _Matrix.empty(), signature,
+                                      current.get('generation'))
+            self._matrix, self._signature = matrix, signature
+            return matrix
+
+    def _update(self, matrix: _Matrix, signature: str, previous: Optional[str]) -> _Matrix:
+        """Bring ``matrix`` up to date with the index and store it as the current generation."""
+        conn = self.index.connect()
+        hashes = dict(conn.execute("SELECT rowid, content_hash FROM conversations"))
+        unchanged = [rowid for rowid, content_hash in hashes.items() if matrix.hashes.get(rowid) == content_hash]
+        changed = [rowid for rowid, content_hash in hashes.items() if matrix.hashes.get(rowid) != content_hash]
+        parts = [matrix.select(np.isin(matrix.arrays['conversations'], unchanged))]
+        for start in range(0, len(changed), BUILD_BATCH):
+            batch = changed[start:start + BUILD_BATCH]
+            parts.append(_vectorize(conn.execute(
+                f"SELECT conversation_rowid, seq, role, body FROM messages "
+                f"WHERE conversation_rowid IN ({', '.join('?' * len(batch))}) ORDER BY conversation_rowid, seq",
+                batch)))
+
+        generation = uuid.uuid4().hex
+        _Matrix(_concatenate(parts), hashes).save(self.directory / generation)
+        self._write_current(generation, signature)
+        if previous and previous != generation:
+            # Processes that mapped it keep their open files
+            shutil.rmtree(self.directory / previous, ignore_errors=True)
+        return _Matrix.load(self.directory / generation)
+
+    def search(self, query: str, limit: int, filters: Optional[ConversationFilter] = None,
+               per_conversation: int = 3) -> List[Dict[str, Any]]:
+        """Conversations ranked by the cosine similarity of their best message.
+
+        Only messages of the filter's roles in conversations passing it
+        are ranked; see :func:`rank_conversations` for the hits returned.
+        """
+        weights = term_weights(query)
+        matrix = self.refresh()
+        if not weights or not matrix.row_count:
+            return []
+        arrays = matrix.arrays
+        rows = np.flatnonzero(eligible_rows(self.index, arrays['conversations'], arrays['roles'], filters))
+        return rank_conversations(matrix.scores(weights)[rows], arrays['conversations'][rows], arrays['seqs'][rows],
+                                  arrays['roles'][rows], limit, per_conversation)
@@ -0,0 +1,100 @@
+"""Vocabulary of indexed message text, for typo-tolerant search.
+
+The sidecar index keeps every word of the message text with the number of
+messages containing it, and files each word under its character trigrams.
+A misspelled query word is corrected in three steps:
+
+- candidates are the words sharing enough trigrams with it: one edit
+  changes at most three of a word's trigrams (four for a transposition),
+  so a word within ``d`` edits shares all but ``4 * d`` of them;
+- candidates are verified by their edit distance (Damerau-Levenshtein with
+  adjacent transpositions), bounded by :func:`max_edits`;
+- the closest ones that occur in over CORRECTION_RATIO times as many
+  messages as the query word itself become its alternatives. A typo is
+  much rarer than the word it misspells, so words missing from the history
+  are always corrected, while a correctly spelled word is left alone unless
+  a neighbour dwarfs it.
+
+Words are runs of letters, lowercased, like FTS5's unicode61 tokenizer
+sees them; digits and underscores split words, and words shorter than
+MIN_LENGTH or longer than MAX_LENGTH are left out.
+"""
+
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Set
+
+MIN_LENGTH = 3
+MAX_LENGTH = 32
+
+# Alternatives kept per query word, besides the word itself
+MAX_EXPANSIONS = 5
+
+# How many times more messages a correction must occur in than the query word
+CORRECTION_RATIO = 10
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+# Keeps ASCII letters and turns every other byte into a space
+_ASCII_SEPARATORS = bytes(byte if chr(byte).isalpha() and byte < 128 else 32 for byte in range(256))
+
+
+def words(text: str) -> List[str]:
+    """Lowercased words of ``text``, in order, including ones too short or long to index."""
+    text = text.lower()
+    if text.isascii():
+        # Same words as the regex, about twice as fast on long tool output
+        return text.encode("ascii").translate(_ASCII_SEPARATORS).decode("ascii").split()
+    return _WORD.findall(text)
+
+
+def message_terms(bodies: Iterable[str], counts: Optional[Counter] = None) -> Counter:
+    """Number of ``bodies`` each word occurs in, added to ``counts`` when given.
+
+    Words of any length are counted; the vocabulary drops those outside
+    MIN_LENGTH and MAX_LENGTH when it stores them.
+    """
+    if counts is None:
+        counts = Counter()
+    for body in bodies:
+        counts.update(set(words(body)))
+    return counts
+
+
+def trigrams(word: str) -> Set[str]:
+    """Character trigrams of ``word`` padded with two spaces before and one after.
+
+    The padding gives even three-letter words several trigrams and weights
+    the start of a word, where typos are rarer.
+    """
+    padded = "  " + word + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(word: str) -> int:
+    """Edits tolerated in ``word``: one up to five letters, two beyond."""
+    if len(word) < MIN_LENGTH:
+        return 0
+    return 1 if len(word) <= 5 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Edits (insertions, deletions, substitutions, adjacent swaps) from ``a`` to ``b``.
+
+    Stops early once the distance must exceed ``limit`` and then returns
+    ``limit + 1``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
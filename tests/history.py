@@ -0,0 +1,72 @@
+"""Temporary Q CLI histories for the tests."""
+
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from q_history_mcp.database import QCliDatabase
+
+
+def conversation(conversation_id, prompt, response, timestamp="2025-03-01T10:00:00Z"):
+    return {
+        "conversation_id": conversation_id,
+        "history": [[
+            {"content": {"Prompt": {"prompt": prompt}}, "timestamp": timestamp},
+            {"Response": {"message_id": conversation_id + "-r", "content": response}},
+        ]],
+    }
+
+
+def tool_conversation(conversation_id):
+    return {
+        "conversation_id": conversation_id,
+        "history": [[
+            {"content": {"Prompt": {"prompt": "run the build"}}, "timestamp": "2025-03-01T10:00:00Z"},
+            {"ToolUse": {"message_id": "m1", "content": "running make",
+                         "tool_uses": [{"id": "t1", "name": "execute_bash", "args": {"command": "make"}}]}},
+            {"content": {"ToolUseResults": {"tool_use_results": [
+                {"tool_use_id": "t1", "status": "Success", "content": [{"Text": "build succeeded"}]}]}},
+             "timestamp": "2025-03-01T10:00:05Z"},
+            {"Response": {"message_id": "m2", "content": "the final answer is that it builds"}},
+        ]],
+    }
+
+
+class HistoryTestCase(unittest.TestCase):
+    """A temporary Q CLI database and history directory per test."""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        (self.directory / "history").mkdir()
+        self.db_path = self.directory / "data.sqlite3"
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE TABLE conversations (key TEXT PRIMARY KEY, value TEXT)")
+        self.databases = []
+
+    def tearDown(self):
+        for db in self.databases:
+            db.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, key, value):
+        """Store a conversation under ``key``, updating it in place (same rowid) if it exists."""
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO conversations VALUES (?, ?) "
+                         "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+
+    def delete(self, key):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM conversations WHERE key = ?", (key,))
+
+    def database(self, indexed=True, **kwargs):
+        """A QCliDatabase over the history; without the index every read scans the source rows."""
+        db = QCliDatabase(str(self.db_path), str(self.directory / "history"),
+                          index_path=str(self.directory / "index.sqlite3"), **kwargs)
+        db._index_failed = not indexed
+        self.databases.append(db)
+        return db
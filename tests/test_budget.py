@@ -0,0 +1,42 @@
+import unittest
+
+from q_history_mcp.budget import encoded_size, fit_messages
+
+
+def _response(messages):
+    return {"status": "success", "messages": messages}
+
+
+class FitMessagesTest(unittest.TestCase):
+
+    def test_escape_heavy_bodies_fit(self):
+        bodies = ['"quoted"\n' * 2000, '\\path\\to\\file\t' * 1500, '\x01\x02' * 3000, 'plain ' * 3000]
+        messages = [{"type": "answer", "body": body} for body in bodies]
+        response = _response(messages)
+        fit_messages(messages, response, 10_000)
+        self.assertLessEqual(encoded_size(response), 10_000)
+        for message, body in zip(messages, bodies):
+            self.assertTrue(message['truncated'])
+            self.assertTrue(body.startswith(message['body']))
+            self.assertEqual(message['body_bytes'], len(body.encode("utf-8")))
+
+    def test_short_bodies_stay_whole(self):
+        messages = [{"type": "prompt", "body": 'say "hi"\n'}, {"type": "answer", "body": "hi"}]
+        response = _response(messages)
+        fit_messages(messages, response, 10_000)
+        self.assertEqual([message['body'] for message in messages], ['say "hi"\n', "hi"])
+        self.assertNotIn('truncated', messages[0])
+
+    def test_messages_without_string_body_pass_through(self):
+        messages = [{"type": "answer-stream"}, {"type": "answer", "body": None},
+                    {"type": "answer", "body": "x" * 50_000}]
+        response = _response(messages)
+        fit_messages(messages, response, 2_000)
+        self.assertEqual(messages[0], {"type": "answer-stream"})
+        self.assertEqual(messages[1], {"type": "answer", "body": None})
+        self.assertTrue(messages[2]['truncated'])
+        self.assertLessEqual(encoded_size(response), 2_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from q_history_mcp.filters import ConversationFilter
+from q_history_mcp.models import full_path_from_key, parse_conversation, parse_timestamp
+from tests.history import HistoryTestCase, conversation, tool_conversation
+
+
+class SearchConversationsTest(HistoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.write(f"/home/u/proj{i}", conversation(f"c{i}", f"deploy the lambda {i}", "use cloudformation"))
+        self.db = self.database()
+
+    def test_known_modes_search(self):
+        for mode in ("text", "ranked", "fuzzy"):
+            page = asyncio.run(self.db.search_conversations_page("lambda", mode=mode))
+            self.assertEqual(len(page['results']), 3, mode)
+
+    def test_limit_below_one_is_rejected(self):
+        for limit in (0, -1):
+            with self.assertRaises(ValueError):
+                asyncio.run(self.db.list_conversations_page(limit))
+            with self.assertRaises(ValueError):
+                asyncio.run(self.db.search_conversations_page("lambda", limit))
+            with self.assertRaises(ValueError):
+                asyncio.run(self.db.semantic_search("lambda", limit))
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(self.db.search_conversations_page("lambda", mode="semantik"))
+
+    def test_semantic_search_needs_the_index(self):
+        with self.assertRaisesRegex(RuntimeError, "needs the sidecar index"):
+            asyncio.run(self.database(indexed=False).semantic_search("lambda"))
+
+
+class MessageNumberingTest(HistoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write("/home/u/proj", tool_conversation("c-tool"))
+
+    def test_highlight_seq_reads_the_matched_message(self):
+        db = self.database()
+        for query, role in (("final", "assistant"), ("succeeded", "tool")):
+            filters = ConversationFilter(role=role)
+            page = asyncio.run(db.search_conversations_page(query, mode="ranked", filters=filters))
+            highlight = page['results'][0]['highlights'][0]
+            message = asyncio.run(db.get_message("c-tool", highlight['seq']))
+            self.assertIn(query, message['body'])
+            self.assertEqual(message['seq'], highlight['seq'])
+
+    def test_details_and_get_message_share_seqs(self):
+        for indexed in (True, False):
+            db = self.database(indexed)
+            window = asyncio.run(db.get_conversation_messages("c-tool"))
+            self.assertEqual([message['seq'] for message in window['messages']], [0, 1, 3])
+            for message in window['messages']:
+                self.assertEqual(asyncio.run(db.get_message("c-tool", message['seq']))['body'], message['body'])
+            self.assertEqual(asyncio.run(db.get_message("c-tool", 2))['type'], 'tool_result')
+            self.assertIsNone(asyncio.run(db.get_message("c-tool", 4)))
+
+
+class ConversationFilterTest(HistoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conversations = []
+        stored = [
+            ("/home/u/proj_a", conversation("a", "deploy the lambda", "done", "2025-03-01T10:00:00Z")),
+            ("/home/u/projXa", conversation("b", "deploy the queue", "done", "2025-03-02T10:00:00Z")),
+            ("/home/u/proj%b|agent", conversation("c", "deploy the table", "done", "2025-03-03T10:00:00Z")),
+            ("/home/u/projé", tool_conversation("d")),
+            ("/srv/app", conversation("e", "deploy the app", "", "2025-03-05T10:00:00Z")),
+        ]
+        for key, data in stored:
+            self.write(key, data)
+            self.conversations.append(parse_conversation(data, key))
+
+    def _expected(self, filters):
+        return [
+            c.conversation_id for c in reversed(self.conversations)
+            if filters.matches(c.updated_at, full_path_from_key(c.key), c.message_count, c.role_counts)
+        ]
+
+    def _filters(self):
+        day = parse_timestamp("2025-03-02T10:00:00Z")
+        yield ConversationFilter()
+        for since, until in ((day, None), (None, day), (day, day + 86400), (day + 1, None)):
+            yield ConversationFilter(since=since, until=until)
+        for workspace in ("/home/u/proj_", "/home/u/proj%", "/home/u/projé", "/home/u/proj", "/srv/app|"):
+            yield ConversationFilter(workspace=workspace)
+        for role in ("user", "assistant", "tool"):
+            yield ConversationFilter(role=role)
+        for min_messages in (1, 2, 3, 4):
+            yield ConversationFilter(min_messages=min_messages)
+        yield ConversationFilter(since=day, workspace="/home/u/", role="assistant", min_messages=2)
+
+    def _listed(self, db, filters):
+        return [entry['id'] for entry in asyncio.run(db.list_conversations(50, filters=filters))]
+
+    def _searched(self, db, filters):
+        return [result['id'] for result in asyncio.run(db.search_conversations("", 50, filters=filters))]
+
+    def test_sql_filters_match_the_python_filter(self):
+        """The index's SQL, the JSON1 listing's SQL and ConversationFilter.matches keep the same conversations."""
+        indexed, direct = self.database(), self.database(indexed=False, result_cache_entries=0)
+        for filters in self._filters():
+            expected = self._expected(filters)
+            self.assertEqual(self._listed(indexed, filters), expected, filters.key())
+            self.assertEqual(self._listed(direct, filters), expected, filters.key())
+            with mock.patch("q_history_mcp.database._has_json1", return_value=False):
+                self.assertEqual(self._listed(direct, filters), expected, filters.key())
+            self.assertEqual(self._searched(indexed, filters), expected, filters.key())
+            self.assertEqual(self._searched(direct, filters), expected, filters.key())
+
+
+class CursorPagingTest(HistoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(12):
+            # Repeated words give ranked modes both ties and distinct scores
+            self.write(f"/home/u/proj{i}", conversation(f"c{i}", "deploy the lambda " + "lambda " * (i % 3),
+                                                        f"use stack {i}", f"2025-03-{i + 1:02d}T10:00:00Z"))
+
+    def _pages(self, fetch, items):
+        """Every item of every page, following next_cursor to the end."""
+        found, cursor = [], None
+        while True:
+            page = asyncio.run(fetch(cursor))
+            found.extend(entry['id'] for entry in page[items])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return found
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        for indexed in (True, False):
+            db = self.database(indexed)
+            everything = [entry['id'] for entry in asyncio.run(db.list_conversations(100))]
+            paged = self._pages(lambda cursor: db.list_conversations_page(5, cursor=cursor), 'conversations')
+            self.assertEqual(paged, everything, indexed)
+            for mode in ("text", "ranked", "fuzzy") if indexed else ("text",):
+                everything = [result['id'] for result in asyncio.run(db.search_conversations("lambda", 100, mode))]
+                paged = self._pages(
+                    lambda cursor: db.search_conversations_page("lambda", 5, mode, cursor=cursor), 'results')
+                self.assertEqual(len(everything), 12, mode)
+                self.assertEqual(paged, everything, mode)
+
+    def test_new_conversations_do_not_shift_pages(self):
+        db = self.database()
+        first = asyncio.run(db.list_conversations_page(5))
+        self.write("/home/u/new", conversation("new", "deploy the lambda", "fresh", "2025-04-01T10:00:00Z"))
+        second = asyncio.run(db.list_conversations_page(5, cursor=first['next_cursor']))
+        self.assertEqual([entry['id'] for entry in second['conversations']], [f"c{i}" for i in range(6, 1, -1)])
+
+    def test_cursor_is_rejected_in_another_scope(self):
+        db = self.database()
+        listed = asyncio.run(db.list_conversations_page(5))['next_cursor']
+        searched = asyncio.run(db.search_conversations_page("lambda", 5, "ranked"))['next_cursor']
+        for call in (
+                lambda: db.search_conversations_page("lambda", 5, "ranked", cursor=listed),
+                lambda: db.list_conversations_page(5, cursor=searched),
+                lambda: db.search_conversations_page("stack", 5, "ranked", cursor=searched),
+                lambda: db.search_conversations_page("lambda", 5, "text", cursor=searched),
+                lambda: db.search_conversations_page("lambda", 5, "ranked", ConversationFilter(role="user"),
+                                                     cursor=searched),
+                lambda: db.list_conversations_page(5, ConversationFilter(min_messages=2), cursor=listed),
+                lambda: db.search_conversations_page("lambda", 5, "hybrid", cursor=searched),
+                lambda: db.list_conversations_page(5, cursor="not a cursor")):
+            with self.assertRaises(ValueError):
+                asyncio.run(call())
+
+
+if __name__ == "__main__":
+    unittest.main()
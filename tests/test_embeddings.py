@@ -0,0 +1,51 @@
+import sqlite3
+import unittest
+from unittest import mock
+
+from q_history_mcp.index import HistoryIndex
+from tests.history import HistoryTestCase, conversation
+
+try:
+    from q_history_mcp import embeddings
+except ImportError:
+    embeddings = None
+
+
+@unittest.skipIf(embeddings is None, "embeddings need numpy")
+class EmbeddingUpdateTest(HistoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write("/home/u/proj", conversation("c0", "deploy the lambda", "use cloudformation"))
+        self.index = HistoryIndex(str(self.db_path), str(self.directory / "index.sqlite3"))
+        self.index.sync()
+        self.embeddings = embeddings.EmbeddingIndex(self.index, "hashing")
+
+    def tearDown(self):
+        self.embeddings.close()
+        self.index.close()
+        super().tearDown()
+
+    def _refresh(self):
+        self.embeddings.refresh()
+        self.embeddings._pending.result()
+
+    def test_transient_failure_is_retried(self):
+        with mock.patch.object(embeddings.EmbeddingIndex, "_encode_conversations",
+                               side_effect=sqlite3.OperationalError("database is locked")), \
+                mock.patch("sys.stderr"):
+            self._refresh()
+        self.assertEqual(self.embeddings.status()['state'], "pending")
+        self._refresh()
+        self.assertEqual(self.embeddings.status()['state'], "ready")
+
+    def test_missing_model_stops_the_updates(self):
+        with mock.patch.object(embeddings, "create_backend", side_effect=OSError("model not cached")):
+            self._refresh()
+        self.assertEqual(self.embeddings.status()['state'], "failed")
+        self.embeddings.refresh()
+        self.assertIsNone(self.embeddings.search("lambda", 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
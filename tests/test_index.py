@@ -0,0 +1,156 @@
+import asyncio
+import os
+import unittest
+
+from q_history_mcp.index import HistoryIndex
+from q_history_mcp.models import parse_conversation
+from tests.history import HistoryTestCase, conversation, tool_conversation
+
+
+class IndexSyncTest(HistoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.write(f"/home/u/proj{i}", conversation(f"c{i}", f"deploy the lambda {i}", "use cloudformation"))
+        self.index = HistoryIndex(str(self.db_path), str(self.directory / "index.sqlite3"))
+
+    def tearDown(self):
+        self.index.close()
+        super().tearDown()
+
+    def _ids(self, query):
+        return {hit['conversation_id'] for hit in self.index.search(query, 10)}
+
+    def test_resync_applies_inserts_updates_and_deletes(self):
+        self.assertEqual(self.index.sync(), 3)
+        rowid = self.index.lookup("c1")['rowid']
+
+        self.write("/home/u/proj3", conversation("c3", "tune the cache", "raise the ttl"))
+        self.write("/home/u/proj1", conversation("c1", "deploy the lambda 1", "use terraform instead"))
+        self.delete("/home/u/proj2")
+        self.assertEqual(self.index.sync(), 3)
+
+        self.assertIsNotNone(self.index.lookup("c3"))
+        self.assertIsNone(self.index.lookup("c2"))
+        self.assertEqual(self.index.lookup("c1")['rowid'], rowid)
+        self.assertEqual([message.body for message in self.index.messages(rowid)],
+                         ["deploy the lambda 1", "use terraform instead"])
+        self.assertEqual(self._ids("cloudformation"), {"c0"})
+        self.assertEqual(self._ids("terraform"), {"c1"})
+        self.assertEqual(self._ids("lambda"), {"c0", "c1"})
+
+    def test_unchanged_rows_are_not_parsed_again(self):
+        self.assertEqual(self.index.sync(), 3)
+        # Same files: the signature check returns before reading any row
+        self.assertEqual(self.index.sync(), 0)
+
+        # Rewritten with the same content: every row is read, none matches a changed hash
+        signature = self.index.sync_signature()
+        self.write("/home/u/proj0", conversation("c0", "deploy the lambda 0", "use cloudformation"))
+        st = os.stat(self.db_path)
+        os.utime(self.db_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.index.sync(), 0)
+        self.assertNotEqual(self.index.sync_signature(), signature)
+
+
+class TrigramSearchTest(HistoryTestCase):
+
+    BODIES = ["Deploy the Lambda", "Straße und Strasse", "İstanbul trip", 'say "a"b here', "x*y AND z",
+              "NEAR foo-bar", "\u212aey rotation", "ﬁle ligature", "ÀÉÎ accents", "tab\there"]
+    QUERIES = ["lambda", "LAMBDA", "strasse", "straße", "ss", "istanbul", "i\u0307stanbul", '"a"b', "x*y",
+               "and z", "near", "oo-b", "key", "ﬁle", "àéî", "t\th", "zzz", "ab", "the"]
+
+    def setUp(self):
+        super().setUp()
+        self.conversations = []
+        for i, body in enumerate(self.BODIES):
+            data = conversation(f"c{i}", body, "noted: " + body.upper())
+            self.write(f"/home/u/proj{i}", data)
+            self.conversations.append(parse_conversation(data, f"/home/u/proj{i}"))
+        self.index = HistoryIndex(str(self.db_path), str(self.directory / "index.sqlite3"))
+        self.index.sync()
+
+    def tearDown(self):
+        self.index.close()
+        super().tearDown()
+
+    def _expected(self, query):
+        """What scanning every message with ``query.lower() in body.lower()`` finds, newest first."""
+        found = [(c.conversation_id, c.text_matches(query.lower())) for c in reversed(self.conversations)]
+        return [(conversation_id, matches) for conversation_id, matches in found if matches]
+
+    def _search(self, query):
+        return [(hit['conversation_id'], hit['matches']) for hit in self.index.search(query, 50)]
+
+    def test_prefiltered_search_matches_the_full_scan(self):
+        # With the trigram table when this SQLite has one, then without it
+        for has_trigram in sorted({self.index.has_trigram, False}, reverse=True):
+            self.index.has_trigram = has_trigram
+            for query in self.QUERIES:
+                self.assertEqual(self._search(query), self._expected(query), (query, has_trigram))
+
+
+class FuzzyExpansionTest(HistoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(12):
+            self.write(f"/home/u/proj{i}", conversation(f"c{i}", f"deploy the lambda function {i}",
+                                                        "the deployment finished"))
+        self.write("/home/u/other", conversation("other", "tune the cache", "raise the ttl"))
+        self.index = HistoryIndex(str(self.db_path), str(self.directory / "index.sqlite3"))
+        self.index.sync()
+
+    def tearDown(self):
+        self.index.close()
+        super().tearDown()
+
+    def test_misspelled_words_are_expanded(self):
+        self.assertEqual(self.index.expand_terms("lamda"), [["lamda", "lambda"]])
+        self.assertEqual(self.index.expand_terms("functoin deploymnet"),
+                         [["functoin", "function"], ["deploymnet", "deployment"]])
+
+    def test_correct_and_unmatched_words_are_left_alone(self):
+        for query in ("lambda", "Lambda", "cache", "zzzzqq", "ab", "lambda-function"):
+            self.assertEqual(self.index.expand_terms(query), [[query]], query)
+
+    def test_vocabulary_follows_resyncs(self):
+        for i in range(12):
+            self.delete(f"/home/u/proj{i}")
+        self.index.sync()
+        self.assertEqual(self.index.expand_terms("lamda"), [["lamda"]])
+
+    def test_fuzzy_search_finds_the_corrected_word(self):
+        db = self.database()
+        page = asyncio.run(db.search_conversations_page("lamda", 50, "fuzzy"))
+        self.assertEqual(page['expansions'], {"lamda": ["lambda"]})
+        self.assertEqual(sorted(result['id'] for result in page['results']), sorted(f"c{i}" for i in range(12)))
+        self.assertEqual(asyncio.run(db.search_conversations("lamda", 50, "ranked")), [])
+
+
+class IndexedResultsTest(HistoryTestCase):
+
+    def _assert_same_results(self):
+        indexed, direct = self.database(), self.database(indexed=False)
+        for call in (lambda db: db.list_conversations(10),
+                     lambda db: db.search_conversations("the", 10),
+                     lambda db: db.search_conversations("LAMBDA", 10),
+                     lambda db: db.get_conversation_messages("c1")):
+            self.assertEqual(asyncio.run(call(indexed)), asyncio.run(call(direct)))
+
+    def test_index_answers_like_the_direct_scan_across_resyncs(self):
+        for i in range(4):
+            self.write(f"/home/u/proj{i}", conversation(f"c{i}", f"deploy the lambda {i}", "use cloudformation",
+                                                        timestamp=f"2025-03-0{i + 1}T10:00:00Z"))
+        self.write("/home/u/tools", tool_conversation("c-tool"))
+        self._assert_same_results()
+
+        self.write("/home/u/proj1", conversation("c1", "rename the Lambda", "done, the lambda is renamed"))
+        self.delete("/home/u/proj2")
+        self.write("/home/u/proj9", conversation("c9", "what is the plan", "ship the lambda"))
+        self._assert_same_results()
+
+
+if __name__ == "__main__":
+    unittest.main()
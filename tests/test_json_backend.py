@@ -0,0 +1,28 @@
+import io
+import os
+import unittest
+from unittest import mock
+
+from q_history_mcp import json_backend
+
+
+class SelectBackendTest(unittest.TestCase):
+
+    def _select(self, forced):
+        with mock.patch.dict(os.environ, {"Q_HISTORY_JSON_BACKEND": forced}), \
+                mock.patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            return json_backend._select_backend(), stderr.getvalue()
+
+    def test_unusable_backend_falls_back_to_the_stdlib(self):
+        with mock.patch.dict(json_backend._FACTORIES, {"orjson": mock.Mock(side_effect=ImportError("no orjson"))}):
+            for forced in ("orjson", "simdjson"):
+                backend, warning = self._select(forced)
+                self.assertEqual(backend, "json")
+                self.assertIn(forced, warning)
+
+    def test_usable_backend_is_kept(self):
+        self.assertEqual(self._select("json"), ("json", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
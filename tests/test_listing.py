@@ -0,0 +1,82 @@
+import json
+import sqlite3
+import unittest
+
+from q_history_mcp.database import _LISTING_SQL
+from q_history_mcp.models import parse_conversation
+from q_history_mcp.streaming import summarize_conversation
+
+# Both history shapes with the edge cases the counting rules cover
+CONVERSATIONS = [
+    {"conversation_id": "old", "context_manager": {"current_profile": "reviewer"}, "history": [
+        {"user": {"content": {"Prompt": {"prompt": "first question"}},
+                  "timestamp": "2024-05-01T08:00:00.123456789Z"},
+         "assistant": {"Response": {"message_id": "r1", "content": "first answer"}},
+         "request_metadata": {"request_start_timestamp_ms": 1714550400500,
+                              "stream_end_timestamp_ms": 1714550460000}},
+        {"user": {"content": {"ToolUseResults": {"tool_use_results": [
+            {"tool_use_id": "t1", "content": [{"Text": "out"}]}]}}},
+         "assistant": {"ToolUse": {"message_id": "r2", "tool_uses": [{"id": "t2", "name": "fs_read", "args": {}}]}}},
+        {"user": {"content": {"Prompt": {"prompt": ""}}}, "assistant": {"Response": {"content": ""}}},
+    ]},
+    {"conversation_id": "new", "history": [
+        [{"content": {"Prompt": {"prompt": ""}}, "timestamp": "2025-02-30T10:00:00Z"},
+         {"Response": {"content": "answer to an empty prompt"}}],
+        [{"content": {"CancelledToolUses": {"prompt": "try again", "tool_use_results": [{"tool_use_id": "x"}]}},
+          "timestamp": "2025-03-01T10:00:00+02:00"},
+         {"ToolUse": {"message_id": "m", "content": "calling", "tool_uses": []}}],
+        [{"content": {"ToolUseResults": {"tool_use_results": []}}, "timestamp": "2025-03-01T11:00:00"},
+         {"Response": {"content": "done [with {brackets}] \"quoted\""}}],
+        "junk", 7, None, [], {"neither": True},
+    ]},
+    {"conversation_id": "empty", "history": []},
+    {"history": [[{"content": {"Prompt": {"prompt": "no id here"}}}, {"Response": {"content": "ok"}}]]},
+    {"conversation_id": "no-history", "context_manager": {"current_profile": ""}},
+    {"conversation_id": "bad-types", "history": [
+        [{"content": {"Prompt": {"prompt": 5}}}, {"Response": {"content": 3}}],
+        [{"content": "text"}, {"ToolUse": "x"}]]},
+]
+
+
+class ListingSummaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE conversations (key TEXT PRIMARY KEY, value TEXT)")
+        for i, data in enumerate(CONVERSATIONS):
+            self.conn.execute("INSERT INTO conversations VALUES (?, ?)", (f"/home/u/proj{i}", json.dumps(data)))
+        self.conn.execute("INSERT INTO conversations VALUES ('/home/u/broken', '{\"history\": [')")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_sql_streaming_and_model_agree(self):
+        """The JSON1 listing SQL, the streaming summarizer and the parsed model give the same fields."""
+        listed = 0
+        for rowid, key, conversation_id, agent, summary in self.conn.execute(_LISTING_SQL):
+            value = self.conn.execute("SELECT value FROM conversations WHERE rowid = ?", (rowid,)).fetchone()[0]
+            from_sql = (conversation_id, agent or None) + tuple(json.loads(summary))
+
+            streamed = summarize_conversation(value)
+            from_stream = (streamed.conversation_id, streamed.agent, streamed.message_count, streamed.first_prompt,
+                           streamed.created_at, streamed.updated_at, streamed.user_count, streamed.tool_count)
+
+            data = json.loads(value)
+            parsed = parse_conversation(data, key)
+            counts = parsed.role_counts
+            from_model = (data.get('conversation_id'), parsed.agent, parsed.message_count, parsed.first_prompt,
+                          parsed.created_at, parsed.updated_at, counts['user'], counts['tool'])
+
+            self.assertEqual(from_sql, from_model, key)
+            self.assertEqual(from_stream, from_model, key)
+            listed += 1
+        # The row that is not valid JSON is left out
+        self.assertEqual(listed, len(CONVERSATIONS))
+
+    def test_invalid_json_is_rejected_by_the_summarizer(self):
+        with self.assertRaises(ValueError):
+            summarize_conversation('{"history": [')
+
+
+if __name__ == "__main__":
+    unittest.main()